@@ -0,0 +1,108 @@
+"""partition books_index by date
+
+Revision ID: 8f3b2c1d9a47
+Revises: 52223f807996
+Create Date: 2026-10-19 09:12:44.318207
+
+Recreates books_index range partitioned by `index_partition_key`, with BRIN
+indexes on the date columns. Rows indexed before the migration move to a
+`books_index_legacy` partition ending where the partition of the migration
+date starts, with the day before as their ingest date. With the `ingest_date`
+key the retention drops it like any other, with the `pub_date` key it holds every
+book published before that start for good and existing rows need such a pub_date.
+Later partitions are created by PartitionService, from that start on.
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+from config import settings as global_settings
+from services.partitions import partition_bounds, utc_today
+
+# revision identifiers, used by Alembic.
+revision: str = "8f3b2c1d9a47"
+down_revision: str | None = "52223f807996"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+COLUMNS = "isbn, pages, author, pub_date, pid, hash, parquet_id"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    key = global_settings.index_partition_key
+    start, _ = partition_bounds(utc_today(), global_settings.index_partition_interval)
+    op.rename_table("books_index", "books_index_unpartitioned")
+    op.execute("ALTER INDEX books_index_pkey RENAME TO books_index_unpartitioned_pkey")
+    op.create_table(
+        "books_index",
+        sa.Column("isbn", sa.Text(), nullable=False),
+        sa.Column("pages", sa.BigInteger(), nullable=True),
+        sa.Column("author", sa.Text(), nullable=True),
+        sa.Column("pub_date", sa.Date(), nullable=key != "pub_date"),
+        sa.Column(
+            "ingest_date",
+            sa.Date(),
+            server_default=sa.text("CURRENT_DATE"),
+            nullable=False,
+        ),
+        sa.Column("pid", sa.BigInteger(), nullable=True),
+        sa.Column("hash", sa.BigInteger(), nullable=False),
+        sa.Column("parquet_id", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["parquet_id"], ["parquet_index.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("hash", key),
+        postgresql_partition_by=f"RANGE ({key})",
+    )
+    op.create_index(
+        "ix_books_index_ingest_date_brin",
+        "books_index",
+        ["ingest_date"],
+        postgresql_using="brin",
+    )
+    op.create_index(
+        "ix_books_index_pub_date_brin",
+        "books_index",
+        ["pub_date"],
+        postgresql_using="brin",
+    )
+    op.execute(
+        "CREATE TABLE books_index_legacy PARTITION OF books_index "
+        f"FOR VALUES FROM (MINVALUE) TO ('{start.isoformat()}')"
+    )
+    op.execute(
+        f"INSERT INTO books_index ({COLUMNS}, ingest_date) "
+        f"SELECT {COLUMNS}, DATE '{start.isoformat()}' "
+        "- 1 FROM books_index_unpartitioned"
+    )
+    op.drop_table("books_index_unpartitioned")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table(
+        "books_index_unpartitioned",
+        sa.Column("isbn", sa.Text(), nullable=False),
+        sa.Column("pages", sa.BigInteger(), nullable=True),
+        sa.Column("author", sa.Text(), nullable=True),
+        sa.Column("pub_date", sa.Date(), nullable=True),
+        sa.Column("pid", sa.BigInteger(), nullable=True),
+        sa.Column("hash", sa.BigInteger(), nullable=False),
+        sa.Column("parquet_id", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["parquet_id"], ["parquet_index.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("hash", name="books_index_unpartitioned_pkey"),
+    )
+    # The same hash indexed on several days keeps its latest row
+    op.execute(
+        f"INSERT INTO books_index_unpartitioned ({COLUMNS}) "
+        f"SELECT DISTINCT ON (hash) {COLUMNS} FROM books_index "
+        "ORDER BY hash, ingest_date DESC"
+    )
+    op.drop_table("books_index")  # Drops the partitions and their indexes
+    op.rename_table("books_index_unpartitioned", "books_index")
+    op.execute("ALTER INDEX books_index_unpartitioned_pkey RENAME TO books_index_pkey")
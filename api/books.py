@@ -1,24 +1,54 @@
-import hashlib
+from __future__ import annotations
+
 import logging
 import os
 
-from fastapi import Request, APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
-
-from models.parquet import ParquetIndex
-from schemas.pydantic import BookSchema
-from schemas.polars import pl_book_schema
-import polars as pl
-from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.concurrency import run_in_threadpool
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic_extra_types.isbn import ISBN
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 
+from config import settings as global_settings
+from schemas.polars import book_hash
+from schemas.pydantic import BookDeletion, BookSchema, FanoutQuery, ShardRequest
+from services.admission import AdmissionRoute, AdmissionService, admission_control
+from services.bulk import (
+    arrow_batches,
+    ingest_batches,
+    ndjson_batches,
+    parquet_batches,
+    spool,
+)
+from services.cache import ObjectCache
+from services.changes import (
+    ARROW_STREAM_MEDIA_TYPE,
+    ChangeFeedService,
+    Cursor,
+    InvalidCursorError,
+)
+from services.coalescer import IngestCoalescer
+from services.compaction import CompactionService
+from services.compute import ComputeExecutor, build_frame, frame_from_ipc
+from services.datasets import Dataset, DatasetRegistry, get_dataset, read_rows
+from services.fanout import ARROW_MEDIA_TYPE, FanoutService
 from services.files import FilenameGeneratorService, get_filename_generator_service
-from services.s3 import S3Service
 from services.index import IndexService
-from services.database import DatabaseService
-from config import settings as global_settings
+from services.ingest import IngestService
+from services.latest import LatestViewService
+from services.manifest import DATASET_BUCKET, ManifestService
+from services.parquet import scan_books, scan_dataset, write_parquet
+from services.s3_async import S3AsyncService
+from services.search import SearchService
+from services.spill import SpillService
+from services.tombstones import TombstoneService
+from services.utlis import lazy_import
+
+pl = lazy_import("polars")
 
-router = APIRouter()
+router = APIRouter(route_class=AdmissionRoute)  # Sheds ingest before reading its body
+
+# Description files of /v1/save_parquet, kept out of the books catalog
+DESCRIPTIONS_PREFIX = "_descriptions"
 
 logger = logging.getLogger(__name__)
 
@@ -35,41 +65,20 @@ async def append_to_parquet_file(dataframe: pl.DataFrame, file_path: str):
         result_df = dataframe
         if os.path.exists(file_path):
             result_df = pl.concat([pl.read_parquet(file_path), dataframe])
-        result_df.write_parquet(file_path)
+        write_parquet(result_df, file_path)
         return True
     except Exception as e:
         logger.error(f"Error appending to Parquet file: {e}")
         return False
 
 
-def remove_daily_parquet_file(file_path: str) -> bool:
-    """
-    Removes a daily Parquet file from the filesystem.
-
-    Args:
-        file_path (str): Path to the Parquet file to be removed.
-
-    Returns:
-        bool: True if the file was successfully removed or didn't exist, False if removal failed.
-    """
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"Successfully removed Parquet file: {file_path}")
-            return True
-        else:
-            logger.info(f"Parquet file not found for removal: {file_path}")
-            return True
-    except Exception as e:
-        logger.error(f"Error removing Parquet file {file_path}: {e}")
-        return False
-
-
 @router.get(
     "/v1/current_stats",
     summary="Get current statistics about the DataFrame in the application state.",
 )
-async def get_statistics_about_frame(request: Request):
+async def get_statistics_about_frame(
+    request: Request, ingest: IngestService = Depends()
+):
     """
     Root endpoint to display a welcome message and information about the current DataFrame.
 
@@ -78,19 +87,147 @@ async def get_statistics_about_frame(request: Request):
     the 'key' column. If the DataFrame does not exist, it returns a message indicating that no
     DataFrame is defined yet.
 
+    Distinct ISBNs and authors are estimated from HyperLogLog sketches kept for the
+    buffer and stored in the file catalog, for this worker and for the current day.
+
     Args:
         request (Request): The FastAPI request object.
+        ingest (IngestService): The ingest service dependency.
 
     Returns:
-        dict: A dictionary containing a welcome message and DataFrame information if available.
+        dict: A welcome message, worker and day cardinality stats.
     """
+    _stats = await ingest.current_stats(request.app)
     try:
         dataframe = getattr(request.app, global_settings.dataframe_name)
         _s = dataframe.estimated_size(unit="mb")
         _c = dataframe.get_column("isbn").count()
-        return {"message": f"Welcome to Grizzly Rest API. {_s=} {_c=}"}
+        return {"message": f"Welcome to Grizzly Rest API. {_s=} {_c=}", **_stats}
     except AttributeError:
-        return {"message": "Welcome to Grizzly Rest API. No dataframe defined yet."}
+        return {
+            "message": "Welcome to Grizzly Rest API. No dataframe defined yet.",
+            **_stats,
+        }
+
+
+@router.get(
+    "/v1/compute_stats",
+    summary="Get queue depth and task latency of the compute executor.",
+)
+async def get_compute_stats(compute: ComputeExecutor = Depends()):
+    """
+    Endpoint to expose the state of the executor running CPU-bound Polars work.
+
+    Args:
+        compute (ComputeExecutor): The compute executor dependency.
+
+    Returns:
+        dict: Executor type, worker count, queue depth and task latency.
+    """
+    return compute.stats()
+
+
+@router.get(
+    "/v1/admission_stats",
+    summary="Get pending flushes, pending index writes and shed ingest requests.",
+)
+async def get_admission_stats(admission: AdmissionService = Depends()):
+    """
+    Endpoint to expose the admission control levels and how much ingest was shed.
+
+    Args:
+        admission (AdmissionService): The admission service dependency.
+
+    Returns:
+        dict: Pending flushes and index tasks, admitted and shed request counts.
+    """
+    return admission.stats()
+
+
+@router.get(
+    "/v1/coalescer_stats",
+    summary="Get how many ingest requests are appended per group.",
+)
+async def get_coalescer_stats(coalescer: IngestCoalescer = Depends()):
+    """
+    Endpoint to expose how well small ingest requests are being coalesced.
+
+    Args:
+        coalescer (IngestCoalescer): The ingest coalescer dependency.
+
+    Returns:
+        dict: Request, group and row counts with the average group size.
+    """
+    return coalescer.stats()
+
+
+@router.get(
+    "/v1/cache_stats",
+    summary="Get size and hit rate of the local object cache.",
+)
+async def get_cache_stats(cache: ObjectCache = Depends()):
+    """
+    Endpoint to expose the local memory-mapped cache of S3 objects.
+
+    Args:
+        cache (ObjectCache): The local object cache dependency.
+
+    Returns:
+        dict: Files and bytes on disk, hits, misses and evictions.
+    """
+    return await run_in_threadpool(cache.stats)
+
+
+@router.get(
+    "/v1/spill_stats",
+    summary="Get spilled buffer chunks and spill and reload counts.",
+)
+async def get_spill_stats(spill: SpillService = Depends()):
+    """
+    Endpoint to expose how much of the buffers this worker moved to local disk.
+
+    Args:
+        spill (SpillService): The spill service dependency.
+
+    Returns:
+        dict: Soft limits, resident memory, spill and reload counts and spilled chunks
+            per dataset.
+    """
+    return spill.stats()
+
+
+@router.get(
+    "/v1/dataset_stats",
+    summary="Get files, rows and bytes per day from the dataset catalog.",
+)
+async def get_dataset_stats(manifest: ManifestService = Depends()):
+    """
+    Endpoint to summarize the materialized dataset from the file
+    catalog, without listing S3.
+
+    Args:
+        manifest (ManifestService): The manifest service dependency.
+
+    Returns:
+        dict: Per day file count, rows, bytes, writer pids and pub_date range.
+    """
+    return {"days": await run_in_threadpool(manifest.summary)}
+
+
+@router.post("/v1/reconcile_catalog")
+async def reconcile_catalog(manifest: ManifestService = Depends()):
+    """
+    Endpoint to reconcile the file catalog with an S3 listing of the dataset bucket.
+
+    Args:
+        manifest (ManifestService): The manifest service dependency.
+
+    Returns:
+        dict: Registered and dropped paths.
+    """
+    return await run_in_threadpool(
+        manifest.reconcile, global_settings.compaction_min_age_seconds
+    )
 
 
 @router.get("/v1/filter_parquets")
@@ -98,7 +235,10 @@ async def filter_parquets(
     bucket: str,
     file_name: str,
     value: int,
-    s3: S3Service = Depends(),
+    s3: S3AsyncService = Depends(),
+    manifest: ManifestService = Depends(),
+    cache: ObjectCache = Depends(),
+    tombstones: TombstoneService = Depends(),
 ):
     """
     Endpoint to filter Parquet files in S3 based on a specific column and value.
@@ -108,29 +248,37 @@ async def filter_parquets(
         file_name (str): The Parquet file name to filter.
         column (str): The column to filter on.
         value (str): The value to filter for.
-        s3 (S3Service): The S3 service dependency.
+        s3 (S3AsyncService): The async S3 service dependency.
+        manifest (ManifestService): The manifest service dependency.
+        cache (ObjectCache): The local object cache dependency.
+        tombstones (TombstoneService): The tombstone service dependency.
 
     Returns:
         dict: Filtered data and metadata about the scan operation.
     """
-    path = "s3://daily/*.parquet"
-    # if not s3.parquet_file_exists(path):
-    #     return {"error": f"Parquet file '{file_name}' not found in bucket '{bucket}'"}
-
-    # Create a lazy query with filtering
-    lazy_df = pl.scan_parquet(
-        path,
-        storage_options=dict(
-            endpoint_url=s3.s3_url,
-            aws_access_key_id=s3.s3_key,
-            aws_secret_access_key=s3.s3_secret,
+    # Plan from the manifest instead of globbing, so compaction swaps are atomic for
+    # readers, and skip files whose catalog statistics cannot match
+    entries = await run_in_threadpool(
+        manifest.active_entries,
+        None,
+        pl.col("min_pages").is_null() | (pl.col("min_pages") < value),
+    )
+    if entries.is_empty():
+        return {"data": [], "metadata": {"row_count": 0, "columns": ["isbn", "pages"]}}
+
+    # Create a lazy query with filtering, over memory-mapped local copies when cached,
+    # hiding the rows deleted by tombstones
+    lazy_df = scan_books(
+        await run_in_threadpool(
+            cache.local_paths, entries.get_column("path").to_list()
         ),
-        allow_missing_columns=True,
+        storage_options=s3.storage_options,
+        deleted=await run_in_threadpool(tombstones.deleted_keys, entries),
     )
     filtered_df = (
         lazy_df.select("isbn", "pages")
         .filter(pl.col("pages") < value)
-        .collect(streaming=True)
+        .collect(engine="streaming")
     )
 
     row_count = filtered_df.height
@@ -144,90 +292,518 @@ async def filter_parquets(
     }
 
 
-@router.post("/v1/ingest_data")
+@router.post("/v1/fanout_query")
+async def fanout_query(query: FanoutQuery, fanout: FanoutService = Depends()):
+    """
+    Endpoint to run a filter or aggregate in parallel over shards of the dataset.
+
+    The files are split into shards that run in the local compute executor and on
+    the configured peer nodes. Aggregates are merged from partial aggregates per group.
+
+    Args:
+        query (FanoutQuery): The filter and optional grouping.
+        fanout (FanoutService): The fan-out coordinator dependency.
+
+    Returns:
+        dict: Merged rows or aggregates, and metadata about each shard.
+    """
+    return await fanout.query(query)
+
+
+@router.post("/v1/fanout_shard")
+async def fanout_shard(shard: ShardRequest, fanout: FanoutService = Depends()):
+    """
+    Endpoint to run one shard of a fan-out query on this node.
+
+    Args:
+        shard (ShardRequest): The files of the shard and the query to run.
+        fanout (FanoutService): The fan-out coordinator dependency.
+
+    Returns:
+        Response: The rows or partial aggregates as an Arrow IPC file.
+    """
+    try:
+        _res = await fanout.run_local(shard.paths, shard.query)
+    except FileNotFoundError as e:
+        # The coordinator's catalog is newer than the files, i.e. compaction purged them
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(content=_res, media_type=ARROW_MEDIA_TYPE)
+
+
+@router.get("/v1/search")
+async def search_books(
+    q: str,
+    limit: int = 10,
+    date: str | None = None,
+    search: SearchService = Depends(),
+):
+    """
+    Endpoint to find books whose description matches a text query, ranked by BM25.
+
+    Only the inverted index segments are read to rank, descriptions are not scanned.
+
+    Args:
+        q (str): The text query.
+        limit (int): Maximum number of books returned.
+        date (str | None): Restrict the search to one 'YYYYMMDD' partition.
+        search (SearchService): The search service dependency.
+
+    Returns:
+        dict: Ranked books with their score and corpus statistics.
+    """
+    return await run_in_threadpool(search.search, q, limit, date)
+
+
+@router.post("/v1/ingest_data", dependencies=[Depends(admission_control)])
 async def ingest_data_into_frame(
     data: list[BookSchema],
     request: Request,
-    index: IndexService = Depends(),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
-    s3: S3Service = Depends(),
-    filename_generator: FilenameGeneratorService = Depends(
-        get_filename_generator_service
-    ),
+    coalescer: IngestCoalescer = Depends(),
 ):
-    _pl_data_frame = pl.DataFrame(
-        [
-            {
-                "isbn": _d.isbn,
-                "description": _d.description,
-                "pages": _d.pages,
-                "author": _d.author,
-                "pub_date": _d.pub_date,
-                "pid": os.getpid(),
-                "hash": hash(_d.isbn + str(_d.pages) + _d.author),
-                # TODO: will be more deterministic ? "hash": hashlib.sha256((_d.isbn + str(_d.pages) + _d.author).encode()).hexdigest()
-            }
-            for _d in data
-        ]
-    )  # Convert input data to a Polars DataFrame
-    if not hasattr(request.app, global_settings.dataframe_name):
-        setattr(
+    try:
+        # Build, append and index together with concurrent requests,
+        # flush once past the dump size
+        _res = await coalescer.submit(
             request.app,
-            global_settings.dataframe_name,
-            pl.DataFrame(schema=pl_book_schema),
-        )  # Initialize DataFrame in app state if not present
-    getattr(request.app, global_settings.dataframe_name).extend(
-        _pl_data_frame
-    )  # Extend the existing DataFrame with new data
-
-    # TODO: using IndexService write _pl_data_frame as increment to observability table in relational database
-    # write index should catch dupes before writing to database
-    background_tasks.add_task(
-        index.swap_dataframe_to_sqlite,
-        dataframe=_pl_data_frame,
+            [
+                {
+                    "isbn": _d.isbn,
+                    "description": _d.description,
+                    "pages": _d.pages,
+                    "author": _d.author,
+                    "pub_date": _d.pub_date,
+                    "pid": os.getpid(),
+                    "hash": book_hash(_d.isbn + str(_d.pages) + _d.author),
+                }
+                for _d in data
+            ],
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if _res:
+        return {"message": _res}
+
+    return {"message": "Data frozen in ice cube"}  # Return a success message
+
+
+@router.post("/v1/books/upsert", dependencies=[Depends(admission_control)])
+async def upsert_books(
+    data: list[BookSchema],
+    request: Request,
+    ingest: IngestService = Depends(),
+    compute: ComputeExecutor = Depends(),
+):
+    """
+    Endpoint to replace books by ISBN without rewriting the files holding them.
+
+    The rows are written as a new file together with a tombstone of their ISBNs,
+    which hides the older rows of the same books on read until compaction drops them.
+
+    Args:
+        data (list[BookSchema]): The new book records.
+        request (Request): The FastAPI request object.
+        ingest (IngestService): The ingest service dependency.
+        compute (ComputeExecutor): The compute executor dependency.
+
+    Returns:
+        dict: The written file, its tombstone and the manifest version.
+    """
+    _df = frame_from_ipc(
+        await compute.run(
+            build_frame,
+            [
+                {
+                    **_d.model_dump(),
+                    "pid": os.getpid(),
+                    "hash": book_hash(_d.isbn + str(_d.pages) + _d.author),
+                }
+                for _d in data
+            ],
+        )
     )
+    return {"message": await ingest.upsert(request.app, _df)}
 
-    # TODO: do write parquet if this is last chunk of data for day
-    if (
-        getattr(request.app, global_settings.dataframe_name).estimated_size(unit="mb")
-        > global_settings.dataframe_dump_size
-    ):
-        _file = (
-            await filename_generator.generate_filename()
-        )  # Generate a filename for the dump
-
-        _res = s3.materialize_dataframe(
-            getattr(request.app, global_settings.dataframe_name), _file
-        )  # Materialize the DataFrame to S3, Make this function synchronous and blocking on IO.
-        # Other coroutines will naturally wait for it to complete.
-        if _res:
-            delattr(request.app, global_settings.dataframe_name)  # Clear the DataFrame
-            remove_daily_parquet_file(
-                f"daily_{str(os.getpid())}.parquet"
-            )  # delete the persistence file from the local filesystem
-            index.swap_dataframe_to_sqlite(pl.DataFrame(schema=pl_book_schema), if_table_exists="replace")
-            return {"message": _res}
 
-    return {"message": "Data frozen in ice cube"}  # Return a success message
+@router.post("/v1/books/delete")
+async def delete_books(
+    deletion: BookDeletion,
+    request: Request,
+    ingest: IngestService = Depends(),
+):
+    """
+    Endpoint to delete books by ISBN or hash with a tombstone.
+
+    A few kilobytes are written whatever the size of the files holding the books,
+    readers hide the rows and compaction drops them later.
+
+    Args:
+        deletion (BookDeletion): ISBNs and hashes to delete.
+        request (Request): The FastAPI request object.
+        ingest (IngestService): The ingest service dependency.
+
+    Returns:
+        dict: The tombstone path, key count and manifest version.
+    """
+    return {
+        "message": await ingest.delete(
+            request.app, [str(i) for i in deletion.isbns], deletion.hashes
+        )
+    }
+
+
+@router.get("/v1/books/latest")
+async def scan_latest_books(
+    start: str | None = None,
+    end: str | None = None,
+    after: str | None = None,
+    limit: int = 100,
+    latest: LatestViewService = Depends(),
+):
+    """
+    Endpoint to read the latest record of a range of books from the materialized view.
+
+    Args:
+        start (str | None): Inclusive lower bound of the ISBNs.
+        end (str | None): Exclusive upper bound of the ISBNs.
+        after (str | None): The `next` ISBN of the previous page.
+        limit (int): Maximum number of books returned.
+        latest (LatestViewService): The latest record view dependency.
+
+    Returns:
+        dict: The records in ISBN order, the ISBN to continue after and the
+            manifest version the view was built at.
+    """
+    _rows = await run_in_threadpool(latest.scan, start, end, after, limit)
+    return {
+        "data": _rows,
+        "next": _rows[-1]["isbn"] if len(_rows) == limit else None,
+        "metadata": {
+            "source_version": (await run_in_threadpool(latest.state)).source_version
+        },
+    }
+
+
+@router.get("/v1/books/latest/{isbn}")
+async def get_latest_book(isbn: ISBN, latest: LatestViewService = Depends()):
+    """
+    Endpoint to read the latest record of a book from the materialized view.
+
+    Only the one range file holding the ISBN is read.
+
+    Args:
+        isbn (ISBN): The ISBN-10 or ISBN-13 of the book.
+        latest (LatestViewService): The latest record view dependency.
+
+    Returns:
+        dict: The record with the manifest version it came from.
+
+    Raises:
+        HTTPException: If the view holds no record of the book.
+    """
+    _row = await run_in_threadpool(latest.get, str(isbn))
+    if _row is None:
+        raise HTTPException(status_code=404, detail=f"No record of ISBN {isbn}")
+    return {"data": _row}
+
+
+@router.post("/v1/books/latest/rebuild")
+async def rebuild_latest_books(latest: LatestViewService = Depends()):
+    """
+    Endpoint to rebuild the latest record view from the active files of the dataset.
+
+    Args:
+        latest (LatestViewService): The latest record view dependency.
+
+    Returns:
+        dict: The view state and manifest versions and the ranges written.
+    """
+    return await run_in_threadpool(latest.rebuild)
+
+
+@router.get(
+    "/v1/latest_view_stats",
+    summary="Get ranges, rows and lag of the latest record per ISBN view.",
+)
+async def get_latest_view_stats(latest: LatestViewService = Depends()):
+    """
+    Endpoint to report the size of the latest record view and the
+    manifest version it was built at.
+
+    Args:
+        latest (LatestViewService): The latest record view dependency.
+
+    Returns:
+        dict: View and manifest versions, ranges, rows and bytes.
+    """
+    return await run_in_threadpool(latest.stats)
+
+
+@router.post("/v1/ingest_ndjson", dependencies=[Depends(admission_control)])
+async def ingest_ndjson_into_frame(
+    request: Request,
+    ingest: IngestService = Depends(),
+):
+    """
+    Endpoint to bulk ingest books sent as newline delimited JSON.
+
+    The body is parsed while it streams in, `bulk_ingest_batch_rows` lines at a time.
+    Rows failing validation are counted and skipped.
+
+    Args:
+        request (Request): The FastAPI request object.
+        ingest (IngestService): The ingest service dependency.
+
+    Returns:
+        dict: Accepted and rejected row counts and the flushes the upload triggered.
+    """
+    try:
+        return await ingest_batches(
+            request.app,
+            ndjson_batches(request.stream(), global_settings.bulk_ingest_batch_rows),
+            ingest,
+        )
+    except (ValueError, pl.exceptions.PolarsError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.post("/v1/ingest_arrow", dependencies=[Depends(admission_control)])
+async def ingest_arrow_into_frame(
+    request: Request,
+    ingest: IngestService = Depends(),
+):
+    """
+    Endpoint to bulk ingest books sent as an Arrow IPC stream.
+
+    Args:
+        request (Request): The FastAPI request object.
+        ingest (IngestService): The ingest service dependency.
+
+    Returns:
+        dict: Accepted and rejected row counts and the flushes the upload triggered.
+    """
+    with await spool(request.stream()) as _file:
+        try:
+            return await ingest_batches(
+                request.app,
+                iterate_in_threadpool(
+                    arrow_batches(_file, global_settings.bulk_ingest_batch_rows)
+                ),
+                ingest,
+            )
+        except (ValueError, pl.exceptions.PolarsError) as e:
+            # pyarrow.ArrowInvalid derives from ValueError
+            raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.post("/v1/ingest_parquet", dependencies=[Depends(admission_control)])
+async def ingest_parquet_into_frame(
+    request: Request,
+    ingest: IngestService = Depends(),
+):
+    """
+    Endpoint to bulk ingest books sent as a Parquet file.
+
+    Args:
+        request (Request): The FastAPI request object.
+        ingest (IngestService): The ingest service dependency.
+
+    Returns:
+        dict: Accepted and rejected row counts and the flushes the upload triggered.
+    """
+    with await spool(request.stream()) as _file:
+        try:
+            return await ingest_batches(
+                request.app,
+                iterate_in_threadpool(
+                    parquet_batches(_file, global_settings.bulk_ingest_batch_rows)
+                ),
+                ingest,
+            )
+        except (ValueError, pl.exceptions.PolarsError) as e:
+            # pyarrow.ArrowInvalid derives from ValueError
+            raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/v1/datasets")
+async def list_datasets(request: Request, registry: DatasetRegistry = Depends()):
+    """
+    Endpoint to list the registered datasets with their buffers and
+    share of the memory budget.
+
+    Args:
+        request (Request): The FastAPI request object.
+        registry (DatasetRegistry): The dataset registry dependency.
+
+    Returns:
+        dict: The memory budget and, per dataset, schema, buffer size, dump size and
+            fair share.
+    """
+    return registry.stats(request.app)
+
+
+@router.post("/v1/datasets/{name}/ingest", dependencies=[Depends(admission_control)])
+async def ingest_into_dataset(
+    request: Request,
+    dataset: Dataset = Depends(get_dataset),
+    ingest: IngestService = Depends(),
+):
+    """
+    Endpoint to append newline-delimited JSON rows to the buffer of a named dataset.
+
+    Args:
+        request (Request): The FastAPI request object with the NDJSON body.
+        dataset (Dataset): The dataset named in the path.
+        ingest (IngestService): The ingest service dependency.
+
+    Returns:
+        dict: The dataset, the rows appended and the flush result if the append
+            triggered one.
+    """
+    if dataset.is_books:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                "Books are validated and ingested through "
+                "/v1/ingest_data and /v1/ingest_ndjson"
+            ),
+        )
+    try:
+        _df = await run_in_threadpool(read_rows, await request.body(), dataset.schema)
+    except (ValueError, pl.exceptions.PolarsError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    _res = await ingest.append(request.app, _df, dataset=dataset)
+    return {"dataset": dataset.name, "rows": _df.height, "flushed": _res}
+
+
+@router.post("/v1/datasets/{name}/flush")
+async def flush_dataset(
+    request: Request,
+    dataset: Dataset = Depends(get_dataset),
+    ingest: IngestService = Depends(),
+):
+    """
+    Endpoint to materialize the buffer of a named dataset to S3.
+
+    Args:
+        request (Request): The FastAPI request object.
+        dataset (Dataset): The dataset named in the path.
+        ingest (IngestService): The ingest service dependency.
+
+    Returns:
+        dict: The materialization result, None if the buffer was empty.
+    """
+    return {"message": await ingest.flush(request.app, dataset=dataset)}
+
+
+@router.get("/v1/datasets/{name}/changes")
+async def stream_dataset_changes(
+    cursor: str | None = None,
+    since: str | None = None,
+    max_files: int | None = None,
+    dataset: Dataset = Depends(get_dataset),
+    changes: ChangeFeedService = Depends(),
+):
+    """
+    Endpoint to stream the rows of a named dataset flushed since a cursor, as Arrow IPC.
+
+    Call it again with the `X-Next-Cursor` header of the response to get the
+    rows flushed since, without listing the bucket or re-reading files.
+
+    Args:
+        cursor (str | None): Cursor of the previous call, omitted to start from the
+            beginning.
+        since (str | None): Skip 'YYYYMMDD' partitions before this date.
+        max_files (int | None): Files to stream at most, the next call continues.
+        dataset (Dataset): The dataset named in the path.
+        changes (ChangeFeedService): The change feed service dependency.
+
+    Returns:
+        StreamingResponse: An Arrow IPC stream with the cursor and counts in headers.
+
+    Raises:
+        HTTPException: 400 if the cursor is invalid.
+    """
+    try:
+        _cursor = Cursor.decode(cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    entries, _next = await run_in_threadpool(
+        changes.plan, dataset, _cursor, since, max_files
+    )
+    return StreamingResponse(
+        changes.stream(dataset, entries.get_column("path").to_list()),
+        media_type=ARROW_STREAM_MEDIA_TYPE,
+        headers={
+            "X-Next-Cursor": _next.encode(),
+            "X-Change-Files": str(entries.height),
+            "X-Change-Rows": str(entries.get_column("rows").sum()),
+        },
+    )
+
+
+@router.get("/v1/datasets/{name}/query")
+async def query_dataset(
+    date: str | None = None,
+    limit: int = 100,
+    dataset: Dataset = Depends(get_dataset),
+    s3: S3AsyncService = Depends(),
+    manifest: ManifestService = Depends(),
+    cache: ObjectCache = Depends(),
+):
+    """
+    Endpoint to read rows of a named dataset from the files published in the catalog.
+
+    Args:
+        date (str | None): Restrict the query to one 'YYYYMMDD' partition.
+        limit (int): Maximum number of rows returned.
+        dataset (Dataset): The dataset named in the path.
+        s3 (S3AsyncService): The async S3 service dependency.
+        manifest (ManifestService): The manifest service dependency.
+        cache (ObjectCache): The local object cache dependency.
+
+    Returns:
+        dict: The rows and metadata about the scan.
+    """
+    paths = await run_in_threadpool(manifest.active_files, date, None, dataset.name)
+    if not paths:
+        return {"data": [], "metadata": {"row_count": 0, "files": 0}}
+    _df = await run_in_threadpool(
+        lambda: (
+            scan_dataset(cache.local_paths(paths), dataset.schema, s3.storage_options)
+            .head(limit)
+            .collect()
+        )
+    )
+    return {
+        "data": _df.to_dicts(),
+        "metadata": {
+            "row_count": _df.height,
+            "files": len(paths),
+            "columns": _df.columns,
+        },
+    }
 
 
 @router.post("/v1/save_parquet")
 async def materialize_data_in_parquet_file(
     request: Request,
-    s3: S3Service = Depends(),
+    ingest: IngestService = Depends(),
     filename_generator: FilenameGeneratorService = Depends(
         get_filename_generator_service
     ),
-    db_session: AsyncSession = Depends(DatabaseService().get_db),
 ):
     """
-    Endpoint to materialize the iced data stored in the application state to S3.
+    Endpoint to materialize the descriptions of the iced data stored in
+    the application state to S3.
+
+    The descriptions and hashes go to a file under `DESCRIPTIONS_PREFIX`, outside the
+    books dataset and its manifest, so scans and compaction never see them. The buffer
+    is left in place and its books are published by the next flush.
 
     Args:
         request (Request): The FastAPI request object.
-        s3 (S3Service): The S3 service dependency.
+        ingest (IngestService): The ingest service dependency.
         filename_generator (FilenameGeneratorService): The filename generator service dependency.
-        db_session (DatabaseService): The database service dependency.
 
     Returns:
         dict: A message indicating the result of the materialization process.
@@ -235,98 +811,103 @@ async def materialize_data_in_parquet_file(
     _file = (
         await filename_generator.generate_filename()
     )  # Generate a filename for the dump
-    _df: pl.DataFrame = getattr(request.app, global_settings.dataframe_name)
+    _df: pl.DataFrame = ingest.buffered(request.app)  # Spilled chunks are memory-mapped
 
     _df_to_parquet = _df.select(["description", "hash"])
 
-    _res = s3.materialize_dataframe(
-        _df_to_parquet, _file
-    )  # Materialize the DataFrame to S3
+    _res = await ingest.s3.materialize_dataframe(
+        _df_to_parquet, f"{DESCRIPTIONS_PREFIX}/{_file}"
+    )  # Materialize the DataFrame to S3, next to the dataset but not published in it
 
-    _parquet_path_id = hash(_res["path"])
-
-    # _parquet_index = ParquetIndex(id=_parquet_path_id, s3_url=_res["path"])
-    # _res_db = await _parquet_index.save(db_session)
     # TODO: check how it looks in memory and if address alloc by _df is the same as request.app.your_books_data
     # TODO: drop all dfs which are already saved in s3 and sql
 
     _index: IndexService = IndexService()
-    _index_res = _index.write_index(dataframe=_df, parquet_path_id=_parquet_path_id)
+    _index_res = await run_in_threadpool(
+        _index.write_index,
+        dataframe=_df,
+        parquet_url=f"s3://{DATASET_BUCKET}/{_res['path']}",
+    )  # Registers the file in parquet_index first when the index is partitioned
 
     return {
         "message": _res,
-        # "database": _res_db,
         "books_added_to_index": _index_res,
     }  # Return the result message
 
 
 @router.post("/v1/merge_parquet_files")
-def merge_parquet_files(
-    s3: S3Service = Depends(),
+async def merge_parquet_files(
+    compaction: CompactionService = Depends(),
 ):
     """
-    Endpoint to merge Parquet files stored in the specified S3 bucket.
+    Endpoint to merge all Parquet files of the dataset, per
+    day, into target-sized files.
+
+    The merged files replace their inputs in one manifest commit, so readers never
+    observe a gap. Replaced files are deleted once the retention window passes.
 
     Args:
-        s3 (S3Service): The S3 service dependency.
+        compaction (CompactionService): The compaction service dependency.
 
     Returns:
         dict: A message indicating the result of the merge operation.
     """
-    # try to remove daily.parquet if exists
-    if s3.parquet_file_exists("daily/daily.parquet"):
-        s3.delete_parquet_file("daily/daily.parquet")
-    _df = s3.merge_parquet_files(
-        "daily"
-    )  # Merge Parquet files in the "daily" bucket into a single DataFrame
-    _res = s3.materialize_dataframe(
-        _df, "daily.parquet"
-    )  # Materialize the DataFrame to S3
+    _res = await run_in_threadpool(compaction.run_once, True)
     return {"message": _res}  # Return the result message
 
 
 @router.get("/v1/list_buckets")
-def list_buckets(s3: S3Service = Depends()):
+async def list_buckets(s3: S3AsyncService = Depends()):
     """
     Endpoint to list all available buckets in the S3 storage.
 
     Args:
-        s3 (S3Service): The S3 service dependency.
+        s3 (S3AsyncService): The async S3 service dependency.
 
     Returns:
         dict: A dictionary containing the list of bucket names.
     """
-    buckets = s3.list_buckets()
+    buckets = await s3.list_buckets()
     return {"buckets": buckets}
 
 
 @router.post("/v1/create_bucket/{bucket_name}")
-def create_bucket(bucket_name: str, s3: S3Service = Depends()):
+async def create_bucket(bucket_name: str, s3: S3AsyncService = Depends()):
     """
     Endpoint to create a new bucket in the S3 storage.
 
     Args:
         bucket_name (str): The name of the bucket to be created.
-        s3 (S3Service): The S3 service dependency.
+        s3 (S3AsyncService): The async S3 service dependency.
 
     Returns:
         dict: A dictionary containing the status and bucket name.
     """
-    result = s3.create_bucket(bucket_name)
+    result = await s3.create_bucket(bucket_name)
     return result
 
 
 @router.get("/v1/list_files/{bucket_name}")
-def list_files(bucket_name: str, s3: S3Service = Depends()):
+async def list_files(
+    bucket_name: str,
+    s3: S3AsyncService = Depends(),
+    manifest: ManifestService = Depends(),
+):
     """
     Endpoint to list all files in a specific S3 bucket.
 
+    The dataset bucket is answered from the file catalog, other
+    buckets are listed in S3.
+
     Args:
         bucket_name (str): The name of the bucket.
-        s3 (S3Service): The S3 service dependency.
+        s3 (S3AsyncService): The async S3 service dependency.
+        manifest (ManifestService): The manifest service dependency.
 
     Returns:
         dict: A dictionary containing the list of file paths.
     """
-    files = s3.list_files(bucket_name)
+    if bucket_name == DATASET_BUCKET:
+        return {"files": await run_in_threadpool(manifest.active_files)}
+    files = await s3.list_files(bucket_name)
     return {"files": files}
@@ -0,0 +1,67 @@
+"""
+Synthetic book frames shared by the benchmark scripts.
+"""
+
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+
+from schemas.polars import wide_book_schema
+
+
+def synthetic_books(rows: int, authors: int = 2_000, seed: int = 42) -> pl.DataFrame:
+    """
+    Build a frame shaped like ingested books with a realistic author repetition.
+
+    Args:
+        rows (int): Number of rows to generate.
+        authors (int): Number of distinct authors.
+        seed (int): Random seed.
+
+    Returns:
+        pl.DataFrame: A frame matching `wide_book_schema()`.
+    """
+    rng = np.random.default_rng(seed)
+    isbn = rng.integers(9_780_000_000_000, 9_799_999_999_999, rows)
+    words = np.array(
+        [
+            "an",
+            "illustrated",
+            "guide",
+            "to",
+            "programming",
+            "data",
+            "polars",
+            "parquet",
+            "bear",
+            "river",
+            "forest",
+            "story",
+            "history",
+            "of",
+            "the",
+            "world",
+            "with",
+            "notes",
+            "and",
+            "maps",
+        ]
+    )
+    description = [" ".join(rng.choice(words, 12)) for _ in range(rows)]
+    return pl.DataFrame(
+        {
+            "isbn": isbn.astype(str),
+            "description": description,
+            "pages": rng.integers(20, 1_500, rows),
+            "author": [f"Author {a}" for a in rng.integers(0, authors, rows)],
+            "pub_date": [
+                date(1990, 1, 1) + timedelta(days=int(d))
+                for d in rng.integers(0, 12_000, rows)
+            ],
+            "pid": np.full(rows, os.getpid()),
+            "hash": rng.integers(-(2**63), 2**63 - 1, rows, dtype=np.int64),
+        },
+        schema=wide_book_schema(),
+    )
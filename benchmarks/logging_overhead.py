@@ -0,0 +1,160 @@
+"""
+Compare the per-request cost of logging under each logging config.
+
+A request is simulated as one Granian access record, one application record
+and a few SQLAlchemy statement records, as logged with `database_echo`. The
+time spent in the logging calls is what the request thread pays. Output goes to
+/dev/null through a sink that counts lines and can add a blocking latency to
+each write, like stderr piped to a log collector.
+
+Modes:
+    rich                Rich console handlers of logging-granian-dev.json
+    json-sync           JSON lines formatted and written in the request thread
+    json-queue          logging-granian.json without the rate limit
+    json-queue-limited  logging-granian.json as shipped
+
+Usage:
+    uv run python -m benchmarks.logging_overhead --requests 20000
+    --sql 4 --write-latency-us 20
+"""
+
+import argparse
+import copy
+import json
+import logging
+import logging.config
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from services.logs import stop_listeners
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class CountingSink:
+    """
+    A text stream writing to /dev/null that counts the lines written.
+
+    Every flush can block for a fixed latency, like stderr piped to a busy log
+    collector. The sleep releases the GIL, as a blocking write does.
+    """
+
+    def __init__(self, latency_us: float = 0):
+        self.lines = 0
+        self.latency = latency_us / 1e6
+        self.file = open(os.devnull, "w")  # noqa: SIM115
+
+    def write(self, text: str) -> int:
+        self.lines += text.count("\n")
+        return self.file.write(text)
+
+    def flush(self) -> None:
+        self.file.flush()
+        if self.latency:
+            time.sleep(self.latency)
+
+    def isatty(self) -> bool:
+        return False
+
+
+def load(name: str) -> dict:
+    return json.loads((ROOT / name).read_text())
+
+
+def configs() -> dict[str, dict]:
+    prod = load("logging-granian.json")
+    unlimited = copy.deepcopy(prod)
+    unlimited["handlers"]["queue"].pop("filters")
+    sync = copy.deepcopy(unlimited)
+    sync["handlers"].pop("queue")
+    for logger in [sync["root"], *sync["loggers"].values()]:
+        logger["handlers"] = ["stream"]
+    return {
+        "rich": load("logging-granian-dev.json"),
+        "json-sync": sync,
+        "json-queue": unlimited,
+        "json-queue-limited": prod,
+    }
+
+
+def run(config: dict, requests: int, sql: int, latency_us: float) -> dict:
+    sink = CountingSink(latency_us)
+    sys.stderr = sink
+    logging.config.dictConfig(config)
+    # database_echo sets the engine logger to INFO
+    logging.getLogger("sqlalchemy.engine.Engine").setLevel(logging.INFO)
+    access = logging.getLogger("granian.access")
+    app = logging.getLogger("api.books")
+    engine = logging.getLogger("sqlalchemy.engine.Engine")
+
+    costs = []
+    started = time.perf_counter()
+    for i in range(requests):
+        t0 = time.perf_counter()
+        app.info(f"Appended {i} rows to the buffer")
+        for _ in range(sql):
+            engine.info("SELECT books_index1.isbn FROM books_index1 WHERE pid = %s", i)
+        access.info(
+            '%(addr)s - "%(method)s %(path)s" %(status)d %(dt_ms).3f',
+            {
+                "addr": "127.0.0.1",
+                "method": "POST",
+                "path": "/grizzly/v1/ingest_data",
+                "status": 200,
+                "dt_ms": 1.25,
+            },
+        )
+        costs.append(time.perf_counter() - t0)
+    caller = time.perf_counter() - started
+    stop_listeners()  # Drain the queue
+    total = time.perf_counter() - started
+    sys.stderr = sys.__stderr__
+    sink.file.close()
+    logging.config.dictConfig({"version": 1, "disable_existing_loggers": False})
+    costs.sort()
+    return {
+        "mean_us": statistics.fmean(costs) * 1e6,
+        "p50_us": costs[len(costs) // 2] * 1e6,
+        "p99_us": costs[int(len(costs) * 0.99)] * 1e6,
+        "caller_s": caller,
+        "drained_s": total,
+        "lines": sink.lines,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--sql", type=int, default=4, help="SQL records per request")
+    parser.add_argument(
+        "--write-latency-us",
+        type=float,
+        default=20,
+        help="Blocking time of each stderr flush",
+    )
+    parser.add_argument("--modes", nargs="*", default=None)
+    args = parser.parse_args()
+
+    print(
+        f"requests={args.requests} records/request={args.sql + 2} "
+        f"write latency={args.write_latency_us:.0f} us"
+    )
+    print(
+        f"{'mode':<20} {'mean us':>8} {'p50 us':>8} {'p99 us':>8} "
+        f"{'caller s':>9} {'drained s':>10} {'lines':>8}"
+    )
+    for mode, config in configs().items():
+        if args.modes and mode not in args.modes:
+            continue
+        r = run(config, args.requests, args.sql, args.write_latency_us)
+        print(
+            f"{mode:<20} {r['mean_us']:>8.1f} {r['p50_us']:>8.1f} {r['p99_us']:>8.1f} "
+            f"{r['caller_s']:>9.2f} {r['drained_s']:>10.2f} {r['lines']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Compare put, get, range-get and list throughput of the object store backends.
+
+Every backend writes the same objects under its own prefix of the bucket, reads
+them back whole and in small ranges, as Parquet footer and row group reads do,
+and lists them. Calls run concurrently over the async API the routes use. The
+s3 backends need the S3 endpoint of the settings, obstore must be installed.
+
+Usage:
+    uv run python -m benchmarks.object_store --objects 32 --size-mb 4
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import time
+from uuid import uuid4
+
+from services.storage import BACKENDS, storage_backend
+
+
+async def _timed(calls: list, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(call):
+        async with semaphore:
+            await call
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(call) for call in calls))
+    return time.perf_counter() - started
+
+
+async def bench(name: str, args: argparse.Namespace, data: bytes) -> dict:
+    backend = storage_backend(name)
+    with contextlib.suppress(Exception):
+        # obstore cannot create buckets, the s3fs run does
+        await asyncio.to_thread(backend.mkdir, args.bucket)
+    await backend.start()
+    prefix = f"{args.bucket}/{name}_{uuid4().hex}"
+    paths = [f"{prefix}/object_{i:05}.bin" for i in range(args.objects)]
+    size = len(data)
+    ranges = [
+        (path, offset, offset + args.range_kb * 1024)
+        for path in paths
+        for offset in random.sample(range(size - args.range_kb * 1024), args.ranges)
+    ]
+    try:
+        put = await _timed(
+            [backend.put_async(p, data) for p in paths], args.concurrency
+        )
+        get = await _timed([backend.get_async(p) for p in paths], args.concurrency)
+        ranged = await _timed(
+            [backend.get_range_async(*r) for r in ranges], args.concurrency
+        )
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            listed = await asyncio.to_thread(backend.find, prefix)
+        listing = (time.perf_counter() - started) / args.repeat
+        assert len(listed) == args.objects, f"{name} listed {len(listed)} objects"
+    finally:
+        await asyncio.gather(
+            *(backend.delete_async(p) for p in paths), return_exceptions=True
+        )
+        await backend.close()
+    total_mb = args.objects * size / 1024**2
+    return {
+        "put MB/s": total_mb / put,
+        "get MB/s": total_mb / get,
+        "range/s": len(ranges) / ranged,
+        "list ms": listing * 1000,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    data = os.urandom(int(args.size_mb * 1024**2))
+    print(
+        f"objects={args.objects} size={args.size_mb}MB "
+        f"ranges={args.ranges}x{args.range_kb}KB "
+        f"concurrency={args.concurrency}"
+    )
+    print(
+        f"{'backend':<9} {'put MB/s':>9} {'get MB/s':>9} {'range/s':>9} {'list ms':>9}"
+    )
+    for name in args.backends:
+        try:
+            result = await bench(name, args, data)
+        except ImportError as e:
+            print(f"{name:<9} skipped: {e}")
+            continue
+        print(f"{name:<9} " + " ".join(f"{v:>9.1f}" for v in result.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS)
+    )
+    parser.add_argument("--bucket", default="benchmark")
+    parser.add_argument("--objects", type=int, default=32)
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--ranges", type=int, default=8, help="Range reads per object")
+    parser.add_argument("--range-kb", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=5, help="Listings of the prefix")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
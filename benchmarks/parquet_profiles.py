@@ -0,0 +1,51 @@
+"""
+Compare Parquet write profiles by file size, encode time and scan time.
+
+Usage:
+    uv run python -m benchmarks.parquet_profiles --rows 500000
+"""
+
+import argparse
+import io
+import time
+
+import polars as pl
+
+from benchmarks.data import synthetic_books
+from config import settings as global_settings
+from services.parquet import write_parquet
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dataframe = synthetic_books(args.rows)
+    print(f"rows={args.rows} in-memory={dataframe.estimated_size('mb'):.1f}MB")
+    print(f"{'profile':<10} {'size MB':>9} {'encode ms':>10} {'scan ms':>9}")
+    for name, profile in global_settings.parquet_profiles.items():
+        encode, scan = [], []
+        for _ in range(args.repeat):
+            buffer = io.BytesIO()
+            started = time.perf_counter()
+            write_parquet(dataframe, buffer, profile)
+            encode.append(time.perf_counter() - started)
+
+            buffer.seek(0)
+            started = time.perf_counter()
+            pl.scan_parquet(buffer).filter(
+                pl.col("pub_date").is_between(
+                    pl.date(2000, 1, 1), pl.date(2000, 12, 31)
+                )
+            ).select("isbn", "pages").collect()
+            scan.append(time.perf_counter() - started)
+        print(
+            f"{name:<10} {buffer.getbuffer().nbytes / 1024**2:>9.2f} "
+            f"{min(encode) * 1000:>10.1f} {min(scan) * 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
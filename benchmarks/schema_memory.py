@@ -0,0 +1,41 @@
+"""
+Compare memory per row of the wide and compact book schemas.
+
+Usage:
+    uv run python -m benchmarks.schema_memory --rows 500000
+"""
+
+import argparse
+
+from benchmarks.data import synthetic_books
+from config import settings as global_settings
+from schemas.polars import to_book_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--authors", type=int, default=2_000)
+    args = parser.parse_args()
+
+    wide = synthetic_books(args.rows, authors=args.authors)
+    compact = to_book_schema(wide, compact=True)
+    dump_bytes = global_settings.dataframe_dump_size * 1024**2
+    print(f"rows={args.rows} authors={args.authors}")
+    print(f"{'schema':<8} {'total MB':>9} {'bytes/row':>10} {'rows per dump':>14}")
+    for name, frame in (("wide", wide), ("compact", compact)):
+        per_row = frame.estimated_size() / frame.height
+        print(
+            f"{name:<8} {frame.estimated_size('mb'):>9.2f} {per_row:>10.1f} "
+            f"{int(dump_bytes // per_row):>14}"
+        )
+    print("per column bytes/row:")
+    for column in wide.columns:
+        print(
+            f"  {column:<12} {wide[column].estimated_size() / wide.height:>7.1f} -> "
+            f"{compact[column].estimated_size() / compact.height:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure the cold-start import of the application and fail when it regresses.
+
+Every run imports `main` in a fresh interpreter with `-X importtime`, the way a
+Granian worker does on spawn. The report lists the slowest top-level packages.
+The check fails if a module kept lazy is imported at startup, or if the median
+import time exceeds the budget. Modules bound with `lazy_import` are registered
+at startup but only count as imported once they run, which the report shows.
+
+Usage:
+    uv run python -m benchmarks.startup --runs 5 --budget-ms 1500
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+# Imported on first use, in lifespan or in the routes that need them
+LAZY_MODULES = (
+    "polars",
+    "pyarrow",
+    "numpy",
+    "s3fs",
+    "aiobotocore",
+    "sqlalchemy",
+    "asyncpg",
+    "polyfactory",
+    "faker",
+    "rich",
+    "httpx",
+)
+
+
+def import_once() -> tuple[float, Counter, set[str]]:
+    """
+    Import `main` in a fresh interpreter.
+
+    Returns:
+        tuple[float, Counter, set[str]]: Wall time in ms, self time in ms per
+            top-level package, and the top-level packages imported.
+    """
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parents[1],
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    packages = Counter()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line.removeprefix("import time:").split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+    return wall_ms, packages, set(packages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    import_once()  # Warm the filesystem cache and bytecode
+    runs = [import_once() for _ in range(args.runs)]
+    wall = statistics.median(r[0] for r in runs)
+    packages = sum((r[1] for r in runs), Counter())
+    loaded = set.union(*(r[2] for r in runs))
+
+    print(f"runs={args.runs} median wall={wall:.0f} ms budget={args.budget_ms:.0f} ms")
+    print(f"{'package':<24} {'self ms':>8}")
+    for name, total in packages.most_common(args.top):
+        print(f"{name:<24} {total / args.runs:>8.1f}")
+
+    failures = [
+        f"{name} is imported at startup" for name in LAZY_MODULES if name in loaded
+    ]
+    if wall > args.budget_ms:
+        failures.append(
+            f"median import time {wall:.0f} ms exceeds {args.budget_ms:.0f} ms"
+        )
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
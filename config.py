@@ -1,6 +1,7 @@
 import os
+from typing import Literal
 
-from pydantic import BaseModel, AnyHttpUrl, Field, PostgresDsn, computed_field
+from pydantic import AnyHttpUrl, BaseModel, Field, PostgresDsn, computed_field
 from pydantic_core._pydantic_core import MultiHostUrl
 from pydantic_settings import BaseSettings
 
@@ -13,6 +14,47 @@ class S3Credentials(BaseModel):
     secret: str = Field(default_factory=lambda: os.getenv("S3_SECRET", "minio123"))
 
 
+class ParquetWriteProfile(BaseModel):
+    compression: str = Field(
+        default="zstd",
+        description=(
+            "Parquet codec. Options: 'zstd', 'lz4', 'snappy', 'gzip', 'uncompressed'"
+        ),
+    )
+    compression_level: int | None = Field(
+        default=None, description="Codec level, i.e. 1-22 for zstd"
+    )
+    row_group_size: int | None = Field(
+        default=None, description="Maximum number of rows per row group"
+    )
+    statistics: bool = Field(
+        default=True, description="Write min/max statistics used for scan pruning"
+    )
+    dictionary: bool = Field(default=True, description="Dictionary encode columns")
+    sort_by: list[str] = Field(
+        default_factory=list, description="Columns the rows are sorted by before write"
+    )
+
+
+class DatasetSettings(BaseModel):
+    columns: dict[str, str] = Field(
+        description=(
+            "Column names and Polars dtype names, i.e. "
+            "{'ts': 'Datetime', 'value': 'Float64'}"
+        )
+    )
+    prefix: str | None = Field(
+        default=None,
+        description=(
+            "Prefix of the dataset files inside the "
+            "dataset bucket, defaults to the name"
+        ),
+    )
+    dump_size_mb: float = Field(
+        default=1, description="Buffer size in MB that triggers a flush of this dataset"
+    )
+
+
 class Settings(BaseSettings):
     dataframe_dump_size: int = Field(
         default=1, description="Size threshold for dumping the DataFrame in MB"
@@ -28,8 +70,292 @@ class Settings(BaseSettings):
         default="books_index1",
         description="Name of the index table in the database",
     )
+    datasets: dict[str, DatasetSettings] = Field(
+        default_factory=dict,
+        description=(
+            "Named datasets ingested next to the books, each with its own buffer"
+        ),
+    )
+    memory_budget_mb: float = Field(
+        default=512,
+        description=(
+            "Buffer memory shared by all datasets, buffers above their fair share flush"
+        ),
+    )
+    spill_enabled: bool = Field(
+        default=True,
+        description=(
+            "Spill the largest buffers to local Arrow IPC files under memory pressure"
+        ),
+    )
+    spill_dir: str = Field(
+        default=".spill", description="Directory of the spilled buffer chunks"
+    )
+    spill_buffer_soft_limit_mb: float = Field(
+        default=256,
+        description="Total size in MB of the in-memory buffers that triggers a spill",
+    )
+    spill_rss_soft_limit_mb: float = Field(
+        default=2048,
+        description=(
+            "Resident memory in MB of a worker that triggers a spill, 0 to ignore it"
+        ),
+    )
+    spill_min_chunk_mb: float = Field(
+        default=1, description="Buffers smaller than this size in MB are never spilled"
+    )
+    change_feed_max_files: int = Field(
+        default=100,
+        description=(
+            "Files streamed per change feed call at most, the next call continues"
+        ),
+    )
+    bulk_ingest_batch_rows: int = Field(
+        default=50_000,
+        description="Rows per batch validated and appended by bulk ingest",
+    )
+    bulk_ingest_spool_mb: int = Field(
+        default=64,
+        description=(
+            "Arrow and Parquet uploads above this size in MB are spooled to disk"
+        ),
+    )
+    ingest_coalesce_window_ms: int = Field(
+        default=5,
+        description=(
+            "Milliseconds small ingest requests wait "
+            "to be appended together, 0 disables"
+        ),
+    )
+    ingest_coalesce_max_rows: int = Field(
+        default=5_000,
+        description="Rows that close a coalesced group before the window ends",
+    )
+    admission_max_buffer_mb: int = Field(
+        default=256,
+        description="Ingest answers 503 while the buffer is above this size in MB",
+    )
+    admission_max_pending_flushes: int = Field(
+        default=2,
+        description="Ingest answers 503 while this many flushes are in flight",
+    )
+    admission_max_pending_index_tasks: int = Field(
+        default=64,
+        description=(
+            "Ingest answers 503 while this many background index writes are queued"
+        ),
+    )
+    admission_retry_after_seconds: int = Field(
+        default=5, description="Retry-After in seconds sent with 503 responses"
+    )
+    client_rate_limit_per_second: float = Field(
+        default=0,
+        description=(
+            "Ingest requests per second allowed per client, 0 disables the limit"
+        ),
+    )
+    client_rate_limit_burst: int = Field(
+        default=20, description="Ingest requests a client may send in a burst"
+    )
+    fanout_peers: list[str] = Field(
+        default_factory=list,
+        description=(
+            "Base URLs of peer nodes running query "
+            "shards, i.e. 'http://node-b:8000/grizzly'"
+        ),
+    )
+    fanout_local_shards: int = Field(
+        default=0,
+        description=(
+            "Query shards run in the local compute executor, 0 uses compute_workers"
+        ),
+    )
+    fanout_peer_timeout_seconds: float = Field(
+        default=30,
+        description="Seconds to wait for a peer shard before it is run locally instead",
+    )
+    compact_schema: bool = Field(
+        default=False,
+        description="Store books with categorical authors and narrower integer types",
+    )
+    compute_executor: str = Field(
+        default="process",
+        description=(
+            "Executor used for CPU-bound Polars work. Options: 'process', 'thread'"
+        ),
+    )
+    compute_workers: int = Field(
+        default=2, description="Number of workers in the compute executor"
+    )
+
+    parquet_write_profile: str = Field(
+        default="balanced",
+        description=(
+            "Name of the profile from parquet_profiles used for every Parquet write"
+        ),
+    )
+    parquet_profiles: dict[str, ParquetWriteProfile] = Field(
+        default_factory=lambda: {
+            "fast": ParquetWriteProfile(compression="lz4", statistics=False),
+            "balanced": ParquetWriteProfile(
+                compression="zstd",
+                compression_level=3,
+                row_group_size=64_000,
+                sort_by=["pub_date", "isbn"],
+            ),
+            "small": ParquetWriteProfile(
+                compression="zstd",
+                compression_level=19,
+                row_group_size=256_000,
+                sort_by=["author", "pub_date", "isbn"],
+            ),
+            "snappy": ParquetWriteProfile(compression="snappy"),
+        },
+        description="Named Parquet write profiles",
+    )
+
+    manifest_prefix: str = Field(
+        default="daily/_manifest",
+        description="S3 prefix holding the dataset manifest deltas and snapshots",
+    )
+    sketch_precision: int = Field(
+        default=12,
+        description=(
+            "HyperLogLog precision of the distinct count sketches, 2**p registers"
+        ),
+    )
+    search_bm25_k1: float = Field(
+        default=1.2, description="BM25 term frequency saturation of /v1/search"
+    )
+    search_bm25_b: float = Field(
+        default=0.75, description="BM25 document length normalization of /v1/search"
+    )
+    manifest_keep_snapshots: int = Field(
+        default=20,
+        description="Manifest versions kept in S3 behind the previous checkpoint",
+    )
+    manifest_checkpoint_interval: int = Field(
+        default=50,
+        description=(
+            "Manifest versions between full snapshots, the commits between are deltas"
+        ),
+    )
+    manifest_refresh_interval_ms: int = Field(
+        default=1000,
+        description=(
+            "Milliseconds reads are served from the cached manifest before checking S3"
+        ),
+    )
+    manifest_commit_timeout_seconds: float = Field(
+        default=30,
+        description="Seconds a manifest commit retries on conflicts before failing",
+    )
+    compaction_enabled: bool = Field(
+        default=True,
+        description=(
+            "Run the background compactor in the worker holding `compaction_lock_file`"
+        ),
+    )
+    compaction_lock_file: str = Field(
+        default="compaction.lock",
+        description="File locked by the one worker of a host running the compactor",
+    )
+    compaction_interval_seconds: int = Field(
+        default=300, description="Seconds between background compaction runs"
+    )
+    compaction_small_file_mb: int = Field(
+        default=16, description="Files below this size in MB are compaction candidates"
+    )
+    compaction_min_age_seconds: int = Field(
+        default=120, description="Files younger than this are left to their writers"
+    )
+    compaction_target_file_mb: int = Field(
+        default=128, description="Target size in MB of compacted files"
+    )
+    compaction_retention_seconds: int = Field(
+        default=900,
+        description="Seconds replaced files stay readable before they are deleted",
+    )
+    catalog_reconcile_interval_seconds: int = Field(
+        default=3600,
+        description="Seconds between reconciliations of the file catalog with S3 LIST",
+    )
+
+    rollover_enabled: bool = Field(
+        default=True,
+        description=(
+            "Seal the buffer at the date change and ship local files of past days to S3"
+        ),
+    )
+    rollover_interval_seconds: int = Field(
+        default=60, description="Seconds between checks for a date change"
+    )
+    rollover_part_size_mb: int = Field(
+        default=8,
+        description="Part size in MB of the resumable multipart uploads, at least 5",
+    )
+    rollover_dir: str = Field(
+        default=".",
+        description="Directory holding the local SQLite indexes and Parquet files",
+    )
+    object_cache_enabled: bool = Field(
+        default=True, description="Serve Parquet reads from a local memory-mapped copy"
+    )
+    object_cache_dir: str = Field(
+        default=".cache/s3", description="Directory of the local object cache"
+    )
+    object_cache_max_mb: int = Field(
+        default=2048, description="Size limit in MB of the local object cache"
+    )
 
+    latest_view_enabled: bool = Field(
+        default=True,
+        description=(
+            "Maintain the latest record per ISBN view at every flush, upsert and delete"
+        ),
+    )
+    latest_view_prefix: str = Field(
+        default="daily/_views/latest",
+        description=(
+            "S3 prefix holding the states and range files of the latest record view"
+        ),
+    )
+    latest_view_range_rows: int = Field(
+        default=250_000,
+        description="Rows above which a key range of the latest record view is split",
+    )
+
+    storage_backend: Literal["s3fs", "obstore", "local"] = Field(
+        default="s3fs",
+        description=(
+            "Object store client behind the S3 services. "
+            "Options: 's3fs', 'obstore', 'local'"
+        ),
+    )
+    storage_verify_exclusive_put: bool = Field(
+        default=True,
+        description=(
+            "Check at startup that the object store "
+            "fails exclusive puts on existing objects"
+        ),
+    )
+    storage_local_dir: str = Field(
+        default=".storage",
+        description="Directory holding the buckets of the 'local' storage backend",
+    )
     s3_credentials: S3Credentials = S3Credentials()
+    s3_max_pool_connections: int = Field(
+        default=64, description="Connections kept in the S3 client pool per worker"
+    )
+    s3_connect_timeout: int = Field(
+        default=5, description="Seconds to wait for an S3 connection"
+    )
+    s3_read_timeout: int = Field(
+        default=60, description="Seconds to wait for an S3 response"
+    )
+    s3_max_attempts: int = Field(
+        default=5, description="Attempts per S3 call with adaptive retries"
+    )
 
     POSTGRES_USER: str = Field(default="metabase")
     POSTGRES_PASSWORD: str = Field(default="secret")
@@ -37,6 +363,34 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = Field(default="metabase")
 
     SQLITE_DB: str = Field(default="sqlite:///mydb1.sqlite")
+    database_echo: bool = Field(
+        default=False,
+        description="Log every SQL statement of the async engine, meant for debugging",
+    )
+    index_partitioning_enabled: bool = Field(
+        default=False,
+        description=(
+            "Write the books index to the range "
+            "partitioned Postgres table instead of SQLite"
+        ),
+    )
+    index_partition_key: Literal["ingest_date", "pub_date"] = Field(
+        default="ingest_date",
+        description="Date column the Postgres books index is partitioned by, "
+        "pub_date needs the year interval and is never dropped by the retention",
+    )
+    index_partition_interval: Literal["day", "month", "year"] = Field(
+        default="day", description="Range of the partition key covered by one partition"
+    )
+    index_partitions_ahead: int = Field(
+        default=3, description="Future partitions created ahead of the data"
+    )
+    index_retention_days: int = Field(
+        default=90,
+        description=(
+            "Partitions ending more than this many days ago are dropped, 0 keeps all"
+        ),
+    )
 
     @computed_field
     @property
@@ -60,5 +414,19 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    @property
+    def write_profile(self) -> ParquetWriteProfile:
+        return self.parquet_profiles[self.parquet_write_profile]
+
+    @property
+    def s3_client_config(self) -> dict:
+        return {
+            "max_pool_connections": self.s3_max_pool_connections,
+            "connect_timeout": self.s3_connect_timeout,
+            "read_timeout": self.s3_read_timeout,
+            "retries": {"max_attempts": self.s3_max_attempts, "mode": "adaptive"},
+            "tcp_keepalive": True,
+        }
+
 
 settings: Settings = Settings()
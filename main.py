@@ -2,10 +2,21 @@ import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 from whenever import Instant
 
 from api.books import router as grizzly_router
-
+from config import settings as global_settings
+from services.compaction import CompactionService
+from services.compute import ComputeExecutor
+from services.database import DatabaseService
+from services.fanout import FanoutService
+from services.latest import LatestViewService
+from services.partitions import PartitionService
+from services.rollover import RolloverService
+from services.s3_async import S3AsyncService
+from services.spill import SpillService
+from services.storage import split_path
 from services.utlis import AppLogger
 
 logger = AppLogger().get_logger()
@@ -21,13 +32,50 @@ async def lifespan(_app: FastAPI):
         # TODO: setting new date and it will destroy dataframe and create new one to hol dnew days logs
         _app.now = Instant.now().py_datetime().strftime("%Y%m%d")
         logger.info(f">>> Date is set to {_app.now}")
+        await S3AsyncService().start()
+        logger.info(">>> S3 session opened")
+        if global_settings.storage_verify_exclusive_put:
+            # Commits are only safe on stores that fail
+            # exclusive puts on existing objects
+            bucket, _ = split_path(global_settings.manifest_prefix)
+            await run_in_threadpool(
+                S3AsyncService().backend.verify_exclusive_put, bucket
+            )
+            logger.info(f">>> Exclusive puts verified on {bucket}")
+        ComputeExecutor().start()
+        logger.info(f">>> Compute executor started: {ComputeExecutor().stats()}")
+        logger.info(f">>> Adopted {SpillService().adopt()} spilled chunks")
+        if global_settings.index_partitioning_enabled:
+            _res = await run_in_threadpool(PartitionService().maintain)
+            logger.info(f">>> Index partitions maintained: {_res}")
+        if global_settings.latest_view_enabled:
+            try:
+                _res = await run_in_threadpool(LatestViewService().refresh)
+                logger.info(f">>> Latest record view built: {_res}")
+            except Exception as e:
+                # Serving does not depend on the view, the next flush refreshes it
+                logger.warning(f">>> Latest record view not built: {e}", exc_info=True)
+            LatestViewService().start()
+            logger.info(">>> Latest record view refresher started")
+        if global_settings.rollover_enabled:
+            RolloverService().start(_app)
+            logger.info(">>> Daily rollover scheduled")
+        if global_settings.compaction_enabled:
+            CompactionService().start()
+            logger.info(">>> Background compaction scheduled")
         yield
     except Exception as e:
         logger.error(f"Failed to save process ID to file: {e}")
         raise
     finally:
         # Close any resources here if needed
-        pass
+        await RolloverService().stop()
+        await CompactionService().stop()
+        await LatestViewService().stop()
+        ComputeExecutor().shutdown()
+        await S3AsyncService().close()
+        await DatabaseService().dispose()
+        await FanoutService().close()
 
 
 app = FastAPI(
@@ -1,21 +1,51 @@
 from datetime import date
-from typing import Optional
 
-from sqlalchemy import ForeignKey, Text, BigInteger, Date
-from sqlalchemy.orm import mapped_column, Mapped
+from sqlalchemy import (
+    BigInteger,
+    Date,
+    ForeignKey,
+    Index,
+    PrimaryKeyConstraint,
+    Text,
+    func,
+)
+from sqlalchemy.orm import Mapped, mapped_column
 
+from config import settings as global_settings
 from models.base import Base
 
+# Postgres requires the partition key in the primary key
+PARTITION_KEY = global_settings.index_partition_key
+
 
 class BooksIndex(Base):
+    """
+    Index of the books written to Parquet, range partitioned by `PARTITION_KEY`.
+
+    Partitions are created ahead of the data and dropped past the retention by
+    `services.partitions.PartitionService`. BRIN indexes on the date columns stay
+    small since rows arrive roughly in date order.
+    """
+
     __tablename__ = "books_index"
+    __table_args__ = (
+        PrimaryKeyConstraint("hash", PARTITION_KEY),
+        Index(
+            "ix_books_index_ingest_date_brin", "ingest_date", postgresql_using="brin"
+        ),
+        Index("ix_books_index_pub_date_brin", "pub_date", postgresql_using="brin"),
+        {"postgresql_partition_by": f"RANGE ({PARTITION_KEY})"},
+    )
 
     isbn: Mapped[str] = mapped_column(Text)
-    pages: Mapped[Optional[int]] = mapped_column(BigInteger)
-    author: Mapped[Optional[str]] = mapped_column(Text)
-    pub_date: Mapped[Optional[date]] = mapped_column(Date)
-    pid: Mapped[Optional[int]] = mapped_column(BigInteger)
-    hash: Mapped[Optional[int]] = mapped_column(BigInteger, primary_key=True)
+    pages: Mapped[int | None] = mapped_column(BigInteger)
+    author: Mapped[str | None] = mapped_column(Text)
+    pub_date: Mapped[date | None] = mapped_column(Date)
+    ingest_date: Mapped[date] = mapped_column(
+        Date, nullable=False, server_default=func.current_date()
+    )
+    pid: Mapped[int | None] = mapped_column(BigInteger)
+    hash: Mapped[int] = mapped_column(BigInteger)
     parquet_id: Mapped[int] = mapped_column(
         BigInteger, ForeignKey("parquet_index.id", ondelete="CASCADE"), nullable=False
     )
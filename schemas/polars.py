@@ -1,13 +1,169 @@
-import polars as pl
-
-pl_book_schema = pl.Schema(
-    {
-        "isbn": pl.Utf8,
-        "description": pl.Utf8,
-        "pages": pl.Int64,
-        "author": pl.Utf8,
-        "pub_date": pl.Date,
-        "pid": pl.Int64,
-        "hash": pl.Int64,
+from __future__ import annotations
+
+import hashlib
+from functools import cache
+
+from config import settings as global_settings
+from services.utlis import lazy_import
+
+pl = lazy_import("polars")
+
+# Schemas are built on first use, so importing them does not load Polars
+
+
+@cache
+def wide_book_schema() -> pl.Schema:
+    """
+    The book columns in their widest types.
+    """
+    return pl.Schema(
+        {
+            "isbn": pl.Utf8,
+            "description": pl.Utf8,
+            "pages": pl.Int64,
+            "author": pl.Utf8,
+            "pub_date": pl.Date,
+            "pid": pl.Int64,
+            "hash": pl.Int64,
+        }
+    )
+
+
+@cache
+def compact_book_schema() -> pl.Schema:
+    """
+    Same columns with a smaller footprint: repeated authors are dictionary encoded,
+    pages and pid fit in 32 bits and hash keeps its bits as an unsigned integer.
+    """
+    # Categorical frames built in different requests and workers share one encoding
+    pl.enable_string_cache()
+    return pl.Schema(
+        {
+            "isbn": pl.Utf8,
+            "description": pl.Utf8,
+            "pages": pl.Int32,
+            "author": pl.Categorical(),
+            "pub_date": pl.Date,
+            "pid": pl.Int32,
+            "hash": pl.UInt64,
+        }
+    )
+
+
+@cache
+def manifest_schema() -> pl.Schema:
+    """
+    One row per Parquet file published to the dataset manifest, doubling as the
+    file catalog: min/max of the book columns are kept in the wide schema types,
+    distinct counts as serialized HyperLogLog sketches and the full-text segment
+    with its document count and total length. `kind` tells data files from tombstones.
+    """
+    return pl.Schema(
+        {
+            "path": pl.Utf8,
+            "date": pl.Utf8,
+            "dataset": pl.Utf8,
+            "status": pl.Utf8,
+            "kind": pl.Utf8,
+            "rows": pl.Int64,
+            "bytes": pl.Int64,
+            "pid": pl.Int64,
+            "added_at": pl.Datetime("us", "UTC"),
+            "removed_at": pl.Datetime("us", "UTC"),
+            "version": pl.Int64,
+            "min_isbn": pl.Utf8,
+            "max_isbn": pl.Utf8,
+            "min_pages": pl.Int64,
+            "max_pages": pl.Int64,
+            "min_pub_date": pl.Date,
+            "max_pub_date": pl.Date,
+            "min_hash": pl.Int64,
+            "max_hash": pl.Int64,
+            "hll_isbn": pl.Binary,
+            "hll_author": pl.Binary,
+            "search_segment": pl.Utf8,
+            "search_docs": pl.Int64,
+            "search_length": pl.Int64,
+        }
+    )
+
+
+@cache
+def tombstone_schema() -> pl.Schema:
+    """
+    Keys of the books deleted or replaced by an upsert, either an ISBN or a hash
+    per row, in the wide schema types.
+    """
+    return pl.Schema({"isbn": pl.Utf8, "hash": pl.Int64})
+
+
+@cache
+def latest_schema() -> pl.Schema:
+    """
+    Rows of the latest record per ISBN view: the wide book columns, the manifest
+    version of the file the row came from and the key the view is ranged by.
+    """
+    return pl.Schema({**wide_book_schema(), "version": pl.Int64, "key": pl.UInt64})
+
+
+@cache
+def latest_range_schema() -> pl.Schema:
+    """
+    One row per key range of the view, starting at `start` and ending where the
+    next one starts. `path` is null for a range without rows.
+    """
+    return pl.Schema(
+        {
+            "start": pl.UInt64,
+            "path": pl.Utf8,
+            "rows": pl.Int64,
+            "bytes": pl.Int64,
+            "min_isbn": pl.Utf8,
+            "max_isbn": pl.Utf8,
+        }
+    )
+
+
+def book_hash(key: str) -> int:
+    """
+    Hash a book row key, `isbn + str(pages) + author`, to its `hash` value.
+
+    The first 8 bytes of its BLAKE2b digest as a signed integer, unlike the
+    builtin `hash` the same in every worker and across restarts, so deletes by
+    hash match rows ingested by any worker.
+    """
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def book_schema(compact: bool | None = None) -> pl.Schema:
+    """
+    Return the book schema selected by `compact_schema` or the explicit flag.
+    """
+    if compact is None:
+        compact = global_settings.compact_schema
+    return compact_book_schema() if compact else wide_book_schema()
+
+
+def to_book_schema(
+    frame: pl.DataFrame | pl.LazyFrame, compact: bool | None = None
+) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Cast a frame in either book schema to the selected one.
+
+    Only the book columns present in the frame are touched. `hash` is
+    reinterpreted rather than cast, so values round-trip between Int64 and UInt64
+    without loss.
+    """
+    schema = book_schema(compact)
+    columns = frame.collect_schema()
+    casts = {
+        name: dtype
+        for name, dtype in schema.items()
+        if name in columns and name != "hash" and columns[name] != dtype
     }
-)
+    if "hash" in columns and columns["hash"] != schema["hash"]:
+        frame = frame.with_columns(
+            pl.col("hash").reinterpret(signed=schema["hash"].is_signed_integer())
+        )
+    return frame.cast(casts) if casts else frame
@@ -1,6 +1,7 @@
 from datetime import date
-from polyfactory.factories.pydantic_factory import ModelFactory
-from pydantic import BaseModel, Field, ConfigDict, field_validator
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from pydantic_extra_types.isbn import ISBN
 
 
@@ -35,5 +36,55 @@ class BookSchema(BaseModel):
         return value
 
 
-class BookFactory(ModelFactory[BookSchema]):
-    __model__ = BookSchema
+class BookDeletion(BaseModel):
+    isbns: list[ISBN] = Field(
+        default_factory=list, description="ISBNs of the books to delete"
+    )
+    hashes: list[int] = Field(
+        default_factory=list, description="Hashes of the book rows to delete"
+    )
+
+    @field_validator("isbns", mode="before")
+    @classmethod
+    def clean_isbns(cls, value):
+        if isinstance(value, list):
+            return [v.replace("-", "") if isinstance(v, str) else v for v in value]
+        return value
+
+    @model_validator(mode="after")
+    def has_keys(self):
+        if not self.isbns and not self.hashes:
+            raise ValueError("Give at least one ISBN or hash to delete")
+        return self
+
+
+class FanoutQuery(BaseModel):
+    max_pages: int | None = Field(
+        default=None, description="Keep books with fewer pages than this"
+    )
+    date: str | None = Field(
+        default=None, description="Restrict the query to one 'YYYYMMDD' partition"
+    )
+    group_by: list[Literal["author", "pub_date", "isbn"]] = Field(
+        default_factory=list,
+        description="Aggregate pages per group instead of returning rows",
+    )
+
+
+class ShardRequest(BaseModel):
+    paths: list[str] = Field(description="Catalog paths of the files in the shard")
+    query: FanoutQuery = Field(description="The query run over the shard")
+
+
+def __getattr__(name: str):
+    # polyfactory and faker are only needed to generate test data, not to serve requests
+    if name == "BookFactory":
+        from polyfactory.factories.pydantic_factory import ModelFactory
+
+        global BookFactory
+
+        class BookFactory(ModelFactory[BookSchema]):
+            __model__ = BookSchema
+
+        return BookFactory
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
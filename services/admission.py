@@ -0,0 +1,226 @@
+"""
+Admission control for the ingest endpoints.
+
+Ingest is shed before it reaches the buffer when the worker is already behind:
+the buffer is above its high-water mark, too many flushes to S3 are in flight,
+or background index writes are piling up. Overload answers 503, a client above
+its token-bucket rate answers 429, both with `Retry-After`.
+
+FastAPI reads and validates a request body before it solves any dependency, so
+routes of `AdmissionRoute` run the check declared by `admission_control` before
+the body is received instead.
+"""
+
+import math
+import time
+import weakref
+from collections import Counter, OrderedDict
+from collections.abc import Callable
+from threading import Lock
+
+from attrs import define, field
+from fastapi import Depends, HTTPException, Request, Response
+from fastapi.routing import APIRoute
+
+from config import settings as global_settings
+from services.datasets import DatasetRegistry
+from services.utlis import SingletonMetaNoArgs
+
+# Clients tracked by the rate limiter before the least recently seen are dropped
+MAX_TRACKED_CLIENTS = 10_000
+
+
+@define
+class AdmissionService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service deciding whether an ingest request is admitted.
+
+    Attributes:
+        max_buffer_mb (int): Buffer size in MB above which ingest is shed.
+        max_pending_flushes (int): Flushes in flight above which ingest is shed.
+        max_pending_index_tasks (int): Queued index writes above which ingest is shed.
+        retry_after_seconds (int): `Retry-After` sent with 503 responses.
+        client_rate (float): Requests per second refilled per client, 0 disables the
+            limit.
+        client_burst (int): Token-bucket capacity per client.
+    """
+
+    max_buffer_mb: int = global_settings.admission_max_buffer_mb
+    max_pending_flushes: int = global_settings.admission_max_pending_flushes
+    max_pending_index_tasks: int = global_settings.admission_max_pending_index_tasks
+    retry_after_seconds: int = global_settings.admission_retry_after_seconds
+    client_rate: float = global_settings.client_rate_limit_per_second
+    client_burst: int = global_settings.client_rate_limit_burst
+    pending_flushes: int = field(init=False, default=0)
+    pending_index_tasks: int = field(init=False, default=0)
+    _state_lock: Lock = field(init=False, factory=Lock)
+    _buckets: OrderedDict = field(init=False, factory=OrderedDict)
+    _admitted: int = field(init=False, default=0)
+    _shed: Counter = field(init=False, factory=Counter)
+
+    def flush_started(self) -> None:
+        with self._state_lock:
+            self.pending_flushes += 1
+
+    def flush_finished(self) -> None:
+        with self._state_lock:
+            self.pending_flushes -= 1
+
+    def index_task(self, func: Callable, /, **kwargs) -> Callable[[], None]:
+        """
+        Wrap an index write counted as pending until it ran or was discarded.
+
+        Args:
+            func (Callable): The index write.
+            **kwargs: Arguments of the index write.
+
+        Returns:
+            Callable[[], None]: The task to run, it stops being counted once it ran
+                or once it is garbage collected without having run.
+        """
+        with self._state_lock:
+            self.pending_index_tasks += 1
+        _task = _PendingTask(func, kwargs)
+        _task.release = weakref.finalize(_task, self._index_task_finished)
+        return _task
+
+    def _index_task_finished(self) -> None:
+        with self._state_lock:
+            self.pending_index_tasks -= 1
+
+    def _take_token(self, client: str) -> float:
+        """
+        Take one token from the client's bucket.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available.
+        """
+        now = time.monotonic()
+        with self._state_lock:
+            tokens, last = self._buckets.pop(client, (self.client_burst, now))
+            tokens = min(self.client_burst, tokens + (now - last) * self.client_rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.client_rate
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def _overload(self, buffer_mb: float) -> str | None:
+        if buffer_mb > self.max_buffer_mb:
+            return "buffer"
+        if self.pending_flushes >= self.max_pending_flushes:
+            return "flushes"
+        if self.pending_index_tasks >= self.max_pending_index_tasks:
+            return "index_tasks"
+        return None
+
+    def _reject(
+        self, reason: str, status_code: int, retry_after: float
+    ) -> HTTPException:
+        with self._state_lock:
+            self._shed[reason] += 1
+        return HTTPException(
+            status_code=status_code,
+            detail=f"Ingest rejected: {reason}",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def admit(self, client: str, buffer_mb: float) -> None:
+        """
+        Admit an ingest request or raise the response shedding it.
+
+        Args:
+            client (str): Identity of the client for the rate limit.
+            buffer_mb (float): Current size of all dataset buffers in MB.
+
+        Raises:
+            HTTPException: 429 if the client is over its rate, 503 if the worker is
+                overloaded.
+        """
+        if self.client_rate > 0 and (wait := self._take_token(client)):
+            raise self._reject("rate_limit", 429, wait)
+        if reason := self._overload(buffer_mb):
+            raise self._reject(reason, 503, self.retry_after_seconds)
+        with self._state_lock:
+            self._admitted += 1
+
+    def stats(self) -> dict:
+        """
+        Report the admission levels and how much ingest was shed.
+
+        Returns:
+            dict: Pending flushes and index tasks, admitted and shed request counts.
+        """
+        with self._state_lock:
+            return {
+                "pending_flushes": self.pending_flushes,
+                "pending_index_tasks": self.pending_index_tasks,
+                "tracked_clients": len(self._buckets),
+                "admitted": self._admitted,
+                "shed": dict(self._shed),
+                "shed_total": sum(self._shed.values()),
+            }
+
+
+class _PendingTask:
+    __slots__ = ("__weakref__", "func", "kwargs", "release")
+
+    def __init__(self, func: Callable, kwargs: dict):
+        self.func, self.kwargs = func, kwargs
+
+    def __call__(self) -> None:
+        try:
+            self.func(**self.kwargs)
+        finally:
+            # A finalizer runs once, collecting the task later is a no-op
+            self.release()
+
+
+def _admit(request: Request, admission: AdmissionService) -> None:
+    admission.admit(
+        request.headers.get("x-client-id")
+        or (request.client.host if request.client else "unknown"),
+        DatasetRegistry().buffer_mb(request.app),
+    )
+    request.state.admitted = True
+
+
+def admission_control(request: Request, admission: AdmissionService = Depends()):
+    """
+    Dependency admitting an ingest request.
+
+    On routes of `AdmissionRoute` the request was admitted before its body was
+    read and this is a no-op, elsewhere it runs once the body was parsed.
+    Clients are identified by the `X-Client-Id` header, falling back to their address.
+
+    Args:
+        request (Request): The FastAPI request object.
+        admission (AdmissionService): The admission service dependency.
+    """
+    if not getattr(request.state, "admitted", False):
+        _admit(request, admission)
+
+
+class AdmissionRoute(APIRoute):
+    """
+    Route admitting requests that depend on `admission_control`
+    before reading their body.
+
+    A shed request is answered without receiving its body, which a dependency
+    alone cannot do for routes with a parsed JSON body.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if not any(d.dependency is admission_control for d in self.dependencies):
+            return handler
+
+        async def admitted_handler(request: Request) -> Response:
+            _admit(request, AdmissionService())
+            return await handler(request)
+
+        return admitted_handler
@@ -0,0 +1,221 @@
+"""
+Bulk ingest of NDJSON, Arrow IPC stream and Parquet uploads.
+
+Request bodies are consumed incrementally and turned into record batches of at
+most `bulk_ingest_batch_rows` rows. NDJSON is parsed line batch by line batch
+as it arrives. Arrow streams and Parquet files are spooled to a temporary file
+that stays in memory up to `bulk_ingest_spool_mb` and are then read back one
+batch at a time. Each batch is validated with vectorized Polars expressions,
+mirroring `BookSchema`, before it is appended to the buffer.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import tempfile
+from collections.abc import AsyncIterator, Iterator
+from typing import IO
+
+from starlette.concurrency import run_in_threadpool
+
+from config import settings as global_settings
+from schemas.polars import book_hash, to_book_schema
+from services.ingest import IngestService
+from services.utlis import lazy_import
+
+pl = lazy_import("polars")
+pa = lazy_import("pyarrow")
+
+BULK_COLUMNS = ("isbn", "description", "pages", "author", "pub_date")
+
+
+def _digit(value: pl.Expr, position: int) -> pl.Expr:
+    return value.str.slice(position, 1).cast(pl.Int32, strict=False)
+
+
+def isbn13_expr(value: pl.Expr) -> pl.Expr:
+    """
+    Validate ISBN-10/13 strings and normalize them to ISBN-13, like `ISBN`.
+
+    Args:
+        value (pl.Expr): String expression with ISBNs, hyphens allowed.
+
+    Returns:
+        pl.Expr: ISBN-13 strings, null where the ISBN is invalid.
+    """
+    isbn = value.str.replace_all("-", "")
+    isbn10_valid = isbn.str.contains(r"^\d{9}[\dX]$") & (
+        (
+            pl.sum_horizontal([(10 - i) * _digit(isbn, i) for i in range(9)])
+            + pl.when(isbn.str.ends_with("X")).then(10).otherwise(_digit(isbn, 9))
+        )
+        % 11
+        == 0
+    )
+    base = (
+        pl.when(isbn.str.len_chars() == 10)
+        .then(pl.lit("978") + isbn.str.slice(0, 9))
+        .otherwise(isbn.str.slice(0, 12))
+    )
+    weighted = [_digit(base, i) * (1 + 2 * (i % 2)) for i in range(12)]
+    check = ((10 - pl.sum_horizontal(weighted) % 10) % 10).cast(pl.Utf8)
+    isbn13_valid = isbn.str.contains(r"^97[89]\d{10}$") & (
+        isbn.str.slice(12, 1) == check
+    )
+    return pl.when(isbn10_valid).then(base + check).when(isbn13_valid).then(isbn)
+
+
+def _date_expr(name: str, dtype: pl.DataType) -> pl.Expr:
+    if dtype == pl.Date:
+        return pl.col(name)
+    if dtype.is_temporal():
+        return pl.col(name).dt.date()
+    return pl.col(name).cast(pl.Utf8).str.to_date(strict=False)
+
+
+def validate_books(raw: pl.DataFrame) -> tuple[pl.DataFrame, int]:
+    """
+    Cast a raw batch to the configured book schema, dropping invalid rows.
+
+    Args:
+        raw (pl.DataFrame): Batch with at least the `BookSchema` columns.
+
+    Returns:
+        tuple[pl.DataFrame, int]: The valid rows with pid and hash, and the rejected row
+            count.
+
+    Raises:
+        ValueError: If a required column is missing.
+    """
+    if missing := [c for c in BULK_COLUMNS if c not in raw.columns]:
+        raise ValueError(f"Missing columns: {missing}")
+    frame = raw.select(
+        isbn13_expr(pl.col("isbn").cast(pl.Utf8)).alias("isbn"),
+        pl.col("description").cast(pl.Utf8),
+        pl.col("pages").cast(pl.Int64, strict=False),
+        pl.col("author").cast(pl.Utf8),
+        _date_expr("pub_date", raw.schema["pub_date"]).alias("pub_date"),
+    ).filter(pl.all_horizontal(pl.all().is_not_null()))
+    frame = frame.with_columns(
+        pl.lit(os.getpid(), dtype=pl.Int64).alias("pid"),
+        # Same key and hash as the JSON endpoints, so both paths produce comparable keys
+        pl.concat_str("isbn", pl.col("pages").cast(pl.Utf8), "author")
+        .map_batches(
+            lambda s: pl.Series([book_hash(v) for v in s], dtype=pl.Int64),
+            return_dtype=pl.Int64,
+        )
+        .alias("hash"),
+    )
+    return to_book_schema(frame), raw.height - frame.height
+
+
+def _read_ndjson(lines: list[bytes]) -> pl.DataFrame:
+    return pl.read_ndjson(
+        io.BytesIO(b"\n".join(lines)), schema={c: pl.Utf8 for c in BULK_COLUMNS}
+    )
+
+
+async def ndjson_batches(
+    stream: AsyncIterator[bytes], batch_rows: int
+) -> AsyncIterator[pl.DataFrame]:
+    """
+    Parse an NDJSON body into batches while it is being received.
+
+    Args:
+        stream (AsyncIterator[bytes]): The request body stream.
+        batch_rows (int): Maximum rows per batch.
+
+    Yields:
+        pl.DataFrame: Raw batches with the `BookSchema` columns as strings.
+    """
+    pending, lines = b"", []
+    async for chunk in stream:
+        *complete, pending = (pending + chunk).split(b"\n")
+        lines.extend(line for line in complete if line.strip())
+        while len(lines) >= batch_rows:
+            yield await run_in_threadpool(_read_ndjson, lines[:batch_rows])
+            lines = lines[batch_rows:]
+    if pending.strip():
+        lines.append(pending)
+    if lines:
+        yield await run_in_threadpool(_read_ndjson, lines)
+
+
+async def spool(stream: AsyncIterator[bytes]) -> IO[bytes]:
+    """
+    Spool a request body, keeping up to `bulk_ingest_spool_mb` in memory.
+
+    Args:
+        stream (AsyncIterator[bytes]): The request body stream.
+
+    Returns:
+        IO[bytes]: The spooled body, rewound to the start.
+    """
+    # Returned to the caller
+    file = tempfile.SpooledTemporaryFile(  # noqa: SIM115
+        max_size=global_settings.bulk_ingest_spool_mb * 1024**2
+    )
+    async for chunk in stream:
+        file.write(chunk)
+    file.seek(0)
+    return file
+
+
+def arrow_batches(file: IO[bytes], batch_rows: int) -> Iterator[pl.DataFrame]:
+    """
+    Read an Arrow IPC stream one record batch at a time.
+
+    Args:
+        file (IO[bytes]): The spooled Arrow IPC stream.
+        batch_rows (int): Maximum rows per batch, larger record batches are sliced.
+
+    Yields:
+        pl.DataFrame: Raw batches as sent by the client.
+    """
+    for batch in pa.ipc.open_stream(file):
+        for offset in range(0, batch.num_rows, batch_rows):
+            yield pl.from_arrow(batch.slice(offset, batch_rows))
+
+
+def parquet_batches(file: IO[bytes], batch_rows: int) -> Iterator[pl.DataFrame]:
+    """
+    Read a Parquet file one record batch at a time.
+
+    Args:
+        file (IO[bytes]): The spooled Parquet file.
+        batch_rows (int): Maximum rows per batch.
+
+    Yields:
+        pl.DataFrame: Raw batches as stored in the file.
+    """
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(file).iter_batches(batch_size=batch_rows):
+        yield pl.from_arrow(batch)
+
+
+async def ingest_batches(
+    app, batches: AsyncIterator[pl.DataFrame], ingest: IngestService
+) -> dict:
+    """
+    Validate raw batches and append them to the buffer one by one.
+
+    Args:
+        app: The FastAPI application holding the buffer.
+        batches (AsyncIterator[pl.DataFrame]): Raw batches from one of the readers.
+        ingest (IngestService): The ingest service appending to the buffer.
+
+    Returns:
+        dict: Accepted and rejected row counts and the flushes the upload triggered.
+    """
+    accepted, rejected, flushed = 0, 0, []
+    async for raw in batches:
+        valid, invalid = await run_in_threadpool(validate_books, raw)
+        rejected += invalid
+        if valid.is_empty():
+            continue
+        accepted += valid.height
+        if _res := await ingest.append(app, valid):
+            flushed.append(_res)
+    return {"accepted": accepted, "rejected": rejected, "flushed": flushed}
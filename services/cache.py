@@ -0,0 +1,193 @@
+"""
+Local disk cache of Parquet objects read from S3.
+
+Objects are decoded once and stored as uncompressed Arrow IPC files, named after
+the S3 path and its ETag, then opened with memory mapping. Repeat reads of hot
+files come straight from the page cache without a GET or a decode. A HEAD per
+access validates the ETag, so an overwritten object is fetched again.
+
+The cache directory is shared by all Granian workers. Files are written under a
+temporary name and renamed into place, so readers never see a partial file,
+and eviction holds an exclusive `flock`. An evicted file that is still mapped
+stays readable until it is closed.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from pathlib import Path
+from threading import Lock
+
+from attrs import define, field
+
+from config import settings as global_settings
+from services.s3 import S3Service
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+pa = lazy_import("pyarrow")
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = ".arrow"
+
+
+@define
+class ObjectCache(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service keeping memory-mappable copies of S3 Parquet objects.
+
+    Attributes:
+        enabled (bool): Serve reads through the cache.
+        directory (str): Cache directory shared by the workers.
+        max_mb (int): Size limit in MB, least recently used files are evicted above it.
+    """
+
+    enabled: bool = global_settings.object_cache_enabled
+    directory: str = global_settings.object_cache_dir
+    max_mb: int = global_settings.object_cache_max_mb
+    _stats_lock: Lock = field(init=False, factory=Lock)
+    _hits: int = field(init=False, default=0)
+    _misses: int = field(init=False, default=0)
+    _evictions: int = field(init=False, default=0)
+
+    def __attrs_post_init__(self):
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+
+    @property
+    def s3(self) -> S3Service:
+        return S3Service()
+
+    def _key(self, path: str) -> str:
+        return hashlib.sha256(path.removeprefix("s3://").encode()).hexdigest()
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def _fetch(self, path: str) -> tuple[str, bool]:
+        import pyarrow.parquet as pq
+
+        key = self._key(path)
+        etag = self.s3.backend.info(path)["etag"]
+        local = Path(self.directory, f"{key}_{etag}{CACHE_SUFFIX}")
+        if local.exists():
+            local.touch()  # Refresh the LRU position
+            self._count("_hits")
+            return str(local), False
+
+        self._count("_misses")
+        table = pq.read_table(io.BytesIO(self.s3.read_bytes(path)))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, local)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        # Earlier versions of the same object are stale now
+        for stale in Path(self.directory).glob(f"{key}_*{CACHE_SUFFIX}"):
+            if stale != local:
+                stale.unlink(missing_ok=True)
+        return str(local), True
+
+    def local_path(self, path: str) -> str:
+        """
+        Return a local Arrow IPC copy of an S3 Parquet object, fetching it if needed.
+
+        Args:
+            path (str): The S3 path of the Parquet file, with or without `s3://`.
+
+        Returns:
+            str: Path of the cached Arrow IPC file.
+        """
+        local, fetched = self._fetch(path)
+        if fetched:
+            self.evict(keep={local})
+        return local
+
+    def read_parquet(self, path: str) -> pl.DataFrame:
+        """
+        Read an S3 Parquet object into a DataFrame backed by the memory-mapped copy.
+
+        Args:
+            path (str): The S3 path of the Parquet file.
+
+        Returns:
+            pl.DataFrame: The DataFrame read from the cache or from S3 when disabled.
+        """
+        if not self.enabled:
+            return self.s3.read_parquet_file(path)
+        return pl.read_ipc(self.local_path(path), memory_map=True)
+
+    def local_paths(self, paths: list[str]) -> list[str]:
+        """
+        Map S3 paths to cached copies, or return them unchanged
+        when the cache is disabled.
+
+        Args:
+            paths (list[str]): S3 paths of Parquet files.
+
+        Returns:
+            list[str]: Local Arrow IPC paths or the locations of the objects in the
+                backend.
+        """
+        if not self.enabled:
+            return [self.s3.backend.url(p) for p in paths]
+        fetched = [self._fetch(p) for p in paths]
+        local = [p for p, _ in fetched]
+        if any(f for _, f in fetched):
+            self.evict(keep=set(local))  # The whole query must survive the eviction
+        return local
+
+    def evict(self, keep: set[str] | None = None) -> None:
+        """
+        Remove the least recently used files until the cache fits `max_mb`.
+
+        Args:
+            keep (set[str] | None): Files about to be read that must survive this pass.
+        """
+        with open(Path(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            files, total = [], 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(CACHE_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Replaced by another worker meanwhile
+                total += stat.st_size  # Kept files count against the limit too
+                if entry.path not in (keep or ()):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            for _, size, path in sorted(files):
+                if total <= self.max_mb * 1024**2:
+                    break
+                Path(path).unlink(missing_ok=True)
+                total -= size
+                self._count("_evictions")
+
+    def stats(self) -> dict:
+        """
+        Report the cache size and hit rate of this worker.
+
+        Returns:
+            dict: Files and bytes on disk, hits, misses and evictions.
+        """
+        files = [e for e in os.scandir(self.directory) if e.name.endswith(CACHE_SUFFIX)]
+        with self._stats_lock:
+            return {
+                "enabled": self.enabled,
+                "files": len(files),
+                "bytes": sum(e.stat().st_size for e in files),
+                "max_bytes": self.max_mb * 1024**2,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
@@ -0,0 +1,256 @@
+"""
+Incremental change feed over the files published in the dataset catalog.
+
+Every flush writes a file named after its writer pid and the flush sequence of
+`FilenameGeneratorService`, `{date}/{base}_{pid}_{seq}.parquet`. A cursor keeps
+the last sequence read for every date and writer, together with the manifest
+version it was read at. A file is new to a cursor when its sequence is past the
+writer's position, or when a later manifest version added it, which also
+catches flushes committed out of order and writers restarted under a reused
+pid. Sealed files (`_final_{uuid}`) and shipped persistence files
+(`daily_{pid}.parquet`) come after the numbered flushes of their writer.
+
+Compaction output is never part of the feed, its rows were already delivered
+with the files it replaced. Replaced files stay readable until the retention
+window passes, so consumers lagging less than `compaction_retention_seconds`
+miss nothing. Tombstones are not part of the feed either: deletes are not
+replayed to consumers, while the rows of an upsert come as a regular file.
+
+The rows are streamed as Arrow IPC, a file at a time, and the cursor for the
+next call is returned in the `X-Next-Cursor` header. Consumers keep the cursor
+only once they have read the whole stream.
+"""
+
+from __future__ import annotations
+
+import base64
+import io
+import json
+import logging
+import re
+from collections.abc import Iterator
+
+from attrs import define, field
+
+from config import settings as global_settings
+from schemas.polars import wide_book_schema
+from services.cache import ObjectCache
+from services.datasets import Dataset
+from services.manifest import DATA, ManifestService, date_of
+from services.parquet import scan_books_wide, scan_dataset
+from services.s3 import S3Service
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+pa = lazy_import("pyarrow")
+
+logger = logging.getLogger(__name__)
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+FLUSH_FILE = re.compile(r"_(?P<pid>\d+)_(?:(?P<seq>\d+)|final_[0-9a-f]+)\.parquet$")
+DAILY_FILE = re.compile(r"(?:^|/)daily_(?P<pid>\d+)\.parquet$")
+FINAL_SEQ = 10**9  # After every numbered flush of a writer
+
+
+class InvalidCursorError(ValueError):
+    """The cursor was not issued by the change feed."""
+
+
+@define(frozen=True)
+class Cursor:
+    """
+    Position of a consumer in the change feed.
+
+    Attributes:
+        version (int): Manifest version the feed was read at.
+        writers (dict[str, int]): Last flush sequence read per `{date}/{pid}`.
+    """
+
+    version: int = 0
+    writers: dict[str, int] = field(factory=dict)
+
+    def encode(self) -> str:
+        payload = json.dumps(
+            {"v": self.version, "w": self.writers}, separators=(",", ":")
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str | None) -> Cursor:
+        """
+        Parse a cursor returned by a previous call.
+
+        Args:
+            token (str | None): The cursor, None or empty to start from the beginning.
+
+        Returns:
+            Cursor: The decoded position.
+
+        Raises:
+            InvalidCursorError: If the token is not a valid cursor.
+        """
+        if not token:
+            return cls()
+        try:
+            payload = json.loads(
+                base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            )
+            return cls(
+                version=int(payload["v"]),
+                writers={str(k): int(v) for k, v in payload["w"].items()},
+            )
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise InvalidCursorError(f"Invalid change feed cursor: {e}") from e
+
+
+def flush_position(path: str) -> tuple[str, int] | None:
+    """
+    Find the writer and flush sequence of a file from its name.
+
+    Args:
+        path (str): Catalog path of the file.
+
+    Returns:
+        tuple[str, int] | None: The `{date}/{pid}` writer key and the flush sequence,
+            None for files not written by a flush, such as compaction output.
+    """
+    match = FLUSH_FILE.search(path) or DAILY_FILE.search(path)
+    if not match or (date := date_of(path)) is None:
+        return None
+    seq = match.groupdict().get("seq")
+    return f"{date}/{match['pid']}", int(seq) if seq else FINAL_SEQ
+
+
+@define
+class ChangeFeedService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service listing and streaming the rows flushed since a cursor.
+
+    Attributes:
+        max_files (int): Files returned per call at most, the next call continues.
+    """
+
+    max_files: int = global_settings.change_feed_max_files
+
+    @property
+    def manifest(self) -> ManifestService:
+        return ManifestService()
+
+    @property
+    def cache(self) -> ObjectCache:
+        return ObjectCache()
+
+    @property
+    def s3(self) -> S3Service:
+        return S3Service()
+
+    def plan(
+        self,
+        dataset: Dataset,
+        cursor: Cursor,
+        since: str | None = None,
+        max_files: int | None = None,
+    ) -> tuple[pl.DataFrame, Cursor]:
+        """
+        Select the files of a dataset flushed since a cursor and advance it.
+
+        Args:
+            dataset (Dataset): The dataset to follow.
+            cursor (Cursor): The consumer position.
+            since (str | None): Skip 'YYYYMMDD' partitions before this date.
+            max_files (int | None): Files to return at most, `max_files` if omitted.
+
+        Returns:
+            tuple[pl.DataFrame, Cursor]: Catalog entries of the new files in feed
+                order, with `writer` and `seq`, and the cursor past them.
+        """
+        version, frame = self.manifest.snapshot()
+        # Removed files are still readable and may not have been delivered yet
+        frame = frame.filter(
+            (pl.col("dataset") == dataset.name) & (pl.col("kind") == DATA)
+        )
+        positions = [flush_position(p) for p in frame.get_column("path")]
+        frame = frame.with_columns(
+            pl.Series(
+                "writer", [p[0] if p else None for p in positions], dtype=pl.Utf8
+            ),
+            pl.Series("seq", [p[1] if p else None for p in positions], dtype=pl.Int64),
+        ).filter(pl.col("writer").is_not_null())
+        read = pl.col("writer").replace_strict(
+            cursor.writers, default=-1, return_dtype=pl.Int64
+        )
+        new = frame.filter(
+            (pl.col("seq") > read) | (pl.col("version").fill_null(0) > cursor.version)
+        )
+        if since is not None:
+            new = new.filter(pl.col("date") >= since)
+        new = new.sort(pl.col("version").fill_null(0), "writer", "seq")
+
+        limit = max_files or self.max_files
+        if new.height > limit:
+            # A commit adding several files, e.g. by reconcile, is delivered whole,
+            # so the files left for the next call all keep a version above the cursor
+            last = new.get_column("version").fill_null(0)[limit - 1]
+            new = new.filter(
+                (pl.int_range(pl.len()) < limit)
+                | ((pl.col("version").fill_null(0) == last) & (last > 0))
+            )
+            version = max(cursor.version, last)
+        writers = dict(cursor.writers)
+        for writer, seq in new.group_by("writer").agg(pl.col("seq").max()).iter_rows():
+            writers[writer] = max(writers.get(writer, -1), seq)
+        # Positions of writers no longer in the catalog can never match again
+        known = set(frame.get_column("writer"))
+        writers = {k: v for k, v in writers.items() if k in known}
+        return new, Cursor(version=max(version, cursor.version), writers=writers)
+
+    def arrow_schema(self, dataset: Dataset) -> pa.Schema:
+        schema = wide_book_schema() if dataset.is_books else dataset.schema
+        return pl.DataFrame(schema=schema).to_arrow().schema
+
+    def read(self, dataset: Dataset, path: str) -> pa.Table:
+        """
+        Read one file of the feed, through the local object cache.
+
+        Args:
+            dataset (Dataset): The dataset of the file.
+            path (str): Catalog path of the file.
+
+        Returns:
+            pa.Table: The rows, in the wide book schema or the dataset schema.
+        """
+        local = self.cache.local_paths([path])
+        if dataset.is_books:
+            lazy = scan_books_wide(local, self.s3.storage_options)
+        else:
+            lazy = scan_dataset(local, dataset.schema, self.s3.storage_options)
+        return lazy.collect().to_arrow()
+
+    def stream(self, dataset: Dataset, paths: list[str]) -> Iterator[bytes]:
+        """
+        Stream the rows of files as one Arrow IPC stream, a file at a time.
+
+        Args:
+            dataset (Dataset): The dataset of the files.
+            paths (list[str]): Catalog paths in feed order.
+
+        Yields:
+            bytes: Chunks of the Arrow IPC stream.
+        """
+        schema = self.arrow_schema(dataset)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            yield _drain(sink)  # The schema message
+            for path in paths:
+                table = self.read(dataset, path).cast(schema)
+                for batch in table.to_batches():
+                    writer.write_batch(batch)
+                yield _drain(sink)
+        yield _drain(sink)  # The end-of-stream marker
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
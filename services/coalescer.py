@@ -0,0 +1,160 @@
+"""
+Micro-batching of small ingest requests.
+
+Rows from concurrent requests are collected for `ingest_coalesce_window_ms` or
+until `ingest_coalesce_max_rows` are waiting. The whole group then pays for a
+single executor call, buffer append and index write, and every waiting request
+is completed with the group's result. Rows are built per request, so a request
+whose rows do not fit the schema fails on its own.
+"""
+
+import asyncio
+import logging
+
+from attrs import define, field
+from fastapi import BackgroundTasks
+
+from config import settings as global_settings
+from services.compute import ComputeExecutor, build_frames, frame_from_ipc
+from services.ingest import IngestService
+from services.utlis import SingletonMetaNoArgs
+
+logger = logging.getLogger(__name__)
+
+
+@define
+class IngestCoalescer(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service coalescing ingest requests into one buffer append.
+
+    Attributes:
+        window_ms (int): Milliseconds the first request of a group waits for others,
+            0 processes every request on its own.
+        max_rows (int): Rows that close a group before the window ends.
+    """
+
+    window_ms: int = global_settings.ingest_coalesce_window_ms
+    max_rows: int = global_settings.ingest_coalesce_max_rows
+    _pending: list[tuple[list[dict], asyncio.Future]] = field(init=False, factory=list)
+    _pending_rows: int = field(init=False, default=0)
+    _timer: asyncio.TimerHandle | None = field(init=False, default=None)
+    _tasks: set[asyncio.Task] = field(init=False, factory=set)
+    _requests: int = field(init=False, default=0)
+    _groups: int = field(init=False, default=0)
+    _rows: int = field(init=False, default=0)
+    _rejected: int = field(init=False, default=0)
+
+    @property
+    def ingest(self) -> IngestService:
+        return IngestService()
+
+    @property
+    def compute(self) -> ComputeExecutor:
+        return ComputeExecutor()
+
+    async def submit(self, app, rows: list[dict]) -> dict | None:
+        """
+        Queue the rows of one request and wait for its group to be appended.
+
+        Args:
+            app: The FastAPI application holding the buffer.
+            rows (list[dict]): Rows matching `wide_book_schema()`.
+
+        Returns:
+            dict | None: The materialization result if the group triggered a flush.
+
+        Raises:
+            ValueError: If the rows of this request do not fit the book schema.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((rows, future))
+        self._pending_rows += len(rows)
+        if self.window_ms <= 0 or self._pending_rows >= self.max_rows:
+            self._close_group(app)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._close_group, app)
+        return await future
+
+    def _close_group(self, app) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        group, self._pending, self._pending_rows = self._pending, [], 0
+        if group:
+            task = asyncio.create_task(self._process(app, group))
+            self._tasks.add(task)  # Keep a reference until the task is done
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(
+        self, app, group: list[tuple[list[dict], asyncio.Future]]
+    ) -> None:
+        self._requests += len(group)
+        self._groups += 1
+        self._rows += sum(len(rows) for rows, _ in group)
+        index_tasks = BackgroundTasks()
+        try:
+            _ipc, errors = await self.compute.run(
+                build_frames, [rows for rows, _ in group]
+            )
+        except Exception as e:
+            logger.exception(f"Failed to build a group of {len(group)} requests")
+            self._fail(group, e)
+            return
+        accepted = []
+        for (rows, future), error in zip(group, errors):
+            if error is None:
+                accepted.append((rows, future))
+            else:
+                self._rejected += 1
+                self._fail([(rows, future)], ValueError(error))
+        if _ipc is None:
+            return
+        try:
+            _res = await self.ingest.append(app, frame_from_ipc(_ipc), index_tasks)
+        except Exception as e:
+            logger.exception(f"Failed to ingest a group of {len(accepted)} requests")
+            self._fail(accepted, e)
+        else:
+            for _, future in accepted:
+                if not future.done():  # The client may have gone away meanwhile
+                    future.set_result(_res)
+        finally:
+            await self._index(index_tasks, len(accepted))
+
+    @staticmethod
+    async def _index(index_tasks: BackgroundTasks, requests: int) -> None:
+        # Queued index writes run even if the append failed later on, their rows are
+        # buffered and each write releases its pending count in admission control
+        try:
+            # One index write for the group, after the requests are answered
+            await index_tasks()
+        except Exception:
+            logger.exception(f"Failed to index a group of {requests} requests")
+
+    @staticmethod
+    def _fail(group: list[tuple[list[dict], asyncio.Future]], error: Exception) -> None:
+        for _, future in group:
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self) -> dict:
+        """
+        Report how well requests are being coalesced.
+
+        Returns:
+            dict: Request, group, row and rejected request counts with the average group
+                size.
+        """
+        return {
+            "window_ms": self.window_ms,
+            "max_rows": self.max_rows,
+            "requests": self._requests,
+            "groups": self._groups,
+            "rows": self._rows,
+            "rejected": self._rejected,
+            "avg_requests_per_group": self._requests / self._groups
+            if self._groups
+            else 0.0,
+            "avg_rows_per_group": self._rows / self._groups if self._groups else 0.0,
+        }
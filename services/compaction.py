@@ -0,0 +1,321 @@
+"""
+Background compaction of small dataset files.
+
+Workers flush many small Parquet files per day. The compactor picks active
+files below `compaction_small_file_mb` that are older than
+`compaction_min_age_seconds`, bin-packs them per date into groups of about
+`compaction_target_file_mb`, merges each group in the compute executor and swaps
+the inputs for the merged file in a single manifest commit. Replaced files are
+deleted only after `compaction_retention_seconds`.
+
+Rows deleted by tombstones are dropped from the merged file, and tombstones no
+active file is older than any more are retired after each pass.
+
+Only the worker holding an exclusive `flock` on `compaction_lock_file` runs the
+background passes, the other workers of the host skip theirs. The lock is released
+with the worker, and the first of the others to try again takes over.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import io
+import logging
+import time
+from datetime import timedelta
+from uuid import uuid4
+
+from attrs import define, field
+from starlette.concurrency import run_in_threadpool
+from whenever import Instant
+
+from config import settings as global_settings
+from services.compute import ComputeExecutor, frame_to_ipc, merge_parquet
+from services.manifest import (
+    DATASET_BUCKET,
+    REMOVED,
+    SKETCH_COLUMNS,
+    ManifestService,
+    ManifestStaleError,
+    file_stats,
+    merge_stats,
+)
+from services.postings import build_postings, merge_postings, segment_entry
+from services.s3 import S3Service
+from services.tombstones import TombstoneService
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+
+@define
+class CompactionService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service merging small dataset files published in the manifest.
+
+    Attributes:
+        small_file_bytes (int): Files below this size are candidates.
+        target_file_bytes (int): Upper bound for the inputs of one merged file.
+        min_age_seconds (int): Minimum age of candidate files.
+        retention_seconds (int): Time replaced files stay readable.
+        interval_seconds (int): Pause between background runs.
+        reconcile_interval_seconds (int): Pause between catalog reconciliations against
+            S3 LIST.
+        lock_file (str): File locked by the worker running the background loop.
+    """
+
+    small_file_bytes: int = global_settings.compaction_small_file_mb * 1024**2
+    target_file_bytes: int = global_settings.compaction_target_file_mb * 1024**2
+    min_age_seconds: int = global_settings.compaction_min_age_seconds
+    retention_seconds: int = global_settings.compaction_retention_seconds
+    interval_seconds: int = global_settings.compaction_interval_seconds
+    reconcile_interval_seconds: int = global_settings.catalog_reconcile_interval_seconds
+    lock_file: str = global_settings.compaction_lock_file
+    _task: asyncio.Task | None = field(init=False, default=None)
+    _election: io.TextIOWrapper | None = field(init=False, default=None)
+
+    @property
+    def manifest(self) -> ManifestService:
+        return ManifestService()
+
+    @property
+    def s3(self) -> S3Service:
+        return S3Service()
+
+    @property
+    def tombstones(self) -> TombstoneService:
+        return TombstoneService()
+
+    def plan(self, force: bool = False) -> list[pl.DataFrame]:
+        """
+        Group compaction candidates per date into target-sized batches.
+
+        Args:
+            force (bool): Ignore size and age limits and merge every active file.
+
+        Returns:
+            list[pl.DataFrame]: Manifest entries of each group with at least two files,
+                or with files older than a tombstone.
+        """
+        # Only the books are compacted, other datasets keep the files they flushed
+        candidates = self.manifest.active_entries()
+        if not force:
+            cutoff = Instant.now().py_datetime() - timedelta(
+                seconds=self.min_age_seconds
+            )
+            candidates = candidates.filter(
+                (pl.col("bytes") < self.small_file_bytes)
+                & (pl.col("added_at") < cutoff)
+            )
+        groups = []
+        for _, files in candidates.sort("added_at").group_by(
+            "date", maintain_order=True
+        ):
+            start, size = 0, 0
+            for i, nbytes in enumerate(files.get_column("bytes")):
+                if i > start and size + nbytes > self.target_file_bytes:
+                    groups.append(files[start:i])
+                    start, size = i, 0
+                size += nbytes
+            groups.append(files[start:])
+        # A lone file older than a tombstone is rewritten too,
+        # which folds the deletes in
+        newest = self.tombstones.load().get_column("version").max()
+        return [
+            group
+            for group in groups
+            if group.height > 1
+            or (
+                newest is not None
+                and group.get_column("version").fill_null(0).min() < newest
+            )
+        ]
+
+    def compact_group(self, group: pl.DataFrame) -> dict:
+        """
+        Merge one group of files, without the rows deleted from them, and swap it into
+        the manifest.
+
+        Args:
+            group (pl.DataFrame): Manifest entries of the files to merge.
+
+        Returns:
+            dict: The merged file path, its inputs and the manifest version.
+        """
+        paths = group.get_column("path").to_list()
+        date = group.get_column("date")[0]
+        planned, _ = self.manifest.snapshot()
+        deleted = self.tombstones.deleted_keys(group)
+        buffers = [self.s3.read_bytes(path) for path in paths]
+        versions = group.get_column("version").fill_null(0).to_list()
+        # Rows keep the version of their file, for the latest record view
+        parquet = (
+            ComputeExecutor()
+            .submit(merge_parquet, buffers, None, deleted, versions)
+            .result()
+        )
+        prefix = f"{date}/" if date else ""
+        target = f"{DATASET_BUCKET}/{prefix}compacted_{uuid4().hex}.parquet"
+        self.s3.write_bytes(target, parquet)
+        stats = merge_stats(group)
+        if any(deleted):
+            # Deleted rows are gone, count the rows of the merged file instead
+            import pyarrow.parquet as pq
+
+            stats["rows"] = pq.read_metadata(io.BytesIO(parquet)).num_rows
+        if any(stats[f"hll_{c}"] is None for c in SKETCH_COLUMNS):
+            # Inputs cataloged before sketches existed, build them from the merged file
+            stats.update(
+                (k, v)
+                for k, v in file_stats(pl.read_parquet(parquet)).items()
+                if k.startswith("hll_")
+            )
+        stats.update(self.merge_segments(group, parquet, date))
+        try:
+            version = self.manifest.commit(
+                add=[{"path": target, "bytes": len(parquet), **stats}],
+                remove=paths,
+                tombstones_since=planned,
+            )
+        except Exception:
+            self.s3.delete_parquet_file(target)
+            if stats.get("search_segment"):
+                self.s3.delete_parquet_file(stats["search_segment"])
+            raise
+        return {"path": target, "inputs": paths, "manifest_version": version}
+
+    def merge_segments(
+        self, group: pl.DataFrame, parquet: bytes, date: str | None
+    ) -> dict:
+        """
+        Merge the full-text segments of a compaction group.
+
+        Inputs indexed before segments existed make the merged segment incomplete, in
+        that case it is rebuilt from the merged file instead.
+
+        Args:
+            group (pl.DataFrame): Manifest entries of the merged files.
+            parquet (bytes): The merged file.
+            date (str | None): The 'YYYYMMDD' partition of the group.
+
+        Returns:
+            dict: The segment catalog columns of the merged file.
+        """
+        segments = group.get_column("search_segment")
+        if segments.null_count():
+            result = (
+                ComputeExecutor()
+                .submit(build_postings, frame_to_ipc(pl.read_parquet(parquet)))
+                .result()
+            )
+        else:
+            buffers = [self.s3.read_bytes(path) for path in segments]
+            result = ComputeExecutor().submit(merge_postings, buffers).result()
+        return segment_entry(self.s3, result, date)
+
+    def purge(self) -> list[str]:
+        """
+        Delete replaced files whose retention window has passed.
+
+        Returns:
+            list[str]: The purged paths.
+        """
+        _, frame = self.manifest.snapshot()
+        cutoff = Instant.now().py_datetime() - timedelta(seconds=self.retention_seconds)
+        expired_entries = frame.filter(
+            (pl.col("status") == REMOVED) & (pl.col("removed_at") < cutoff)
+        )
+        expired = expired_entries.get_column("path").to_list()
+        if not expired:
+            return []
+        for path in (
+            expired
+            + expired_entries.get_column("search_segment").drop_nulls().to_list()
+        ):
+            with contextlib.suppress(FileNotFoundError):
+                self.s3.delete_parquet_file(path)
+        self.manifest.commit(purge=expired)
+        return expired
+
+    def run_once(self, force: bool = False) -> dict:
+        """
+        Run one compaction pass followed by a purge of expired files.
+
+        Args:
+            force (bool): Merge every active file regardless of size and age.
+
+        Returns:
+            dict: Compacted groups, retired tombstones and purged paths.
+        """
+        compacted = []
+        for group in self.plan(force):
+            try:
+                compacted.append(self.compact_group(group))
+            except ManifestStaleError as e:
+                logger.info(f"Compaction group skipped, the manifest changed: {e}")
+        return {
+            "compacted": compacted,
+            "retired": self.tombstones.retire(),
+            "purged": self.purge(),
+        }
+
+    def elected(self) -> bool:
+        """
+        Take part in the election of the worker running the background loop.
+
+        Returns:
+            bool: True if this worker holds `lock_file`, it keeps it until it stops.
+        """
+        if self._election is None:
+            # Held until the worker stops
+            handle = open(self.lock_file, "a")  # noqa: SIM115
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                return False  # Another worker of the host compacts
+            self._election = handle
+        return True
+
+    async def run_forever(self) -> None:
+        last_reconcile = 0.0
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            if not self.elected():
+                continue  # Checked again next run, to take over from a stopped worker
+            if time.monotonic() - last_reconcile > self.reconcile_interval_seconds:
+                try:
+                    await run_in_threadpool(
+                        self.manifest.reconcile, self.min_age_seconds
+                    )
+                    last_reconcile = time.monotonic()
+                except Exception:
+                    logger.exception("Catalog reconciliation failed")
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception:
+                logger.exception("Compaction run failed")
+
+    def start(self) -> None:
+        """
+        Schedule the background compaction loop on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        """
+        Cancel the background compaction loop and leave the election.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._election is not None:
+            self._election.close()  # Releases the flock for the next worker
+            self._election = None
@@ -0,0 +1,295 @@
+"""
+Compute executor for CPU-bound Polars work.
+
+Frame construction, Parquet encoding and concatenation are submitted to a
+dedicated pool so the event loop and Starlette's threadpool stay free for I/O.
+Frames cross the process boundary as Arrow IPC buffers, never as pickled
+DataFrames, which keeps serialization a zero-parse memcpy on both sides.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import multiprocessing
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+from typing import Any
+
+from attrs import define, field
+
+from config import ParquetWriteProfile
+from config import settings as global_settings
+from schemas.polars import to_book_schema, wide_book_schema
+from services.parquet import SOURCE_VERSION, hide_deleted, write_parquet
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+
+def frame_to_ipc(dataframe: pl.DataFrame) -> bytes:
+    """
+    Serialize a DataFrame to an uncompressed Arrow IPC buffer.
+
+    Args:
+        dataframe (pl.DataFrame): The DataFrame to serialize.
+
+    Returns:
+        bytes: The Arrow IPC file buffer.
+    """
+    buffer = io.BytesIO()
+    dataframe.write_ipc(buffer, compression="uncompressed")
+    return buffer.getvalue()
+
+
+def frame_from_ipc(buffer: bytes) -> pl.DataFrame:
+    """
+    Deserialize an Arrow IPC buffer produced by `frame_to_ipc`.
+
+    Args:
+        buffer (bytes): The Arrow IPC file buffer.
+
+    Returns:
+        pl.DataFrame: The decoded DataFrame.
+    """
+    return pl.read_ipc(io.BytesIO(buffer), memory_map=False)
+
+
+def build_frame(rows: list[dict]) -> bytes:
+    """
+    Build a book DataFrame from plain rows and return it as Arrow IPC.
+
+    Args:
+        rows (list[dict]): Rows matching `wide_book_schema()`.
+
+    Returns:
+        bytes: The Arrow IPC buffer of the built frame in the configured book schema.
+    """
+    return frame_to_ipc(to_book_schema(pl.DataFrame(rows, schema=wide_book_schema())))
+
+
+def build_frames(batches: list[list[dict]]) -> tuple[bytes | None, list[str | None]]:
+    """
+    Build the rows of several requests into one book DataFrame, each request on its own.
+
+    A request whose rows do not fit the schema is left out and reported, the
+    others are concatenated in order.
+
+    Args:
+        batches (list[list[dict]]): Rows matching `wide_book_schema()`, per request.
+
+    Returns:
+        tuple[bytes | None, list[str | None]]: The Arrow IPC buffer of the built rows,
+            None if every request failed, and the error of each request, None if built.
+    """
+    frames, errors = [], []
+    for rows in batches:
+        try:
+            frames.append(to_book_schema(pl.DataFrame(rows, schema=wide_book_schema())))
+            errors.append(None)
+        except (TypeError, ValueError, OverflowError, pl.exceptions.PolarsError) as e:
+            errors.append(f"Invalid rows: {e}")
+    if not frames:
+        return None, errors
+    return frame_to_ipc(pl.concat(frames, how="vertical")), errors
+
+
+def encode_parquet(buffer: bytes, profile: ParquetWriteProfile | None = None) -> bytes:
+    """
+    Encode an Arrow IPC buffer as a Parquet file.
+
+    Args:
+        buffer (bytes): The Arrow IPC buffer to encode.
+        profile (ParquetWriteProfile | None): Write profile, defaults to the configured
+            one.
+
+    Returns:
+        bytes: The Parquet file contents.
+    """
+    parquet = io.BytesIO()
+    write_parquet(frame_from_ipc(buffer), parquet, profile)
+    return parquet.getvalue()
+
+
+def concat_parquet(
+    buffers: list[bytes],
+    deleted: list[dict[str, list] | None] | None = None,
+    versions: list[int] | None = None,
+) -> bytes:
+    """
+    Concatenate Parquet files into a single frame returned as Arrow IPC.
+
+    Files written with either book schema are cast to the configured one first.
+
+    Args:
+        buffers (list[bytes]): The Parquet file contents to concatenate.
+        deleted (list[dict | None] | None): Keys deleted from each file, aligned with
+            `buffers`.
+        versions (list[int] | None): Manifest version of each file, kept per row as
+            `SOURCE_VERSION` unless the file carries its rows' versions already.
+
+    Returns:
+        bytes: The Arrow IPC buffer of the concatenated frame.
+    """
+    deleted = deleted or [None] * len(buffers)
+    frames = [
+        hide_deleted(to_book_schema(pl.read_parquet(io.BytesIO(b))), keys)
+        for b, keys in zip(buffers, deleted)
+    ]
+    for i, version in enumerate(versions or []):
+        # Rows of a compacted input keep the version of the file they came from
+        source = pl.lit(version, dtype=pl.Int64)
+        if SOURCE_VERSION in frames[i].columns:
+            source = pl.col(SOURCE_VERSION).cast(pl.Int64).fill_null(source)
+        frames[i] = frames[i].with_columns(source.alias(SOURCE_VERSION))
+    return frame_to_ipc(pl.concat(frames, how="diagonal"))
+
+
+def merge_parquet(
+    buffers: list[bytes],
+    profile: ParquetWriteProfile | None = None,
+    deleted: list[dict[str, list] | None] | None = None,
+    versions: list[int] | None = None,
+) -> bytes:
+    """
+    Merge Parquet files into a single Parquet file without leaving the worker.
+
+    Args:
+        buffers (list[bytes]): The Parquet file contents to merge.
+        profile (ParquetWriteProfile | None): Write profile, defaults to the configured
+            one.
+        deleted (list[dict | None] | None): Keys deleted from each file, dropped from
+            the output.
+        versions (list[int] | None): Manifest version of each file, kept per row.
+
+    Returns:
+        bytes: The merged Parquet file contents.
+    """
+    return encode_parquet(concat_parquet(buffers, deleted, versions), profile)
+
+
+@define
+class ComputeExecutor(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton pool for CPU-bound Polars work.
+
+    Depending on `compute_executor` the pool is either a spawn-based process pool
+    or a dedicated thread pool, both sized by `compute_workers`. Every task is
+    timed from submission to completion so queue depth and latency can be exposed.
+
+    Attributes:
+        kind (str): Executor type, 'process' or 'thread'.
+        max_workers (int): Number of pool workers.
+    """
+
+    kind: str = global_settings.compute_executor
+    max_workers: int = global_settings.compute_workers
+    _executor: Executor | None = field(init=False, default=None)
+    _stats_lock: Lock = field(init=False, factory=Lock)
+    _in_flight: int = field(init=False, default=0)
+    _completed: int = field(init=False, default=0)
+    _failed: int = field(init=False, default=0)
+    _last_latency: float = field(init=False, default=0.0)
+    _max_latency: float = field(init=False, default=0.0)
+    _total_latency: float = field(init=False, default=0.0)
+
+    def start(self) -> None:
+        """
+        Create the underlying pool if it is not running yet.
+        """
+        with self._stats_lock:
+            self._started()
+
+    def _started(self) -> Executor:
+        # Called with `_stats_lock` held, so a concurrent shutdown cannot interleave
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            elif self.kind == "thread":
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="polars-compute"
+                )
+            else:
+                raise ValueError(f"Unknown compute executor: {self.kind}")
+        return self._executor
+
+    def shutdown(self) -> None:
+        """
+        Stop the underlying pool, waiting for running tasks to finish.
+        """
+        with self._stats_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """
+        Submit a picklable module-level function to the pool.
+
+        Args:
+            fn (Callable): The function to run.
+            *args: Positional arguments, preferably bytes or plain Python values.
+
+        Returns:
+            Future: The future of the submitted task.
+        """
+        submitted_at = time.perf_counter()
+        with self._stats_lock:
+            future = self._started().submit(fn, *args)
+            self._in_flight += 1
+        future.add_done_callback(lambda f: self._record(f, submitted_at))
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a function in the pool and await its result from the event loop.
+
+        Args:
+            fn (Callable): The function to run.
+            *args: Positional arguments passed to the function.
+
+        Returns:
+            Any: The function result.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _record(self, future: Future, submitted_at: float) -> None:
+        latency = time.perf_counter() - submitted_at
+        with self._stats_lock:
+            self._in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+                return
+            self._completed += 1
+            self._last_latency = latency
+            self._max_latency = max(self._max_latency, latency)
+            self._total_latency += latency
+
+    def stats(self) -> dict:
+        """
+        Report queue depth and task latency of the pool.
+
+        Returns:
+            dict: Executor type, worker count, in-flight and queued tasks, and latency
+                in milliseconds.
+        """
+        with self._stats_lock:
+            return {
+                "executor": self.kind,
+                "workers": self.max_workers,
+                "running": self._executor is not None,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.max_workers),
+                "completed": self._completed,
+                "failed": self._failed,
+                "last_latency_ms": round(self._last_latency * 1000, 3),
+                "avg_latency_ms": round(self._total_latency * 1000 / self._completed, 3)
+                if self._completed
+                else 0.0,
+                "max_latency_ms": round(self._max_latency * 1000, 3),
+            }
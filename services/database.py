@@ -1,33 +1,55 @@
+from __future__ import annotations
+
 from collections.abc import AsyncGenerator
+from typing import TYPE_CHECKING
+
 from attrs import define, field
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings as global_settings
+from services.utlis import SingletonMetaNoArgs
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
 
 @define
-class DatabaseService:
+class DatabaseService(metaclass=SingletonMetaNoArgs):
     """
     A service class for managing the database connection and session.
+
+    The engine is created on the first session, not at import or route
+    definition time, so workers that never touch Postgres do not pay for
+    SQLAlchemy and asyncpg on startup.
     """
 
-    engine = field(init=False)
-    async_session_factory = field(init=False)
-
-    def __attrs_post_init__(self):
-        self.engine = create_async_engine(
-            global_settings.asyncpg_url.unicode_string(),
-            future=True,
-            echo=True,
-        )
-        self.async_session_factory = async_sessionmaker(
-            self.engine,
-            autoflush=False,
-            expire_on_commit=False,
-        )
-
-    async def get_db(self) -> AsyncGenerator[AsyncSession, None]:
+    _engine: AsyncEngine | None = field(init=False, default=None)
+    _async_session_factory: async_sessionmaker | None = field(init=False, default=None)
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            self._engine = create_async_engine(
+                global_settings.asyncpg_url.unicode_string(),
+                future=True,
+                echo=global_settings.database_echo,
+            )
+        return self._engine
+
+    @property
+    def async_session_factory(self) -> async_sessionmaker:
+        if self._async_session_factory is None:
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+
+            self._async_session_factory = async_sessionmaker(
+                self.engine,
+                autoflush=False,
+                expire_on_commit=False,
+            )
+        return self._async_session_factory
+
+    async def get_db(self) -> AsyncGenerator[AsyncSession]:
         """
         Dependency function to get an instance of the database session.
 
@@ -39,3 +61,23 @@ class DatabaseService:
                 yield session
             except Exception:
                 raise
+
+    async def dispose(self) -> None:
+        """
+        Close the engine's connection pool if it was ever created.
+        """
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+            self._async_session_factory = None
+
+
+async def get_db() -> AsyncGenerator[AsyncSession]:
+    """
+    Route dependency yielding a session of the worker's DatabaseService.
+
+    Yields:
+        AsyncSession: An asynchronous database session.
+    """
+    async for session in DatabaseService().get_db():
+        yield session
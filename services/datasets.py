@@ -0,0 +1,287 @@
+"""
+Registry of the named datasets a worker ingests.
+
+The books dataset is always registered under `dataframe_name`, with the book
+schema and its date partitions at the root of the dataset bucket. More datasets
+come from the `datasets` setting, each with its own schema, flush threshold and
+S3 prefix. Every buffer lives in the application state under its dataset name,
+like the books buffer always did.
+
+All buffers of a worker share `memory_budget_mb`. While their total is above
+the budget, max-min fair shares are computed over the buffer sizes and every
+buffer above its share is flushed, so one busy stream cannot crowd out quiet
+ones packed into the same deployment.
+"""
+
+from __future__ import annotations
+
+import io
+
+from attrs import define, field
+from fastapi import Depends, HTTPException
+
+from config import settings as global_settings
+from schemas.polars import book_schema
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+
+@define(frozen=True)
+class Dataset:
+    """
+    A named dataset with its own buffer.
+
+    Attributes:
+        name (str): Dataset name, also the application state attribute of its buffer.
+        schema (pl.Schema): Schema of the buffer and of the written files.
+        prefix (str): Prefix of the dataset files inside the dataset bucket, empty for
+            books.
+        dump_size_mb (float): Buffer size in MB that triggers a flush.
+    """
+
+    name: str
+    schema: pl.Schema
+    prefix: str = ""
+    dump_size_mb: float = global_settings.dataframe_dump_size
+
+    @property
+    def is_books(self) -> bool:
+        return self.name == global_settings.dataframe_name
+
+    def path(self, filename: str) -> str:
+        """
+        Place a `{date}/{file}` name under the dataset prefix.
+        """
+        return f"{self.prefix}/{filename}" if self.prefix else filename
+
+    def buffer(self, app) -> pl.DataFrame | None:
+        return getattr(app, self.name, None)
+
+    def buffer_mb(self, app) -> float:
+        buffer = self.buffer(app)
+        return buffer.estimated_size(unit="mb") if buffer is not None else 0.0
+
+
+def parse_schema(columns: dict[str, str]) -> pl.Schema:
+    """
+    Build a Polars schema from column names and dtype names.
+
+    Args:
+        columns (dict[str, str]): Column name to Polars dtype name, i.e. 'Int64'.
+
+    Returns:
+        pl.Schema: The schema.
+
+    Raises:
+        ValueError: If a dtype name is not a Polars data type.
+    """
+    schema = {}
+    for name, dtype_name in columns.items():
+        dtype = getattr(pl, dtype_name, None)
+        is_dtype = isinstance(dtype, type) and issubclass(dtype, pl.DataType)
+        if not is_dtype:
+            raise ValueError(f"Column {name!r} has unknown Polars dtype {dtype_name!r}")
+        try:
+            schema[name] = dtype()  # Default parameters, i.e. microseconds for Datetime
+        except TypeError as e:
+            raise ValueError(f"Column {name!r} needs a parametrized dtype: {e}") from e
+    return pl.Schema(schema)
+
+
+def fair_shares(sizes: dict[str, float], budget: float) -> dict[str, float]:
+    """
+    Split a memory budget with max-min fairness.
+
+    Buffers below an equal share keep what they use, and the rest of the budget
+    is split equally between the larger ones.
+
+    Args:
+        sizes (dict[str, float]): Buffer size per dataset.
+        budget (float): The shared budget.
+
+    Returns:
+        dict[str, float]: The share of each dataset.
+    """
+    shares = {}
+    pending = sorted(sizes.items(), key=lambda item: item[1])
+    remaining = budget
+    while pending:
+        share = remaining / len(pending)
+        name, size = pending[0]
+        if size > share:
+            shares.update((name, share) for name, _ in pending)
+            break
+        shares[name] = size
+        remaining -= size
+        pending.pop(0)
+    return shares
+
+
+def _configured() -> dict[str, Dataset]:
+    books = Dataset(name=global_settings.dataframe_name, schema=book_schema())
+    datasets = {books.name: books}
+    for name, spec in global_settings.datasets.items():
+        prefix = (spec.prefix if spec.prefix is not None else name).strip("/")
+        if name in datasets:
+            raise ValueError(f"Dataset {name!r} is already registered")
+        if not prefix or prefix.startswith("_") or prefix.split("/")[0].isdigit():
+            # Date partitions and `_` prefixes belong to the
+            # books dataset and the catalog
+            raise ValueError(
+                f"Dataset {name!r} needs a prefix not starting with a date or '_'"
+            )
+        datasets[name] = Dataset(
+            name=name,
+            schema=parse_schema(spec.columns),
+            prefix=prefix,
+            dump_size_mb=spec.dump_size_mb,
+        )
+    return datasets
+
+
+@define
+class DatasetRegistry(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton registry of the datasets and of their shared memory budget.
+
+    Attributes:
+        budget_mb (float): Buffer memory shared by all datasets.
+    """
+
+    budget_mb: float = global_settings.memory_budget_mb
+    _datasets: dict[str, Dataset] = field(init=False, factory=_configured)
+
+    @property
+    def books(self) -> Dataset:
+        return self._datasets[global_settings.dataframe_name]
+
+    def all(self) -> list[Dataset]:
+        return list(self._datasets.values())
+
+    def get(self, name: str | None = None) -> Dataset:
+        """
+        Look up a dataset by name.
+
+        Args:
+            name (str | None): The dataset name, the books dataset if omitted.
+
+        Returns:
+            Dataset: The dataset.
+
+        Raises:
+            KeyError: If no dataset has this name.
+        """
+        if name is None:
+            return self.books
+        return self._datasets[name]
+
+    def dataset_of(self, path: str) -> Dataset:
+        """
+        Find the dataset a file belongs to from its path.
+
+        Args:
+            path (str): Path of the file, with or without the dataset bucket.
+
+        Returns:
+            Dataset: The dataset with the longest matching prefix, books otherwise.
+        """
+        path = path.removeprefix("s3://").removeprefix("daily/")
+        matches = [
+            d
+            for d in self._datasets.values()
+            if d.prefix and path.startswith(f"{d.prefix}/")
+        ]
+        return max(matches, key=lambda d: len(d.prefix), default=self.books)
+
+    def buffer_mb(self, app) -> float:
+        return sum(d.buffer_mb(app) for d in self._datasets.values())
+
+    def over_budget(self, app) -> list[Dataset]:
+        """
+        List the datasets whose buffers exceed their fair share of the budget.
+
+        Args:
+            app: The FastAPI application holding the buffers.
+
+        Returns:
+            list[Dataset]: Datasets to flush, largest excess first, empty within budget.
+        """
+        sizes = {d.name: d.buffer_mb(app) for d in self._datasets.values()}
+        if sum(sizes.values()) <= self.budget_mb:
+            return []
+        shares = fair_shares(sizes, self.budget_mb)
+        excess = {
+            name: sizes[name] - shares[name]
+            for name in sizes
+            if sizes[name] > shares[name]
+        }
+        return [
+            self._datasets[name]
+            for name in sorted(excess, key=excess.get, reverse=True)
+        ]
+
+    def stats(self, app) -> dict:
+        """
+        Report every dataset with its buffer, flush threshold and fair share.
+
+        Args:
+            app: The FastAPI application holding the buffers.
+
+        Returns:
+            dict: The memory budget, total buffer size and per-dataset stats.
+        """
+        sizes = {d.name: d.buffer_mb(app) for d in self._datasets.values()}
+        shares = fair_shares(sizes, self.budget_mb)
+        return {
+            "budget_mb": self.budget_mb,
+            "buffer_mb": sum(sizes.values()),
+            "datasets": [
+                {
+                    "name": d.name,
+                    "prefix": d.prefix,
+                    "schema": {name: str(dtype) for name, dtype in d.schema.items()},
+                    "rows": d.buffer(app).height if d.buffer(app) is not None else 0,
+                    "buffer_mb": sizes[d.name],
+                    "dump_size_mb": d.dump_size_mb,
+                    "fair_share_mb": shares[d.name],
+                }
+                for d in self._datasets.values()
+            ],
+        }
+
+
+def read_rows(body: bytes, schema: pl.Schema) -> pl.DataFrame:
+    """
+    Parse newline-delimited JSON rows into a frame of the dataset schema.
+
+    Keys outside the schema are ignored, missing ones become nulls.
+
+    Args:
+        body (bytes): The NDJSON payload.
+        schema (pl.Schema): The dataset schema.
+
+    Returns:
+        pl.DataFrame: The parsed rows.
+    """
+    return pl.read_ndjson(io.BytesIO(body), schema=schema)
+
+
+def get_dataset(name: str, registry: DatasetRegistry = Depends()) -> Dataset:
+    """
+    Dependency resolving the `{name}` path parameter to a registered dataset.
+
+    Args:
+        name (str): The dataset name.
+        registry (DatasetRegistry): The dataset registry dependency.
+
+    Returns:
+        Dataset: The dataset.
+
+    Raises:
+        HTTPException: 404 if no dataset has this name.
+    """
+    try:
+        return registry.get(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset {name!r}")
@@ -0,0 +1,264 @@
+"""
+Parallel fan-out of dataset queries across local worker processes and peer nodes.
+
+The coordinator plans a query from the file catalog, prunes files with their
+statistics and splits the rest into shards of similar byte size. Shards run in
+parallel in the local compute executor and on peer nodes over HTTP
+(`POST /v1/fanout_shard`), and come back as Arrow IPC. A shard whose peer fails
+or times out is run locally instead.
+
+Filters return rows, which are concatenated. Aggregates return partial
+aggregates per group, count, sum, min and max of pages, which the coordinator
+merges, so raw rows never leave the node that read them.
+
+Every node hides the rows deleted by tombstones from the files of its shards,
+resolved from its own view of the catalog.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from attrs import define, field
+from starlette.concurrency import run_in_threadpool
+
+from config import settings as global_settings
+from schemas.pydantic import FanoutQuery, ShardRequest
+from services.cache import ObjectCache
+from services.compute import ComputeExecutor, frame_from_ipc, frame_to_ipc
+from services.manifest import ManifestService
+from services.parquet import scan_books_wide
+from services.s3 import S3Service
+from services.tombstones import TombstoneService
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+if TYPE_CHECKING:
+    import httpx
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+LOCAL = "local"
+
+
+def run_shard(
+    paths: list[str],
+    storage_options: dict,
+    query: dict,
+    deleted: list[dict[str, list] | None] | None = None,
+) -> bytes:
+    """
+    Run a query over one shard of files.
+
+    Args:
+        paths (list[str]): Local cached copies or S3 URLs of the files.
+        storage_options (dict): Object store options passed to Polars.
+        query (dict): The dumped `FanoutQuery`.
+        deleted (list[dict | None] | None): Keys deleted from each file, aligned with
+            `paths`.
+
+    Returns:
+        bytes: Arrow IPC of the matching rows, or of the partial aggregates per group.
+    """
+    # Shards of files without some book columns still return the same columns
+    lazy = scan_books_wide(paths, storage_options, deleted)
+    if query["max_pages"] is not None:
+        lazy = lazy.filter(pl.col("pages") < query["max_pages"])
+    if query["group_by"]:
+        lazy = lazy.group_by(query["group_by"]).agg(
+            pl.len().cast(pl.Int64).alias("count"),
+            pl.col("pages").sum().cast(pl.Int64).alias("pages_sum"),
+            pl.col("pages").min().alias("pages_min"),
+            pl.col("pages").max().alias("pages_max"),
+        )
+    else:
+        lazy = lazy.select("isbn", "pages")
+    return frame_to_ipc(lazy.collect(engine="streaming"))
+
+
+def merge_shards(buffers: list[bytes], query: FanoutQuery) -> pl.DataFrame:
+    """
+    Merge the results of all shards.
+
+    Args:
+        buffers (list[bytes]): Arrow IPC results of `run_shard`.
+        query (FanoutQuery): The query the shards ran.
+
+    Returns:
+        pl.DataFrame: Concatenated rows, or the merged aggregates with the mean pages.
+    """
+    frame = pl.concat([frame_from_ipc(b) for b in buffers])
+    if not query.group_by:
+        return frame
+    return (
+        frame.group_by(query.group_by)
+        .agg(
+            pl.col("count").sum(),
+            pl.col("pages_sum").sum(),
+            pl.col("pages_min").min(),
+            pl.col("pages_max").max(),
+        )
+        .with_columns((pl.col("pages_sum") / pl.col("count")).alias("pages_mean"))
+        .sort(query.group_by)
+    )
+
+
+def split_shards(entries: pl.DataFrame, count: int) -> list[list[str]]:
+    """
+    Split catalog entries into shards of similar byte size, largest files first.
+
+    Args:
+        entries (pl.DataFrame): Catalog entries with `path` and `bytes`.
+        count (int): Maximum number of shards.
+
+    Returns:
+        list[list[str]]: The non-empty shards, heaviest first.
+    """
+    shards = [(0, i, []) for i in range(max(1, min(count, entries.height)))]
+    for path, size in (
+        entries.sort("bytes", descending=True).select("path", "bytes").iter_rows()
+    ):
+        total, i, paths = heapq.heappop(shards)
+        paths.append(path)
+        heapq.heappush(shards, (total + (size or 0), i, paths))
+    return [paths for _, _, paths in sorted(shards, reverse=True) if paths]
+
+
+@define
+class FanoutService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton coordinator running dataset queries as parallel shards.
+
+    Attributes:
+        peers (list[str]): Base URLs of the peer nodes, one shard each.
+        local_shards (int): Shards run in the local compute executor.
+        peer_timeout_seconds (float): Seconds to wait for a peer shard.
+    """
+
+    peers: list[str] = field(factory=lambda: list(global_settings.fanout_peers))
+    local_shards: int = (
+        global_settings.fanout_local_shards or global_settings.compute_workers
+    )
+    peer_timeout_seconds: float = global_settings.fanout_peer_timeout_seconds
+    _client: httpx.AsyncClient | None = field(init=False, default=None)
+
+    @property
+    def manifest(self) -> ManifestService:
+        return ManifestService()
+
+    @property
+    def cache(self) -> ObjectCache:
+        return ObjectCache()
+
+    @property
+    def s3(self) -> S3Service:
+        return S3Service()
+
+    @property
+    def tombstones(self) -> TombstoneService:
+        return TombstoneService()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(timeout=self.peer_timeout_seconds)
+        return self._client
+
+    async def close(self) -> None:
+        """
+        Close the HTTP client used to reach peers, if it was ever opened.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def run_local(self, paths: list[str], query: FanoutQuery) -> bytes:
+        """
+        Run a shard in the local compute executor, over cached copies when available.
+
+        Args:
+            paths (list[str]): Catalog paths of the files.
+            query (FanoutQuery): The query to run.
+
+        Returns:
+            bytes: Arrow IPC result of `run_shard`.
+        """
+        local_paths = await run_in_threadpool(self.cache.local_paths, paths)
+        deleted = await run_in_threadpool(self.tombstones.deleted_for_paths, paths)
+        return await ComputeExecutor().run(
+            run_shard, local_paths, self.s3.storage_options, query.model_dump(), deleted
+        )
+
+    async def run_peer(self, peer: str, paths: list[str], query: FanoutQuery) -> bytes:
+        response = await self.client.post(
+            f"{peer.rstrip('/')}/v1/fanout_shard",
+            json=ShardRequest(paths=paths, query=query).model_dump(mode="json"),
+        )
+        response.raise_for_status()
+        return response.content
+
+    async def _run(
+        self, target: str, paths: list[str], query: FanoutQuery
+    ) -> tuple[bytes, dict]:
+        started = time.perf_counter()
+        info = {"target": target, "files": len(paths), "fallback": False}
+        if target == LOCAL:
+            buffer = await self.run_local(paths, query)
+        else:
+            try:
+                buffer = await self.run_peer(target, paths, query)
+            except Exception as e:
+                logger.warning(
+                    f"Shard on {target} failed, running it locally: {e!r}",
+                    exc_info=True,
+                )
+                info["fallback"] = True
+                buffer = await self.run_local(paths, query)
+        info["ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return buffer, info
+
+    async def query(self, query: FanoutQuery) -> dict:
+        """
+        Plan a query from the catalog, run its shards in parallel and merge the results.
+
+        Args:
+            query (FanoutQuery): The filter or aggregate to run.
+
+        Returns:
+            dict: The merged rows or aggregates, and per-shard metadata.
+        """
+        predicate = None
+        if query.max_pages is not None:
+            predicate = pl.col("min_pages").is_null() | (
+                pl.col("min_pages") < query.max_pages
+            )
+        entries = await run_in_threadpool(
+            self.manifest.active_entries, query.date, predicate
+        )
+
+        # Local shards come first, so small queries do not leave the node
+        targets = [LOCAL] * self.local_shards + self.peers
+        shards = split_shards(entries, len(targets))
+        results = await asyncio.gather(
+            *(self._run(target, paths, query) for target, paths in zip(targets, shards))
+        )
+        if not results:
+            return {"data": [], "metadata": {"row_count": 0, "files": 0, "shards": []}}
+        merged = await run_in_threadpool(merge_shards, [r[0] for r in results], query)
+        return {
+            "data": merged.to_dicts(),
+            "metadata": {
+                "row_count": merged.height,
+                "columns": merged.columns,
+                "files": entries.height,
+                "shards": [r[1] for r in results],
+            },
+        }
@@ -1,7 +1,8 @@
-import os
 import itertools
-from whenever import Instant
+import os
+
 from attrs import define, field
+from whenever import Instant
 
 from services.utlis import SingletonMeta
 
@@ -24,10 +25,13 @@ class FilenameGeneratorService(metaclass=SingletonMeta):
         init=False, factory=lambda: Instant.now().py_datetime().strftime("%Y%m%d")
     )
 
-    async def generate_filename(self):
+    async def generate_filename(self, base_name: str | None = None):
         """
         Generate a filename with the base name, current date, and sequence number.
 
+        Args:
+            base_name (str | None): Overrides the base name, i.e. with a dataset name.
+
         Returns:
             str: The generated file name in the format '{base_name}_{current_date}_{sequence:03}.parquet'.
         """
@@ -35,8 +39,9 @@ class FilenameGeneratorService(metaclass=SingletonMeta):
         if new_date != self.current_date:
             self.current_date = new_date
             self.sequence = itertools.count(1)
-            # call await run_in_threadpool to copy very last daily parquet file to s3
-        return f"{self.current_date}/{self.base_name}_{str(os.getpid())}_{next(self.sequence):03}.parquet"
+            # the previous day's buffer and local files are shipped by RolloverService
+        name = f"{base_name or self.base_name}_{os.getpid()}_{next(self.sequence):03}"
+        return f"{self.current_date}/{name}.parquet"
 
 
 def get_filename_generator_service() -> FilenameGeneratorService:
@@ -4,16 +4,37 @@ Services for database indexing operations.
 This module provides the IndexService singleton class that handles writing
 Polars DataFrames to a database with built-in retry functionality for
 handling transient database errors.
+
+With `index_partitioning_enabled` the index goes to the range partitioned
+Postgres `books_index` table, each row straight into its partition, after the
+`parquet_index` row of the file holding it.
 """
+
+from __future__ import annotations
+
+import hashlib
 import os
 from typing import Any
-import polars as pl
+
 from attrs import define
-from tenacity import retry, wait_fixed, stop_after_attempt
+from tenacity import retry, stop_after_attempt, wait_fixed
 from whenever import Instant
 
 from config import settings as global_settings
-from services.utlis import SingletonMetaNoArgs
+from schemas.polars import to_book_schema
+from services.partitions import PartitionService, utc_today
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+
+def parquet_id(url: str) -> int:
+    """
+    Id of a Parquet file in `parquet_index`, derived from its URL so
+    every worker agrees on it.
+    """
+    digest = hashlib.blake2b(url.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
 
 
 @define
@@ -30,12 +51,17 @@ class IndexService(metaclass=SingletonMetaNoArgs):
         index_table (str): Name of the database table to write to.
         index_connection (str): Database connection string or URI.
     """
+
     index_engine: str = global_settings.index_engine
     index_table: str = global_settings.index_table
     # index_connection: str = global_settings.pg_url.unicode_string()
     index_connection: str = global_settings.SQLITE_DB
 
-    def __call__(self) -> "IndexService":
+    @property
+    def partitions(self) -> PartitionService:
+        return PartitionService()
+
+    def __call__(self) -> IndexService:
         """
         Returns the singleton instance of this service.
 
@@ -45,17 +71,20 @@ class IndexService(metaclass=SingletonMetaNoArgs):
         return self
 
     @retry(wait=wait_fixed(1), stop=stop_after_attempt(7))
-    def write_index(self, dataframe: pl.DataFrame, parquet_path_id: int) -> Any:
+    def write_index(self, dataframe: pl.DataFrame, parquet_url: str) -> Any:
         """
         Write selected columns from a DataFrame to the configured database table.
 
-        Selects specific columns from the input DataFrame, adds a parquet_id column,
-        and writes the result to the database. Will automatically retry up to 7 times
-        with a 1 second delay between attempts if the operation fails.
+        Selects specific columns from the input DataFrame, casts them to the wide
+        book schema the index tables use, adds the parquet_id of the file holding
+        the rows, and writes the result to the database, or to the partitions of
+        the Postgres books index when partitioning is enabled. Will automatically
+        retry up to 7 times with a 1 second delay between attempts if the
+        operation fails.
 
         Args:
             dataframe (pl.DataFrame): Source DataFrame to extract data from.
-            parquet_path_id (int): ID to associate with all records in this batch.
+            parquet_url (str): URL of the Parquet file holding the rows.
 
         Returns:
             Any: Result of the database write operation.
@@ -63,9 +92,14 @@ class IndexService(metaclass=SingletonMetaNoArgs):
         Raises:
             Exception: If writing to the database fails after all retry attempts.
         """
-        dataframe = dataframe.select(
-            ["isbn", "pages", "author", "pub_date", "pid", "hash"]
-        ).with_columns(pl.lit(parquet_path_id).alias("parquet_id"))
+        dataframe = to_book_schema(
+            dataframe.select(["isbn", "pages", "author", "pub_date", "pid", "hash"]),
+            compact=False,
+        ).with_columns(
+            pl.lit(parquet_id(parquet_url), dtype=pl.Int64).alias("parquet_id")
+        )
+        if self.partitions.enabled:
+            return self.write_partitions(dataframe, parquet_url)
         try:
             _res = dataframe.write_database(
                 table_name=self.index_table,
@@ -78,21 +112,73 @@ class IndexService(metaclass=SingletonMetaNoArgs):
             print(f"Error writing to database: {e}")
             raise
 
+    def write_partitions(self, dataframe: pl.DataFrame, parquet_url: str) -> int:
+        """
+        Write index rows to their partitions of the Postgres books index.
+
+        The `parquet_index` row of the file is inserted first, for the foreign key
+        of `parquet_id`. Rows are stamped with today's UTC ingest date, grouped by
+        the partition of their key value and inserted into each partition directly,
+        which is created first if missing. Everything is inserted in one transaction
+        skipping rows already present, so a retried write leaves no duplicates.
+
+        Args:
+            dataframe (pl.DataFrame): Index rows in the wide book schema with
+                `parquet_id`.
+            parquet_url (str): URL of the Parquet file holding the rows.
+
+        Returns:
+            int: The number of rows written.
+        """
+        from sqlalchemy import column, table
+        from sqlalchemy.dialects.postgresql import insert
+
+        from models.parquet import ParquetIndex
+
+        partitions = self.partitions
+        dataframe = dataframe.with_columns(
+            pl.lit(utc_today(), dtype=pl.Date).alias("ingest_date"),
+            pl.col("hash").reinterpret(signed=True),  # Postgres has no unsigned BIGINT
+        )
+        if dataframe.get_column(partitions.key).null_count():
+            raise ValueError(f"Index rows without {partitions.key} have no partition")
+        groups = dataframe.with_columns(
+            partitions.partition_start().alias("_start")
+        ).partition_by("_start", as_dict=True, include_key=False)
+        names = {start: partitions.ensure([start])[0] for (start,) in groups}
+        with partitions.engine.begin() as conn:
+            conn.execute(
+                insert(ParquetIndex)
+                .values(id=parquet_id(parquet_url), s3_url=parquet_url)
+                .on_conflict_do_nothing()
+            )
+            for (start,), rows in groups.items():
+                conn.execute(
+                    insert(
+                        table(names[start], *map(column, rows.columns))
+                    ).on_conflict_do_nothing(),
+                    rows.to_dicts(),
+                )
+        return dataframe.height
 
     @retry(wait=wait_fixed(1), stop=stop_after_attempt(7))
-    def swap_dataframe_to_sqlite(self, dataframe: pl.DataFrame, if_table_exists: str = "append", ) -> Any:
+    def swap_dataframe_to_sqlite(
+        self,
+        dataframe: pl.DataFrame,
+        if_table_exists: str = "append",
+    ) -> Any:
 
         _current_date = Instant.now().py_datetime().strftime("%Y%m%d")
-        _connection = f"sqlite:///{_current_date}_{str(os.getpid())}.sqlite"
+        _connection = f"sqlite:///{_current_date}_{os.getpid()!s}.sqlite"
 
         try:
-            _res = dataframe.write_database(
+            _res = to_book_schema(dataframe, compact=False).write_database(
                 table_name=self.index_table,
                 connection=_connection,
-                engine=self.index_engine, # 'adbc' or 'sqlite'
-                if_table_exists=if_table_exists, # 'append' or 'replace'
+                engine=self.index_engine,  # 'adbc' or 'sqlite'
+                if_table_exists=if_table_exists,  # 'append' or 'replace'
             )
             return _res
         except Exception as e:
             print(f"Error writing to database: {e}")
-            raise
\ No newline at end of file
+            raise
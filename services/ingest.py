@@ -0,0 +1,444 @@
+"""
+In-memory ingest buffers shared by the ingest endpoints.
+
+Validated frames are appended to the DataFrame kept in the application state
+under their dataset name, `dataframe_name` for the books. Once a buffer passes
+its dataset's dump size, or its fair share of the memory budget while all
+buffers are over it, it is detached, materialized to S3 and published in the
+dataset manifest. The local index and the distinct count sketches are kept
+for the books only.
+
+Under memory pressure buffers are spilled to local disk (see `services.spill`).
+The dump size counts spilled rows too, and a flush publishes the spilled
+chunks together with the buffer, oldest first.
+
+Upserts and deletes of books go through tombstones (see `services.tombstones`)
+and drop the matching rows from this worker's buffer and spilled chunks.
+
+Every flush, upsert and delete of books then schedules a background refresh of
+the latest record per ISBN view (see `services.latest`), which writes do not
+wait for.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from datetime import date
+
+from attrs import define, field
+from fastapi import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+
+from config import settings as global_settings
+from schemas.polars import to_book_schema
+from services.admission import AdmissionService
+from services.datasets import Dataset, DatasetRegistry
+from services.files import get_filename_generator_service
+from services.index import IndexService
+from services.latest import LatestViewService
+from services.manifest import DATASET_BUCKET, ManifestService
+from services.parquet import hide_deleted
+from services.s3_async import S3AsyncService
+from services.sketch import HyperLogLog
+from services.spill import SpillService
+from services.tombstones import TombstoneService
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+
+def remove_daily_parquet_file(file_path: str) -> bool:
+    """
+    Removes a daily Parquet file from the filesystem.
+
+    Args:
+        file_path (str): Path to the Parquet file to be removed.
+
+    Returns:
+        bool: True if the file was successfully removed or didn't exist, False if
+            removal failed.
+    """
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            logger.info(f"Successfully removed Parquet file: {file_path}")
+            return True
+        else:
+            logger.info(f"Parquet file not found for removal: {file_path}")
+            return True
+    except OSError as e:
+        logger.error(f"Error removing Parquet file {file_path}: {e}")
+        return False
+
+
+@define
+class BufferStats:
+    """
+    Cardinality of the buffer, updated on every append instead of scanning it.
+
+    Attributes:
+        isbn (HyperLogLog): Sketch of the distinct ISBNs.
+        author (HyperLogLog): Sketch of the distinct authors.
+        min_pub_date (date | None): Earliest publication date.
+        max_pub_date (date | None): Latest publication date.
+    """
+
+    isbn: HyperLogLog = field(factory=HyperLogLog)
+    author: HyperLogLog = field(factory=HyperLogLog)
+    min_pub_date: date | None = None
+    max_pub_date: date | None = None
+
+    def update(self, dataframe: pl.DataFrame) -> None:
+        self.isbn.update(dataframe.get_column("isbn"))
+        self.author.update(dataframe.get_column("author"))
+        pub_date = dataframe.get_column("pub_date")
+        self._extend_range(pub_date.min(), pub_date.max())
+
+    def merge(self, other: BufferStats) -> None:
+        self.isbn.merge(other.isbn)
+        self.author.merge(other.author)
+        self._extend_range(other.min_pub_date, other.max_pub_date)
+
+    def _extend_range(self, low: date | None, high: date | None) -> None:
+        if low is not None:
+            self.min_pub_date = (
+                low if self.min_pub_date is None else min(self.min_pub_date, low)
+            )
+        if high is not None:
+            self.max_pub_date = (
+                high if self.max_pub_date is None else max(self.max_pub_date, high)
+            )
+
+
+@define
+class IngestService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service appending frames to the dataset buffers and flushing them.
+
+    Attributes:
+        dataframe_name (str): Name of the application state attribute holding the books
+            buffer.
+    """
+
+    dataframe_name: str = global_settings.dataframe_name
+    _buffer_stats: BufferStats = field(init=False, factory=BufferStats)
+
+    @property
+    def datasets(self) -> DatasetRegistry:
+        return DatasetRegistry()
+
+    @property
+    def index(self) -> IndexService:
+        return IndexService()
+
+    @property
+    def manifest(self) -> ManifestService:
+        return ManifestService()
+
+    @property
+    def admission(self) -> AdmissionService:
+        return AdmissionService()
+
+    @property
+    def s3(self) -> S3AsyncService:
+        return S3AsyncService()
+
+    @property
+    def spill(self) -> SpillService:
+        return SpillService()
+
+    @property
+    def tombstones(self) -> TombstoneService:
+        return TombstoneService()
+
+    @property
+    def latest(self) -> LatestViewService:
+        return LatestViewService()
+
+    def buffered(self, app, dataset: Dataset | None = None) -> pl.DataFrame | None:
+        """
+        All rows of a dataset not flushed yet, spilled chunks memory-mapped.
+
+        Args:
+            app: The FastAPI application holding the buffer.
+            dataset (Dataset | None): The dataset, the books if omitted.
+
+        Returns:
+            pl.DataFrame | None: Spilled and in-memory rows in ingest order, None if
+                none.
+        """
+        dataset = dataset or self.datasets.books
+        return self.spill.combine(self.spill.chunks(dataset), dataset.buffer(app))
+
+    async def materialize(self, dataframe: pl.DataFrame, path: str) -> dict:
+        """
+        Upload a DataFrame over the shared async session and publish it in the manifest.
+
+        Args:
+            dataframe (pl.DataFrame): The DataFrame to be written.
+            path (str): The path of the file inside the dataset bucket.
+
+        Returns:
+            dict: The materialization result with the committed manifest version.
+        """
+        _res = await self.s3.materialize_dataframe(dataframe, path)
+        return await run_in_threadpool(self.manifest.register, _res, dataframe)
+
+    async def append(
+        self,
+        app,
+        dataframe: pl.DataFrame,
+        background_tasks: BackgroundTasks | None = None,
+        dataset: Dataset | None = None,
+    ) -> dict | None:
+        """
+        Append a frame in the dataset schema to its buffer.
+
+        Args:
+            app: The FastAPI application holding the buffer.
+            dataframe (pl.DataFrame): The validated frame to append.
+            background_tasks (BackgroundTasks | None): Defer the local index write to
+                after the response. Without it the index is written before returning,
+                which keeps memory flat for long streaming uploads.
+            dataset (Dataset | None): The target dataset, the books if omitted.
+
+        Returns:
+            dict | None: The materialization result if the append flushed this dataset.
+        """
+        dataset = dataset or self.datasets.books
+        if dataset.buffer(app) is None:
+            setattr(
+                app, dataset.name, pl.DataFrame(schema=dataset.schema)
+            )  # Initialize DataFrame in app state if not present
+        # Extend the existing DataFrame with new data
+        dataset.buffer(app).extend(dataframe)
+
+        if dataset.is_books:
+            self._buffer_stats.update(dataframe)
+        # The partitioned Postgres index is written at flush, once the
+        # file holding the rows exists
+        if dataset.is_books and not self.index.partitions.enabled:
+            # write index should catch dupes before writing to database
+            if background_tasks is not None:
+                background_tasks.add_task(
+                    self.admission.index_task(
+                        self.index.swap_dataframe_to_sqlite, dataframe=dataframe
+                    )
+                )
+            else:
+                await run_in_threadpool(self.index.swap_dataframe_to_sqlite, dataframe)
+
+        _res = None
+        if (
+            dataset.buffer_mb(app) + self.spill.spilled_mb(dataset)
+            > dataset.dump_size_mb
+        ):
+            _res = await self._flush_buffered(app, dataset)
+        # Over the shared budget, every buffer above its fair share is flushed
+        for victim in self.datasets.over_budget(app):
+            _flushed = await self._flush_buffered(app, victim)
+            if victim is dataset:
+                _res = _res or _flushed
+        await self.spill.maybe_spill(app)
+        return _res
+
+    async def _flush_buffered(self, app, dataset: Dataset) -> dict | None:
+        # The appended rows are buffered already, failing the request would make its
+        # retry buffer them twice. A failed flush keeps them for the next one instead.
+        try:
+            return await self.flush(app, dataset=dataset)
+        except Exception:
+            logger.exception(f"Failed to flush {dataset.name}, rows stay buffered")
+            return None
+
+    async def flush(
+        self, app, path: str | None = None, dataset: Dataset | None = None
+    ) -> dict | None:
+        """
+        Materialize a buffer to S3 and publish it in the manifest.
+
+        The buffer and its spilled chunks are detached before awaiting so concurrent
+        requests start a fresh one. On failure the detached rows are put back in front
+        of anything ingested or spilled meanwhile.
+
+        Args:
+            app: The FastAPI application holding the buffer.
+            path (str | None): Target path inside the dataset bucket, generated under
+                the dataset prefix if omitted.
+            dataset (Dataset | None): The dataset to flush, the books if omitted.
+
+        Returns:
+            dict | None: The materialization result, None if the buffer was empty.
+        """
+        dataset = dataset or self.datasets.books
+        _buffer = dataset.buffer(app)
+        if (_buffer is None or _buffer.is_empty()) and not self.spill.chunks(dataset):
+            return None
+        _file = path or dataset.path(
+            await get_filename_generator_service().generate_filename(
+                None if dataset.is_books else dataset.name
+            )
+        )  # Generate a filename for the dump
+        if _buffer is not None:
+            delattr(app, dataset.name)
+        _chunks = self.spill.detach(dataset)
+        _df = self.spill.combine(_chunks, _buffer)
+        if dataset.is_books:
+            _stats, self._buffer_stats = self._buffer_stats, BufferStats()
+        self.admission.flush_started()
+        try:
+            # Encode in the compute executor, upload to S3 and publish in the manifest
+            _res = await self.materialize(_df, _file)
+        except Exception:
+            self.spill.restore(dataset, _chunks)
+            if _buffer is not None:
+                if dataset.buffer(app) is not None:
+                    _buffer.extend(dataset.buffer(app))
+                setattr(app, dataset.name, _buffer)
+            if dataset.is_books:
+                self._buffer_stats.merge(_stats)
+            raise
+        finally:
+            self.admission.flush_finished()
+        self.spill.release(_chunks)
+        if not dataset.is_books:
+            return _res
+        self.latest.schedule({f"{DATASET_BUCKET}/{_res['path']}": _df})
+        remove_daily_parquet_file(
+            f"daily_{os.getpid()!s}.parquet"
+        )  # delete the persistence file from the local filesystem
+        if self.index.partitions.enabled:
+            await self.index_flushed(_df, f"s3://{DATASET_BUCKET}/{_res['path']}")
+        else:
+            self.index.swap_dataframe_to_sqlite(
+                pl.DataFrame(schema=dataset.schema), if_table_exists="replace"
+            )
+        return _res
+
+    async def index_flushed(self, dataframe: pl.DataFrame, parquet_url: str) -> None:
+        """
+        Write the rows of a published file to the partitioned Postgres books index.
+
+        The file is published already, so a failed index write is logged instead
+        of failing the flush.
+
+        Args:
+            dataframe (pl.DataFrame): The rows of the file.
+            parquet_url (str): URL of the file, registered in `parquet_index`.
+        """
+        try:
+            await run_in_threadpool(self.index.write_index, dataframe, parquet_url)
+        except Exception:
+            logger.exception(f"Books of {parquet_url} not indexed")
+
+    async def discard(self, app, isbns: list[str], hashes: list[int]) -> int:
+        """
+        Drop books from the buffer and its spilled chunks, so a later flush does not
+        bring them back under a newer version than their tombstone.
+
+        Args:
+            app: The FastAPI application holding the buffer.
+            isbns (list[str]): ISBNs of the rows to drop.
+            hashes (list[int]): Hashes of the rows to drop.
+
+        Returns:
+            int: The number of rows dropped.
+        """
+        _deleted = {"isbn": isbns, "hash": hashes}
+        _dropped = 0
+        _buffer = self.datasets.books.buffer(app)
+        if _buffer is not None and not _buffer.is_empty():
+            _kept = hide_deleted(_buffer, _deleted)
+            setattr(app, self.dataframe_name, _kept)
+            _dropped = _buffer.height - _kept.height
+        return _dropped + await self.spill.discard(self.datasets.books, _deleted)
+
+    async def upsert(self, app, dataframe: pl.DataFrame) -> dict:
+        """
+        Replace books by ISBN with the rows of a frame, without rewriting older files.
+
+        Args:
+            app: The FastAPI application holding the buffer.
+            dataframe (pl.DataFrame): The new rows in the book schema.
+
+        Returns:
+            dict: The materialization result with the tombstone path and the number
+                of buffered rows dropped.
+        """
+        _keys = to_book_schema(dataframe.select("isbn", "hash"), compact=False)
+        _discarded = await self.discard(
+            app, _keys.get_column("isbn").to_list(), _keys.get_column("hash").to_list()
+        )
+        _file = self.datasets.books.path(
+            await get_filename_generator_service().generate_filename()
+        )
+        _res = await run_in_threadpool(self.tombstones.upsert, dataframe, _file)
+        self.latest.schedule({f"{DATASET_BUCKET}/{_file}": dataframe})
+        return {**_res, "discarded": _discarded}
+
+    async def delete(self, app, isbns: list[str], hashes: list[int]) -> dict:
+        """
+        Delete books by ISBN or hash, without rewriting the files holding them.
+
+        Args:
+            app: The FastAPI application holding the buffer.
+            isbns (list[str]): ISBNs of the books to delete.
+            hashes (list[int]): Hashes of the books to delete.
+
+        Returns:
+            dict: The tombstone result and the number of buffered rows dropped.
+        """
+        _discarded = await self.discard(app, isbns, hashes)
+        _res = await run_in_threadpool(self.tombstones.delete, isbns, hashes)
+        self.latest.schedule()
+        return {**_res, "discarded": _discarded}
+
+    async def current_stats(self, app) -> dict:
+        """
+        Report size and cardinality of the buffer and of the current day.
+
+        The day combines this worker's buffer with every file flushed for the date
+        by any worker, merging their sketches instead of scanning data.
+
+        Args:
+            app: The FastAPI application holding the buffer and its `now` date.
+
+        Returns:
+            dict: Worker and day rows, distinct ISBNs and authors, and pub_date range.
+        """
+        _df = getattr(app, self.dataframe_name, None)
+        _stats = self._buffer_stats
+        books = self.datasets.books
+        worker = {
+            "pid": os.getpid(),
+            "rows": (_df.height if _df is not None else 0)
+            + self.spill.spilled_rows(books),
+            "size_mb": _df.estimated_size(unit="mb") if _df is not None else 0.0,
+            "spilled_mb": self.spill.spilled_mb(books),
+            "distinct_isbn": _stats.isbn.count(),
+            "distinct_author": _stats.author.count(),
+            "min_pub_date": _stats.min_pub_date,
+            "max_pub_date": _stats.max_pub_date,
+        }
+        _date = getattr(app, "now", None)
+        entries = await run_in_threadpool(self.manifest.active_entries, _date)
+        sketches = await run_in_threadpool(self.manifest.sketches, entries)
+        day_range = BufferStats(
+            min_pub_date=entries.get_column("min_pub_date").min(),
+            max_pub_date=entries.get_column("max_pub_date").max(),
+        )
+        day_range.merge(_stats)
+        day = {
+            "date": _date,
+            "files": entries.height,
+            "rows": entries.get_column("rows").sum() + worker["rows"],
+            "min_pub_date": day_range.min_pub_date,
+            "max_pub_date": day_range.max_pub_date,
+        }
+        for c, sketch in sketches.items():
+            own = getattr(_stats, c)
+            day[f"distinct_{c}"] = (sketch.merge(own) if sketch else own).count()
+        return {"worker": worker, "day": day}
@@ -0,0 +1,681 @@
+"""
+Latest record per ISBN, maintained as a materialized view of the books.
+
+The view keeps one row per ISBN: the row of the newest manifest version and,
+within one file, the last one. Its rows are split into contiguous ranges of
+`isbn_key`, a stable 64-bit hash of the ISBN, and every range is a Parquet file
+sorted by key under `latest_view_prefix`. A point read opens the one range
+holding the key, a range read of ISBNs skips ranges by their min/max ISBN.
+
+The view is built on startup and refreshed in the background after every flush,
+upsert and delete, by one refresher task per worker that folds whatever was
+committed meanwhile in one go, so writers never wait for it. A refresh folds
+the files and tombstones committed to the manifest since the version the view
+was built at. New rows are routed to their ranges and merged with the stored
+ones, and only the ranges they touch are rewritten. A range past
+`latest_view_range_rows` is split at key quantiles. Compaction output is not
+folded, its rows came with the files it replaced. Deletes by hash cannot be
+routed, they read every range and rewrite the ones holding the hash.
+
+The ranges and the folded manifest version are published as versioned JSON
+states with an exclusive put, like the manifest, so workers refreshing at the
+same time retry on top of the winner. Replaced range files stay readable for
+`compaction_retention_seconds`. A missing view, or one whose files to fold were
+already purged, is rebuilt from the active files, where compacted rows keep
+the version of the file they were flushed in (`SOURCE_VERSION`).
+
+A delete by hash of the latest record of a book drops the book from the view,
+its older records in the dataset only come back with a rebuild.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import logging
+from threading import Lock
+from uuid import uuid4
+
+from attrs import define, field
+from starlette.concurrency import run_in_threadpool
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random
+from whenever import Instant
+
+from config import ParquetWriteProfile
+from config import settings as global_settings
+from schemas.polars import (
+    latest_range_schema,
+    latest_schema,
+    to_book_schema,
+    tombstone_schema,
+    wide_book_schema,
+)
+from services.cache import ObjectCache
+from services.changes import flush_position
+from services.manifest import ACTIVE, DATA, TOMBSTONE, ManifestService
+from services.parquet import SOURCE_VERSION, scan_books_wide, write_parquet
+from services.s3 import S3Service
+from services.tombstones import KEY_COLUMNS, TombstoneService
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+KEY_MULTIPLIER = 0x9E3779B97F4A7C15  # 2**64 divided by the golden ratio
+RANGE_PROFILE = ParquetWriteProfile(
+    compression="zstd",
+    compression_level=3,
+    row_group_size=8_192,
+    sort_by=["key"],
+)
+
+
+# Rows of just published files handed to the refresher at most, it reads back the rest
+PENDING_ROWS = 500_000
+
+
+class ViewConflictError(Exception):
+    """Another worker committed the same view state version first."""
+
+
+def isbn_key(isbn: pl.Expr) -> pl.Expr:
+    """
+    Hash ISBNs to the key the view is ranged by.
+
+    The digits are multiplied by an odd constant modulo 2**64, which is stable
+    across Polars releases and spreads neighbouring ISBNs over the key space.
+    Values without digits get key 0.
+    """
+    digits = isbn.str.replace_all(r"\D", "").cast(pl.UInt64, strict=False).fill_null(0)
+    return digits * pl.lit(KEY_MULTIPLIER, dtype=pl.UInt64)
+
+
+def latest_rows(frame: pl.DataFrame) -> pl.DataFrame:
+    """
+    Keep the row of the newest version per ISBN, the last one among equal versions.
+    """
+    return frame.sort("version", maintain_order=True).unique(
+        "isbn", keep="last", maintain_order=True
+    )
+
+
+def drop_deleted(frame: pl.DataFrame, tombstones: pl.DataFrame) -> pl.DataFrame:
+    """
+    Drop the rows older than a tombstone of their ISBN or hash.
+
+    Args:
+        frame (pl.DataFrame): Rows in `latest_schema()`.
+        tombstones (pl.DataFrame): Tombstone keys with the `version` that added them.
+
+    Returns:
+        pl.DataFrame: The rows no tombstone deletes.
+    """
+    for column in KEY_COLUMNS:
+        newest = (
+            tombstones.drop_nulls(column)
+            .group_by(column)
+            .agg(pl.col("version").max().alias("deleted_at"))
+        )
+        if newest.height:
+            # The rows of an upsert share the version of its tombstone and stay
+            frame = (
+                frame.join(newest, on=column, how="left")
+                .filter(
+                    pl.col("deleted_at").is_null()
+                    | (pl.col("version") >= pl.col("deleted_at"))
+                )
+                .drop("deleted_at")
+            )
+    return frame
+
+
+def conform(frame: pl.DataFrame, version: int) -> pl.DataFrame:
+    """
+    Cast book rows to `latest_schema()`, tagged with the version of their file.
+
+    Rows of compacted files are tagged with their `SOURCE_VERSION` instead.
+
+    Args:
+        frame (pl.DataFrame): Rows in either book schema, book columns may be missing.
+        version (int): Manifest version that added the file.
+
+    Returns:
+        pl.DataFrame: The rows with `version` and `key`, rows without an ISBN dropped.
+    """
+    frame = to_book_schema(frame, compact=False).filter(pl.col("isbn").is_not_null())
+    source = pl.lit(version, dtype=pl.Int64)
+    if SOURCE_VERSION in frame.columns:
+        source = pl.col(SOURCE_VERSION).cast(pl.Int64).fill_null(source)
+    return frame.select(
+        *[
+            pl.col(name) if name in frame.columns else pl.lit(None, dtype).alias(name)
+            for name, dtype in wide_book_schema().items()
+        ],
+        source.alias("version"),
+        isbn_key(pl.col("isbn")).alias("key"),
+    )
+
+
+@define(frozen=True)
+class ViewState:
+    """
+    A committed state of the view.
+
+    Attributes:
+        version (int): Version of this state.
+        source_version (int): Manifest version the view was built at.
+        ranges (pl.DataFrame): Key ranges covering the key space, in
+            `latest_range_schema()`.
+        removed (list[dict]): Replaced range files with their `removed_at` timestamp.
+    """
+
+    version: int = 0
+    source_version: int = 0
+    ranges: pl.DataFrame = field(
+        factory=lambda: pl.DataFrame(
+            [{"start": 0, "rows": 0, "bytes": 0}], schema=latest_range_schema()
+        )
+    )
+    removed: list[dict] = field(factory=list)
+
+    def encode(self) -> bytes:
+        return json.dumps(
+            {
+                "version": self.version,
+                "source_version": self.source_version,
+                "ranges": self.ranges.to_dicts(),
+                "removed": self.removed,
+            }
+        ).encode()
+
+    @classmethod
+    def decode(cls, data: bytes) -> ViewState:
+        payload = json.loads(data)
+        return cls(
+            version=payload["version"],
+            source_version=payload["source_version"],
+            ranges=pl.DataFrame(payload["ranges"], schema=latest_range_schema()),
+            removed=payload["removed"],
+        )
+
+
+@define
+class LatestViewService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service maintaining and reading the latest record per ISBN view.
+
+    Attributes:
+        enabled (bool): Refresh the view after flushes, upserts and deletes.
+        prefix (str): S3 prefix holding the view states and range files.
+        range_rows (int): Rows above which a range is split.
+        keep_states (int): Number of superseded states kept in S3.
+        retention_seconds (int): Seconds replaced range files stay readable.
+    """
+
+    enabled: bool = global_settings.latest_view_enabled
+    prefix: str = global_settings.latest_view_prefix
+    range_rows: int = global_settings.latest_view_range_rows
+    keep_states: int = global_settings.manifest_keep_snapshots
+    retention_seconds: int = global_settings.compaction_retention_seconds
+    _refresh_lock: Lock = field(init=False, factory=Lock)
+    _cache_lock: Lock = field(init=False, factory=Lock)
+    _cached: ViewState = field(init=False, factory=ViewState)
+    _pending: dict[str, pl.DataFrame] = field(init=False, factory=dict)
+    _wakeup: asyncio.Event | None = field(init=False, default=None)
+    _task: asyncio.Task | None = field(init=False, default=None)
+
+    @property
+    def manifest(self) -> ManifestService:
+        return ManifestService()
+
+    @property
+    def tombstones(self) -> TombstoneService:
+        return TombstoneService()
+
+    @property
+    def cache(self) -> ObjectCache:
+        return ObjectCache()
+
+    @property
+    def s3(self) -> S3Service:
+        return S3Service()
+
+    def _state_path(self, version: int) -> str:
+        return f"{self.prefix}/state_{version:010}.json"
+
+    @property
+    def _pointer_path(self) -> str:
+        return f"{self.prefix}/_current"
+
+    def latest_version(self) -> int:
+        """
+        Resolve the newest committed view state version.
+
+        Returns:
+            int: The latest version, 0 when the view was never built.
+        """
+        try:
+            version = int(self.s3.read_bytes(self._pointer_path))
+        except FileNotFoundError:
+            version = 0
+        # A worker may have committed a state without moving the pointer yet
+        while self.s3.parquet_file_exists(self._state_path(version + 1)):
+            version += 1
+        return version
+
+    def state(self) -> ViewState:
+        """
+        Load the latest view state, reusing the cached one if unchanged.
+
+        Returns:
+            ViewState: The state, empty when the view was never built.
+        """
+        version = self.latest_version()
+        with self._cache_lock:
+            if self._cached.version == version:
+                return self._cached
+        state = ViewState.decode(self.s3.read_bytes(self._state_path(version)))
+        with self._cache_lock:
+            if version > self._cached.version:
+                self._cached = state
+        return state
+
+    def refresh(self, frames: dict[str, pl.DataFrame] | None = None) -> dict | None:
+        """
+        Fold the files and tombstones committed since the view was built.
+
+        Args:
+            frames (dict[str, pl.DataFrame] | None): Rows of files just published, by
+                catalog path, which saves reading them back.
+
+        Returns:
+            dict | None: State and manifest versions and the ranges rewritten, None
+                if the view is disabled or up to date.
+        """
+        if not self.enabled:
+            return None
+        with self._refresh_lock:
+            try:
+                return self._refresh(frames or {})
+            except FileNotFoundError as e:
+                # A file to fold outlived its retention, refold the active ones
+                logger.warning(f"Rebuilding the latest record view: {e}")
+                return self._refresh({}, rebuild=True)
+
+    def schedule(self, frames: dict[str, pl.DataFrame] | None = None) -> None:
+        """
+        Ask the background refresher to fold the latest commits.
+
+        Without a running refresher nothing happens, the next refresh folds the
+        commits from the manifest all the same.
+
+        Args:
+            frames (dict[str, pl.DataFrame] | None): Rows of files just published, by
+                catalog path, kept for the refresher up to `PENDING_ROWS` rows.
+        """
+        if self._task is None:
+            return
+        pending = sum(frame.height for frame in self._pending.values())
+        for path, frame in (frames or {}).items():
+            if pending + frame.height <= PENDING_ROWS:
+                self._pending[path] = frame
+                pending += frame.height
+        self._wakeup.set()
+
+    async def run_forever(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._task is None:
+                return
+            frames, self._pending = self._pending, {}
+            try:
+                await run_in_threadpool(self.refresh, frames)
+            except Exception as e:
+                # The next refresh folds what this one missed
+                logger.warning(f"Latest record view not refreshed: {e}", exc_info=True)
+
+    def start(self) -> None:
+        """
+        Start the background refresher of this worker on the running event loop.
+        """
+        if self.enabled and self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        """
+        Stop the background refresher once its running refresh is written.
+
+        Cancelling would leave the refresh thread writing the view after shutdown.
+        """
+        if self._task is not None:
+            task, self._task = self._task, None
+            self._wakeup.set()
+            await task
+
+    def rebuild(self) -> dict | None:
+        """
+        Rebuild the view from the active files of the dataset.
+
+        Returns:
+            dict | None: State and manifest versions and the ranges written.
+        """
+        with self._refresh_lock:
+            return self._refresh({}, rebuild=True)
+
+    @retry(
+        retry=retry_if_exception_type(ViewConflictError),
+        wait=wait_random(0.05, 0.5),
+        stop=stop_after_attempt(10),
+        reraise=True,
+    )
+    def _refresh(
+        self, frames: dict[str, pl.DataFrame], rebuild: bool = False
+    ) -> dict | None:
+        state = self.state()
+        source_version, catalog = self.manifest.snapshot()
+        if not rebuild and source_version <= state.source_version:
+            return None
+        catalog = catalog.filter(pl.col("dataset") == global_settings.dataframe_name)
+        if rebuild or not state.source_version:
+            ranges = ViewState().ranges
+            rows = self._read_active(catalog)
+            tombstones = pl.DataFrame(
+                schema={**tombstone_schema(), "version": pl.Int64}
+            )
+            replaced = state.ranges.get_column("path").drop_nulls().to_list()
+        else:
+            ranges = state.ranges
+            new = catalog.filter(pl.col("version") > state.source_version)
+            rows = self._read_new(new.filter(pl.col("kind") == DATA), frames)
+            tombstones = self._read_tombstones(new.filter(pl.col("kind") == TOMBSTONE))
+            replaced = []
+        ranges, written, rewritten = self._fold(ranges, rows, tombstones)
+        committed = self._commit(
+            state, ranges, source_version, replaced + rewritten, written
+        )
+        logger.info(
+            f"Latest record view {committed.version} folded manifest {source_version}, "
+            f"{len(written)} ranges written"
+        )
+        return {
+            "version": committed.version,
+            "source_version": source_version,
+            "ranges_written": len(written),
+            "ranges": committed.ranges.height,
+        }
+
+    def _read_new(
+        self, entries: pl.DataFrame, frames: dict[str, pl.DataFrame]
+    ) -> pl.DataFrame:
+        # Removed files are still readable and their rows may not be folded yet
+        parts = [
+            conform(
+                frames[path]
+                if path in frames
+                else pl.read_parquet(self.s3.read_bytes(path)),
+                version,
+            )
+            for path, version in entries.sort("version")
+            .select("path", "version")
+            .iter_rows()
+            if flush_position(path) is not None
+        ]
+        return pl.concat(parts) if parts else pl.DataFrame(schema=latest_schema())
+
+    def _read_active(self, catalog: pl.DataFrame) -> pl.DataFrame:
+        entries = catalog.filter(
+            (pl.col("kind") == DATA) & (pl.col("status") == ACTIVE)
+        ).sort(pl.col("version").fill_null(0))
+        if entries.is_empty():
+            return pl.DataFrame(schema=latest_schema())
+        paths = self.cache.local_paths(entries.get_column("path").to_list())
+        deleted = self.tombstones.deleted_keys(entries)
+        return pl.concat(
+            [
+                conform(
+                    scan_books_wide(
+                        [path], self.s3.storage_options, [keys], source_versions=True
+                    ).collect(),
+                    version or 0,
+                )
+                for path, keys, version in zip(
+                    paths, deleted, entries.get_column("version")
+                )
+            ]
+        )
+
+    def _read_tombstones(self, entries: pl.DataFrame) -> pl.DataFrame:
+        parts = [
+            pl.read_parquet(self.s3.read_bytes(path)).with_columns(
+                pl.lit(version, dtype=pl.Int64).alias("version")
+            )
+            for path, version in entries.select("path", "version").iter_rows()
+        ]
+        return pl.concat(
+            parts or [pl.DataFrame(schema={**tombstone_schema(), "version": pl.Int64})]
+        )
+
+    def _read_range(self, path: str | None) -> pl.DataFrame:
+        if path is None:
+            return pl.DataFrame(schema=latest_schema())
+        return (
+            self.cache.read_parquet(path)
+            .select(latest_schema().names())
+            .cast(latest_schema())
+        )
+
+    def _fold(
+        self, ranges: pl.DataFrame, rows: pl.DataFrame, tombstones: pl.DataFrame
+    ) -> tuple[pl.DataFrame, list[str], list[str]]:
+        rows = latest_rows(rows)
+        starts = ranges.get_column("start")
+        touched = set(
+            (starts.search_sorted(rows.get_column("key"), side="right") - 1).to_list()
+        )
+        deleted_isbns = pl.DataFrame(
+            {"isbn": tombstones.get_column("isbn").drop_nulls()}
+        )
+        keys = deleted_isbns.select(isbn_key(pl.col("isbn"))).to_series()
+        touched |= set((starts.search_sorted(keys, side="right") - 1).to_list())
+        if tombstones.get_column("hash").drop_nulls().len():
+            touched |= {i for i, path in enumerate(ranges.get_column("path")) if path}
+
+        folded, written, rewritten = [], [], []
+        for i, entry in enumerate(ranges.iter_rows(named=True)):
+            if i not in touched:
+                folded.append(entry)
+                continue
+            in_range = pl.col("key") >= entry["start"]
+            if i + 1 < ranges.height:
+                in_range &= pl.col("key") < starts[i + 1]
+            added = rows.filter(in_range)
+            current = self._read_range(entry["path"])
+            merged = drop_deleted(latest_rows(pl.concat([current, added])), tombstones)
+            if added.is_empty() and merged.height == current.height:
+                folded.append(entry)  # A hash delete that matched nothing here
+                continue
+            for start, piece in self._split(entry["start"], merged.sort("key")):
+                folded.append(self._write_range(start, piece))
+                if folded[-1]["path"]:
+                    written.append(folded[-1]["path"])
+            if entry["path"]:
+                rewritten.append(entry["path"])
+        return pl.DataFrame(folded, schema=latest_range_schema()), written, rewritten
+
+    def _split(self, start: int, frame: pl.DataFrame) -> list[tuple[int, pl.DataFrame]]:
+        if frame.height <= self.range_rows:
+            return [(start, frame)]
+        # Pieces start half full, so the next rows do not split them again right away
+        count = -(-frame.height // max(self.range_rows // 2, 1))
+        keys = frame.get_column("key")
+        bounds = sorted(
+            {start, *(keys[frame.height * i // count] for i in range(1, count))}
+        )
+        pieces = []
+        for low, high in zip(bounds, [*bounds[1:], None]):
+            in_piece = pl.col("key") >= low
+            if high is not None:
+                in_piece &= pl.col("key") < high
+            pieces.append((low, frame.filter(in_piece)))
+        return pieces
+
+    def _write_range(self, start: int, frame: pl.DataFrame) -> dict:
+        if frame.is_empty():
+            return {"start": start, "path": None, "rows": 0, "bytes": 0}
+        path = f"{self.prefix}/ranges/{start:016x}_{uuid4().hex}.parquet"
+        buffer = io.BytesIO()
+        write_parquet(frame, buffer, RANGE_PROFILE)
+        self.s3.write_bytes(path, buffer.getvalue())
+        return {
+            "start": start,
+            "path": path,
+            "rows": frame.height,
+            "bytes": len(buffer.getvalue()),
+            "min_isbn": frame.get_column("isbn").min(),
+            "max_isbn": frame.get_column("isbn").max(),
+        }
+
+    def _commit(
+        self,
+        state: ViewState,
+        ranges: pl.DataFrame,
+        source_version: int,
+        replaced: list[str],
+        written: list[str],
+    ) -> ViewState:
+        now = Instant.now().py_datetime().timestamp()
+        cutoff = now - self.retention_seconds
+        expired = [r["path"] for r in state.removed if r["removed_at"] <= cutoff]
+        committed = ViewState(
+            version=state.version + 1,
+            source_version=source_version,
+            ranges=ranges,
+            removed=[r for r in state.removed if r["removed_at"] > cutoff]
+            + [{"path": path, "removed_at": now} for path in replaced],
+        )
+        try:
+            self.s3.write_bytes(
+                self._state_path(committed.version), committed.encode(), exclusive=True
+            )
+        except Exception as e:
+            for path in written:
+                self._delete(path)
+            if isinstance(e, FileExistsError):
+                raise ViewConflictError(
+                    f"View state {committed.version} already committed"
+                ) from e
+            raise
+        self.s3.write_bytes(self._pointer_path, str(committed.version).encode())
+        with self._cache_lock:
+            if committed.version > self._cached.version:
+                self._cached = committed
+        for path in expired:
+            self._delete(path)
+        if committed.version - self.keep_states >= 1:
+            self._delete(self._state_path(committed.version - self.keep_states))
+        return committed
+
+    def _delete(self, path: str) -> None:
+        try:
+            self.s3.delete_parquet_file(path)
+        except FileNotFoundError:
+            pass
+
+    def _scan_range(self, path: str) -> pl.LazyFrame:
+        local = self.cache.local_paths([path])[0]
+        if local.endswith(".arrow"):
+            return pl.scan_ipc(local, memory_map=True)
+        # Row groups whose key statistics cannot match are skipped
+        return pl.scan_parquet(local, storage_options=self.s3.storage_options)
+
+    def get(self, isbn: str) -> dict | None:
+        """
+        Read the latest record of a book.
+
+        Args:
+            isbn (str): The ISBN of the book.
+
+        Returns:
+            dict | None: The record with the manifest `version` it came from, None if
+                the view holds no record of the ISBN.
+        """
+        state = self.state()
+        key = pl.select(isbn_key(pl.lit(isbn))).item()
+        path = state.ranges.get_column("path")[
+            state.ranges.get_column("start").search_sorted(key, side="right") - 1
+        ]
+        if path is None:
+            return None
+        found = (
+            self._scan_range(path)
+            .filter((pl.col("key") == key) & (pl.col("isbn") == isbn))
+            .drop("key")
+            .collect()
+        )
+        return found.row(0, named=True) if found.height else None
+
+    def scan(
+        self,
+        start: str | None = None,
+        end: str | None = None,
+        after: str | None = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """
+        Read the latest records of a range of ISBNs, in ISBN order.
+
+        Args:
+            start (str | None): Inclusive lower bound of the ISBNs.
+            end (str | None): Exclusive upper bound of the ISBNs.
+            after (str | None): Exclusive lower bound, the last ISBN of the previous
+                page.
+            limit (int): Maximum number of records returned.
+
+        Returns:
+            list[dict]: The records with the manifest `version` they came from.
+        """
+        ranges = self.state().ranges.filter(pl.col("path").is_not_null())
+        predicate = pl.lit(True)
+        for low, inclusive in ((start, True), (after, False)):
+            if low is not None:
+                ranges = ranges.filter(pl.col("max_isbn") >= low)
+                predicate &= (
+                    pl.col("isbn") >= low if inclusive else pl.col("isbn") > low
+                )
+        if end is not None:
+            ranges = ranges.filter(pl.col("min_isbn") < end)
+            predicate &= pl.col("isbn") < end
+        if ranges.is_empty():
+            return []
+        return (
+            pl.concat([self._scan_range(p) for p in ranges.get_column("path")])
+            .filter(predicate)
+            .drop("key")
+            .sort("isbn")
+            .head(limit)
+            .collect()
+            .to_dicts()
+        )
+
+    def stats(self) -> dict:
+        """
+        Report the size of the view and how far it lags behind the manifest.
+
+        Returns:
+            dict: State and manifest versions, ranges, rows and bytes.
+        """
+        state = self.state()
+        return {
+            "enabled": self.enabled,
+            "version": state.version,
+            "source_version": state.source_version,
+            "manifest_version": self.manifest.latest_version(),
+            "ranges": state.ranges.height,
+            "rows": state.ranges.get_column("rows").sum(),
+            "bytes": state.ranges.get_column("bytes").sum(),
+            "replaced_files": len(state.removed),
+        }
@@ -0,0 +1,164 @@
+"""
+Logging handlers, filters and formatters referenced by the logging configs.
+
+In production (`logging-granian.json`) every logger goes through a
+`QueueHandler`: the request thread only merges the message and enqueues the
+record, and a listener thread formats it as one compact JSON line and writes it
+to stderr. High-volume loggers are rate limited before anything is enqueued.
+
+Rich console output is for development only (`logging-granian-dev.json`), and
+rich is imported only when that config builds its handlers.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import threading
+import time
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    A QueueHandler that keeps the traceback and dict arguments of a record apart.
+
+    The stock handler formats the traceback into the message. Here it goes to
+    `exc_text`, so the JSON formatter can emit it as its own field. Dict arguments
+    such as Granian's access log atoms are kept as `fields`.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.fields = record.args
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(
+                traceback.format_exception(*record.exc_info)
+            ).rstrip()
+        record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+class StartedQueueListener(QueueListener):
+    """
+    A QueueListener that starts with the logging config and stops at exit.
+
+    `dictConfig` builds the listener of a QueueHandler but leaves it stopped.
+    """
+
+    def __init__(self, queue, *handlers, respect_handler_level: bool = False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self.start()
+        atexit.register(self.stop)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as compact single-line JSON.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        if fields := getattr(record, "fields", None):
+            entry["fields"] = fields
+        if dropped := getattr(record, "dropped", None):
+            entry["dropped"] = dropped
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per logger for high-volume loggers.
+
+    Records of a limited logger above its rate are dropped, warnings and errors
+    always pass. The next record that passes carries the number dropped since
+    the previous one as `dropped`.
+
+    Attributes:
+        limits (dict[str, float]): Records per second allowed per logger name, a
+            logger is limited by its nearest configured ancestor.
+        burst_seconds (float): Seconds of records a logger may emit in a burst.
+    """
+
+    def __init__(
+        self, limits: dict[str, float] | None = None, burst_seconds: float = 1.0
+    ):
+        super().__init__()
+        self.limits = limits or {}
+        self.burst_seconds = burst_seconds
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._dropped: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _limit(self, name: str) -> tuple[str, float] | None:
+        while name:
+            if name in self.limits:
+                return name, self.limits[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not (limit := self._limit(record.name)):
+            return True
+        name, rate = limit
+        now = time.monotonic()
+        capacity = max(1.0, rate * self.burst_seconds)
+        with self._lock:
+            tokens, updated = self._buckets.get(name, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[name] = (tokens, now)
+                self._dropped[name] = self._dropped.get(name, 0) + 1
+                return False
+            self._buckets[name] = (tokens - 1, now)
+            if dropped := self._dropped.pop(name, 0):
+                record.dropped = dropped
+        return True
+
+
+def rich_handler(
+    width: int = 200, style: str | None = None, **kwargs
+) -> logging.Handler:
+    """
+    Build a Rich console handler writing to stderr, for the development config.
+
+    Args:
+        width (int): Console width.
+        style (str | None): Rich style of the whole output.
+        **kwargs: Passed to `rich.logging.RichHandler`.
+
+    Returns:
+        logging.Handler: The Rich handler.
+    """
+    from rich.console import Console
+    from rich.logging import RichHandler
+
+    return RichHandler(
+        console=Console(color_system="256", width=width, style=style, stderr=True),
+        **kwargs,
+    )
+
+
+def stop_listeners() -> None:
+    """
+    Drain and stop the queue listeners of the configured handlers.
+    """
+    for name in logging.getHandlerNames():
+        handler = logging.getHandlerByName(name)
+        if isinstance(listener := getattr(handler, "listener", None), QueueListener):
+            listener.stop()
@@ -0,0 +1,643 @@
+"""
+Dataset manifest published as versioned Parquet files in S3.
+
+The manifest lists the Parquet files that make up the dataset. Every commit is
+an append-only delta, `delta_{version}.parquet`, holding the entries it adds
+and the paths it removes or purges. It is written with an exclusive put, so
+concurrent writers never overwrite each other and a loser retries on top of
+the winner. Every `manifest_checkpoint_interval` versions the committer also
+writes the full manifest as `snapshot_{version}.parquet`, and `_latest` points
+readers at the newest version and checkpoint. A reader loads a checkpoint once
+and then only applies the deltas committed since, caching the result per
+version, and checks S3 for newer versions at most every
+`manifest_refresh_interval_ms`. Deltas and checkpoints further behind than the
+previous checkpoint and `manifest_keep_snapshots` versions are deleted.
+
+Versions of older releases were full snapshots with a bare version in
+`_latest`, and are read as checkpoints. All workers sharing a manifest have to
+run a release with the same format.
+
+Files replaced by compaction stay listed as removed until the retention window
+passes, which lets readers holding an older snapshot finish before the objects
+are deleted.
+
+The manifest doubles as the file catalog. Every entry carries row count, byte
+size, writer pid, the manifest version that added it and min/max of the book
+columns, so queries, merges, stats and the change feed are planned without S3
+LIST calls. LIST is only used by `reconcile`.
+
+Entries are data files or tombstones (see `services.tombstones`), told apart by
+`kind`. Readers scan the data files and hide the rows the tombstones delete.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import re
+import time
+from threading import Lock
+
+from attrs import define, field
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_delay,
+    wait_random_exponential,
+)
+from whenever import Instant
+
+from config import settings as global_settings
+from schemas.polars import manifest_schema, to_book_schema
+from services.datasets import DatasetRegistry
+from services.postings import index_frame
+from services.s3 import S3Service
+from services.sketch import HyperLogLog
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+DATASET_BUCKET = "daily"
+ACTIVE = "active"
+REMOVED = "removed"
+DATA = "data"
+TOMBSTONE = "tombstone"
+STAT_COLUMNS = ("isbn", "pages", "pub_date", "hash")
+SKETCH_COLUMNS = ("isbn", "author")
+# Delta rows are manifest entries tagged with the change they make
+ADD = "add"
+REMOVE = "remove"
+PURGE = "purge"
+
+
+class ManifestConflictError(Exception):
+    """Another writer committed the same manifest version first."""
+
+
+class ManifestStaleError(Exception):
+    """The snapshot a commit was planned on changed in a way that invalidates it."""
+
+
+def date_of(path: str) -> str | None:
+    """
+    Extract the 'YYYYMMDD' partition from a dataset file path.
+
+    Args:
+        path (str): The S3 path of the file.
+
+    Returns:
+        str | None: The date partition or None for files outside a date prefix.
+    """
+    match = re.search(r"(?:^|/)(\d{8})/", path)
+    return match.group(1) if match else None
+
+
+def file_stats(dataframe: pl.DataFrame) -> dict:
+    """
+    Compute the catalog statistics of a frame about to be written.
+
+    Args:
+        dataframe (pl.DataFrame): The frame in either book schema.
+
+    Returns:
+        dict: Writer pid and min/max of the book columns present in the frame.
+    """
+    frame = to_book_schema(dataframe, compact=False)
+    columns = [c for c in STAT_COLUMNS if c in frame.columns]
+    stats = {}
+    if columns and frame.height:
+        stats = frame.select(
+            *[pl.col(c).min().alias(f"min_{c}") for c in columns],
+            *[pl.col(c).max().alias(f"max_{c}") for c in columns],
+        ).row(0, named=True)
+    pids = frame.get_column("pid").unique() if "pid" in frame.columns else []
+    stats["pid"] = pids[0] if len(pids) == 1 else None
+    for c in SKETCH_COLUMNS:
+        if c in frame.columns:
+            stats[f"hll_{c}"] = HyperLogLog.from_series(frame.get_column(c)).to_bytes()
+    return stats
+
+
+def conform_entries(frame: pl.DataFrame) -> pl.DataFrame:
+    """
+    Cast manifest entries read from S3 to `manifest_schema()`.
+
+    Entries written before a catalog column existed get it as nulls, files
+    cataloged before named datasets belong to the books and entries cataloged
+    before tombstones are data files.
+    """
+    return frame.select(
+        pl.col(name) if name in frame.columns else pl.lit(None, dtype).alias(name)
+        for name, dtype in manifest_schema().items()
+    ).with_columns(
+        pl.col("dataset").fill_null(global_settings.dataframe_name),
+        pl.col("kind").fill_null(DATA),
+    )
+
+
+def apply_delta(frame: pl.DataFrame, delta: pl.DataFrame) -> pl.DataFrame:
+    """
+    Apply the changes of one commit to the manifest entries before it.
+
+    Args:
+        frame (pl.DataFrame): The entries at the previous version.
+        delta (pl.DataFrame): The delta of the commit, entries with their `op`.
+
+    Returns:
+        pl.DataFrame: The entries at the version of the delta.
+    """
+    removed = delta.filter(pl.col("op") == REMOVE)
+    if removed.height:
+        # A commit removes its paths at one timestamp
+        marked = pl.col("path").is_in(removed.get_column("path"))
+        frame = frame.with_columns(
+            pl.when(marked).then(pl.lit(REMOVED)).otherwise("status").alias("status"),
+            pl.when(marked)
+            .then(
+                pl.lit(
+                    removed.get_column("removed_at")[0],
+                    dtype=manifest_schema()["removed_at"],
+                )
+            )
+            .otherwise("removed_at")
+            .alias("removed_at"),
+        )
+    purged = delta.filter(pl.col("op") == PURGE).get_column("path")
+    if purged.len():
+        frame = frame.filter(~pl.col("path").is_in(purged))
+    added = delta.filter(pl.col("op") == ADD)
+    if added.height:
+        frame = pl.concat([frame, conform_entries(added)])
+    return frame
+
+
+def merge_stats(entries: pl.DataFrame) -> dict:
+    """
+    Combine the catalog statistics of files merged into one.
+
+    Args:
+        entries (pl.DataFrame): Manifest entries of the merged files.
+
+    Returns:
+        dict: Row count, writer pid, min/max of the book columns and merged sketches.
+    """
+    stats = entries.select(
+        pl.col("rows").sum(),
+        pl.when(pl.col("pid").n_unique() == 1).then(pl.col("pid").first()).alias("pid"),
+        *[pl.col(f"min_{c}").min() for c in STAT_COLUMNS],
+        *[pl.col(f"max_{c}").max() for c in STAT_COLUMNS],
+    ).row(0, named=True)
+    for c in SKETCH_COLUMNS:
+        sketches = entries.get_column(f"hll_{c}")
+        # A file without a sketch would make the merged one undercount
+        stats[f"hll_{c}"] = (
+            None if sketches.null_count() else HyperLogLog.union(sketches).to_bytes()
+        )
+    return stats
+
+
+@define
+class ManifestService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service reading and committing dataset manifest versions.
+
+    Attributes:
+        prefix (str): S3 prefix holding the deltas, checkpoints and the `_latest`
+            pointer.
+        keep_snapshots (int): Versions kept in S3 behind the previous checkpoint.
+        checkpoint_interval (int): Versions between checkpoints.
+        refresh_interval_ms (int): Milliseconds the cached manifest is served without
+            checking S3 for newer versions.
+    """
+
+    prefix: str = global_settings.manifest_prefix
+    keep_snapshots: int = global_settings.manifest_keep_snapshots
+    checkpoint_interval: int = global_settings.manifest_checkpoint_interval
+    refresh_interval_ms: int = global_settings.manifest_refresh_interval_ms
+    _cache_lock: Lock = field(init=False, factory=Lock)
+    _cached: tuple[int, pl.DataFrame] = field(
+        init=False, factory=lambda: (0, pl.DataFrame(schema=manifest_schema()))
+    )
+    _checkpoint: int = field(init=False, default=0)
+    _checked_at: float = field(init=False, default=float("-inf"))
+
+    @property
+    def s3(self) -> S3Service:
+        return S3Service()
+
+    def _snapshot_path(self, version: int) -> str:
+        return f"{self.prefix}/snapshot_{version:010}.parquet"
+
+    def _delta_path(self, version: int) -> str:
+        return f"{self.prefix}/delta_{version:010}.parquet"
+
+    @property
+    def _pointer_path(self) -> str:
+        return f"{self.prefix}/_latest"
+
+    def _read_pointer(self) -> tuple[int, int]:
+        """
+        Read the version and checkpoint `_latest` points at.
+
+        Returns:
+            tuple[int, int]: The version and the newest checkpoint at or before it,
+                both 0 when nothing was committed yet.
+        """
+        try:
+            version, _, checkpoint = (
+                self.s3.read_bytes(self._pointer_path).decode().partition(" ")
+            )
+        except FileNotFoundError:
+            return 0, 0
+        if checkpoint:
+            return int(version), int(checkpoint)
+        # Written by an older release, every version is a full snapshot
+        version = int(version)
+        while self.s3.parquet_file_exists(self._snapshot_path(version + 1)):
+            version += 1
+        return version, version
+
+    def _read_checkpoint(self, version: int) -> pl.DataFrame:
+        if version == 0:
+            return pl.DataFrame(schema=manifest_schema())
+        return conform_entries(
+            pl.read_parquet(self.s3.read_bytes(self._snapshot_path(version)))
+        )
+
+    def _advance(self, version: int, frame: pl.DataFrame) -> tuple[int, pl.DataFrame]:
+        # A writer may have committed deltas without moving the pointer yet
+        while True:
+            try:
+                delta = pl.read_parquet(
+                    self.s3.read_bytes(self._delta_path(version + 1))
+                )
+            except FileNotFoundError:
+                return version, frame
+            frame = apply_delta(frame, delta)
+            version += 1
+
+    def _load(self, fresh: bool = False) -> tuple[int, pl.DataFrame]:
+        """
+        Bring the cached manifest up to the latest version.
+
+        Args:
+            fresh (bool): Check S3 even within the refresh interval.
+
+        Returns:
+            tuple[int, pl.DataFrame]: The version and its file entries.
+        """
+        with self._cache_lock:
+            cached, checked_at = self._cached, self._checked_at
+        if (
+            not fresh
+            and time.monotonic() - checked_at < self.refresh_interval_ms / 1000
+        ):
+            return cached
+        checked_at = time.monotonic()
+        version, checkpoint = self._read_pointer()
+        if cached[0] >= checkpoint:
+            loaded = self._advance(*cached)
+        else:
+            loaded = (0, cached[1])
+        if loaded[0] < version:
+            # Too far behind, the deltas since the cached version may be gone
+            loaded = self._advance(checkpoint, self._read_checkpoint(checkpoint))
+        with self._cache_lock:
+            self._checkpoint = max(self._checkpoint, checkpoint)
+            self._checked_at = max(self._checked_at, checked_at)
+            if loaded[0] > self._cached[0]:
+                self._cached = loaded
+            return self._cached
+
+    def latest_version(self) -> int:
+        """
+        Resolve the newest committed manifest version.
+
+        Returns:
+            int: The latest version, 0 when nothing was committed yet.
+        """
+        return self._load(fresh=True)[0]
+
+    def snapshot(self) -> tuple[int, pl.DataFrame]:
+        """
+        Return the latest manifest, cached per version and rechecked at most every
+        `refresh_interval_ms`.
+
+        Commits of this worker are visible at once, those of other workers after
+        the refresh interval at most.
+
+        Returns:
+            tuple[int, pl.DataFrame]: The version and its file entries.
+        """
+        return self._load()
+
+    def active_entries(
+        self,
+        date: str | None = None,
+        predicate: pl.Expr | None = None,
+        dataset: str | None = None,
+    ) -> pl.DataFrame:
+        """
+        Return the catalog entries of the data files readers should scan.
+
+        Args:
+            date (str | None): Restrict the result to one 'YYYYMMDD' partition.
+            predicate (pl.Expr | None): Pruning predicate over the catalog statistics.
+            dataset (str | None): The dataset, the books if omitted.
+
+        Returns:
+            pl.DataFrame: The matching active entries.
+        """
+        _, frame = self.snapshot()
+        frame = frame.filter(
+            (pl.col("status") == ACTIVE)
+            & (pl.col("kind") == DATA)
+            & (pl.col("dataset") == (dataset or global_settings.dataframe_name))
+        )
+        if date is not None:
+            frame = frame.filter(pl.col("date") == date)
+        if predicate is not None:
+            frame = frame.filter(predicate)
+        return frame
+
+    def active_files(
+        self,
+        date: str | None = None,
+        predicate: pl.Expr | None = None,
+        dataset: str | None = None,
+    ) -> list[str]:
+        """
+        List the files readers should scan.
+
+        Args:
+            date (str | None): Restrict the result to one 'YYYYMMDD' partition.
+            predicate (pl.Expr | None): Pruning predicate over the catalog statistics,
+                files whose statistics cannot match are skipped.
+            dataset (str | None): The dataset, the books if omitted.
+
+        Returns:
+            list[str]: S3 paths of the active files.
+        """
+        return (
+            self.active_entries(date, predicate, dataset).get_column("path").to_list()
+        )
+
+    def summary(self) -> list[dict]:
+        """
+        Aggregate the catalog per date without touching the data files.
+
+        Returns:
+            list[dict]: Files, rows, bytes, writers, pub_date range and distinct counts
+                per date.
+        """
+        entries = self.active_entries()
+        days = (
+            entries.group_by("date")
+            .agg(
+                pl.len().alias("files"),
+                pl.col("rows").sum(),
+                pl.col("bytes").sum(),
+                pl.col("pid").drop_nulls().unique().alias("pids"),
+                pl.col("min_pub_date").min(),
+                pl.col("max_pub_date").max(),
+            )
+            .sort("date")
+            .to_dicts()
+        )
+        for day in days:
+            sketches = self.sketches(entries.filter(pl.col("date") == day["date"]))
+            for c, sketch in sketches.items():
+                day[f"distinct_{c}"] = sketch.count() if sketch else None
+        return days
+
+    def sketches(self, entries: pl.DataFrame) -> dict[str, HyperLogLog | None]:
+        """
+        Merge the distinct count sketches of catalog entries.
+
+        Files cataloged before sketches existed are skipped, so the result is a
+        lower bound until compaction rewrites them.
+
+        Args:
+            entries (pl.DataFrame): The catalog entries, e.g. of one date.
+
+        Returns:
+            dict[str, HyperLogLog | None]: The merged sketch per sketched column.
+        """
+        return {
+            c: HyperLogLog.union(entries.get_column(f"hll_{c}")) for c in SKETCH_COLUMNS
+        }
+
+    @retry(
+        retry=retry_if_exception_type(ManifestConflictError),
+        wait=wait_random_exponential(multiplier=0.01, max=0.5),
+        stop=stop_after_delay(global_settings.manifest_commit_timeout_seconds),
+        reraise=True,
+    )
+    def commit(
+        self,
+        add: list[dict] | None = None,
+        remove: list[str] | None = None,
+        purge: list[str] | None = None,
+        tombstones_since: int | None = None,
+    ) -> int:
+        """
+        Publish a new manifest version on top of the latest one.
+
+        Adding and removing in one commit swaps files atomically for readers.
+        Only the changes are written. Retries on top of the winner when another
+        writer takes the version, for up to `manifest_commit_timeout_seconds`.
+
+        Args:
+            add (list[dict] | None): Entries with at least `path`, `rows` and `bytes`.
+            remove (list[str] | None): Active paths to mark as removed.
+            purge (list[str] | None): Paths to drop from the manifest entirely.
+            tombstones_since (int | None): Version the added files were planned at,
+                the commit fails if a tombstone was committed after it.
+
+        Returns:
+            int: The committed version.
+
+        Raises:
+            ManifestStaleError: If a path in `remove` is no longer active, or a
+                tombstone was committed after `tombstones_since`.
+        """
+        version, frame = self._load(fresh=True)
+        now = Instant.now().py_datetime()
+        if (
+            tombstones_since is not None
+            and not frame.filter(
+                (pl.col("kind") == TOMBSTONE) & (pl.col("version") > tombstones_since)
+            ).is_empty()
+        ):
+            # Files added now would be newer than the tombstone and escape it
+            raise ManifestStaleError(
+                f"Tombstones committed since version {tombstones_since}"
+            )
+        if remove:
+            active = set(frame.filter(pl.col("status") == ACTIVE).get_column("path"))
+            if missing := set(remove) - active:
+                raise ManifestStaleError(f"Files no longer active: {sorted(missing)}")
+        rows = [
+            {"path": path, "removed_at": now, "op": REMOVE} for path in remove or []
+        ]
+        rows += [{"path": path, "op": PURGE} for path in purge or []]
+        rows += [
+            {
+                "date": date_of(entry["path"]),
+                "dataset": DatasetRegistry().dataset_of(entry["path"]).name,
+                "status": ACTIVE,
+                "kind": DATA,
+                "added_at": now,
+                "removed_at": None,
+                "version": version + 1,
+                **entry,
+                "op": ADD,
+            }
+            for entry in add or []
+        ]
+        delta = pl.DataFrame(rows, schema={**manifest_schema(), "op": pl.Utf8})
+
+        buffer = io.BytesIO()
+        delta.write_parquet(buffer)
+        try:
+            self.s3.write_bytes(
+                self._delta_path(version + 1), buffer.getvalue(), exclusive=True
+            )
+        except FileExistsError as e:
+            raise ManifestConflictError(
+                f"Version {version + 1} already committed"
+            ) from e
+        frame = apply_delta(frame, delta)
+        checkpoint = self._checkpoint
+        if (version + 1) % self.checkpoint_interval == 0:
+            buffer = io.BytesIO()
+            frame.write_parquet(buffer)
+            self.s3.write_bytes(self._snapshot_path(version + 1), buffer.getvalue())
+            checkpoint = version + 1
+        self.s3.write_bytes(self._pointer_path, f"{version + 1} {checkpoint}".encode())
+        with self._cache_lock:
+            self._checkpoint = max(self._checkpoint, checkpoint)
+            if version + 1 > self._cached[0]:
+                self._cached = (version + 1, frame)
+        self._expire(version + 1 - 2 * self.checkpoint_interval - self.keep_snapshots)
+        return version + 1
+
+    def _expire(self, version: int) -> None:
+        """
+        Delete the delta and checkpoint of a version behind the previous checkpoint.
+
+        Readers load the newest checkpoint, or the one before while the pointer
+        lags, and only need the deltas after it.
+        """
+        if version < 1:
+            return
+        for path in (self._delta_path(version), self._snapshot_path(version)):
+            try:
+                self.s3.delete_parquet_file(path)
+            except FileNotFoundError:
+                pass
+
+    def materialize(self, dataframe: pl.DataFrame, path: str) -> dict:
+        """
+        Write a DataFrame to the dataset and publish it in the manifest.
+
+        Args:
+            dataframe (pl.DataFrame): The DataFrame to be written.
+            path (str): The path of the file inside the dataset bucket.
+
+        Returns:
+            dict: The materialization result with the committed manifest version.
+        """
+        return self.register(self.s3.materialize_dataframe(dataframe, path), dataframe)
+
+    def _book_stats(self, path: str, dataframe: pl.DataFrame) -> dict:
+        # Statistics, sketches and search segments describe book columns only
+        if not DatasetRegistry().dataset_of(path).is_books:
+            return {}
+        return {
+            **file_stats(dataframe),
+            **index_frame(self.s3, dataframe, date_of(path)),
+        }
+
+    def register(self, result: dict, dataframe: pl.DataFrame) -> dict:
+        """
+        Publish a file already written to the dataset in the manifest.
+
+        Args:
+            result (dict): The materialization result with `path`, `rows` and `bytes`.
+            dataframe (pl.DataFrame): The DataFrame the file was written from.
+
+        Returns:
+            dict: The materialization result with the committed manifest version.
+        """
+        result["manifest_version"] = self.commit(add=[self.entry(result, dataframe)])
+        return result
+
+    def entry(self, result: dict, dataframe: pl.DataFrame) -> dict:
+        """
+        Build the catalog entry of a file written to the dataset.
+
+        Args:
+            result (dict): The materialization result with `path`, `rows` and `bytes`.
+            dataframe (pl.DataFrame): The DataFrame the file was written from.
+
+        Returns:
+            dict: The entry to pass to `commit`.
+        """
+        return {
+            "path": f"{DATASET_BUCKET}/{result['path']}",
+            "rows": result["rows"],
+            "bytes": result["bytes"],
+            **self._book_stats(result["path"], dataframe),
+        }
+
+    def reconcile(self, min_age_seconds: int = 0) -> dict:
+        """
+        Compare the catalog with an S3 listing of the dataset and repair drift.
+
+        Parquet files missing from the catalog, e.g. written by an older release or
+        by a writer that died before committing, are registered with their stats.
+        Catalog entries whose object is gone are dropped.
+
+        Args:
+            min_age_seconds (int): Leave unlisted files younger than this to their
+                writers.
+
+        Returns:
+            dict: Registered and dropped paths and the committed version, if any.
+        """
+        _, frame = self.snapshot()
+        listed = {
+            path: info
+            for path, info in self.s3.backend.find(DATASET_BUCKET).items()
+            # Manifest snapshots, search segments and other `_` prefixes are not data
+            if path.endswith(".parquet") and "/_" not in path
+        }
+        known = set(frame.get_column("path"))
+        # Tombstones live under `_tombstones` and are never listed
+        data = set(frame.filter(pl.col("kind") == DATA).get_column("path"))
+        cutoff = Instant.now().py_datetime().timestamp() - min_age_seconds
+        added = []
+        for path in sorted(set(listed) - known):
+            if listed[path]["last_modified"].timestamp() > cutoff:
+                continue
+            dataframe = pl.read_parquet(self.s3.read_bytes(path))
+            added.append(
+                {
+                    "path": path,
+                    "rows": dataframe.height,
+                    "bytes": listed[path]["size"],
+                    **self._book_stats(path, dataframe),
+                }
+            )
+        missing = sorted(data - set(listed))
+        version = None
+        if added or missing:
+            version = self.commit(add=added, purge=missing)
+        return {
+            "registered": [e["path"] for e in added],
+            "dropped": missing,
+            "manifest_version": version,
+        }
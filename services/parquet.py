@@ -0,0 +1,228 @@
+"""
+Parquet encoding with configurable write profiles.
+
+Every Parquet file written by the application goes through `write_parquet` so
+codec, row group size, statistics, dictionary encoding and sort order follow
+the active `ParquetWriteProfile`. The profile is stored in the file's key/value
+metadata under `PROFILE_METADATA_KEY`.
+
+Scans of book files take the keys tombstones delete from each file (see
+`services.tombstones`) and hide those rows while scanning.
+
+Compacted book files carry `SOURCE_VERSION`, the manifest version that added
+each row's original file. Scans leave it out unless asked for it.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import IO, Any
+
+from config import ParquetWriteProfile
+from config import settings as global_settings
+from schemas.polars import to_book_schema, wide_book_schema
+from services.utlis import lazy_import
+
+pl = lazy_import("polars")
+
+PROFILE_METADATA_KEY = b"grizzly.write_profile"
+SOURCE_VERSION = "source_version"
+
+
+def write_parquet(
+    dataframe: pl.DataFrame,
+    file: str | IO[bytes],
+    profile: ParquetWriteProfile | None = None,
+) -> None:
+    """
+    Write a DataFrame as Parquet using a write profile.
+
+    Args:
+        dataframe (pl.DataFrame): The DataFrame to write.
+        file (str | IO[bytes]): Target path or binary file object.
+        profile (ParquetWriteProfile | None): Profile to use, defaults to the configured
+            one.
+    """
+    import pyarrow.parquet as pq
+
+    profile = profile or global_settings.write_profile
+    sort_by = [c for c in profile.sort_by if c in dataframe.columns]
+    if sort_by:
+        dataframe = dataframe.sort(sort_by)
+    table = dataframe.to_arrow()
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            PROFILE_METADATA_KEY: profile.model_dump_json().encode(),
+        }
+    )
+    pq.write_table(
+        table,
+        file,
+        compression=profile.compression
+        if profile.compression != "uncompressed"
+        else "none",
+        compression_level=profile.compression_level,
+        row_group_size=profile.row_group_size,
+        write_statistics=profile.statistics,
+        use_dictionary=profile.dictionary,
+    )
+
+
+def read_write_profile(file: str | IO[bytes]) -> dict[str, Any] | None:
+    """
+    Read the write profile recorded in a Parquet file footer.
+
+    Args:
+        file (str | IO[bytes]): Source path or binary file object.
+
+    Returns:
+        dict | None: The recorded profile or None for files written without one.
+    """
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_schema(file).metadata or {}
+    if PROFILE_METADATA_KEY not in metadata:
+        return None
+    return json.loads(metadata[PROFILE_METADATA_KEY])
+
+
+def hide_deleted(
+    frame: pl.DataFrame | pl.LazyFrame, deleted: dict[str, list] | None
+) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Filter out the book rows matching deleted keys.
+
+    Args:
+        frame (pl.DataFrame | pl.LazyFrame): Book rows in either book schema.
+        deleted (dict[str, list] | None): Deleted `isbn` and `hash` values, None to keep
+            all.
+
+    Returns:
+        pl.DataFrame | pl.LazyFrame: The rows not deleted.
+    """
+    if not deleted:
+        return frame
+    columns = frame.collect_schema()
+    hidden = []
+    if deleted.get("isbn") and "isbn" in columns:
+        hidden.append(pl.col("isbn").is_in(deleted["isbn"]))
+    if deleted.get("hash") and "hash" in columns:
+        # Keys are kept as in the wide schema, compact files hold the same bits unsigned
+        _hash = pl.col("hash")
+        if columns["hash"].is_unsigned_integer():
+            _hash = _hash.reinterpret(signed=True)
+        hidden.append(_hash.is_in(deleted["hash"]))
+    if not hidden:
+        return frame
+    return frame.filter(pl.any_horizontal(hidden).fill_null(False).not_())
+
+
+def scan_dataset(
+    paths: list[str], schema: pl.Schema, storage_options: dict[str, Any] | None = None
+) -> pl.LazyFrame:
+    """
+    Lazily scan the files of a named dataset, casting each file to the dataset schema.
+
+    Args:
+        paths (list[str]): Paths or URLs of the Parquet files or their cached copies.
+        schema (pl.Schema): The dataset schema.
+        storage_options (dict | None): Object store options passed to Polars.
+
+    Returns:
+        pl.LazyFrame: The combined lazy frame.
+    """
+    frames = []
+    for path in paths:
+        frame = (
+            pl.scan_ipc(path, memory_map=True)
+            if path.endswith(".arrow")
+            else pl.scan_parquet(path, storage_options=storage_options)
+        )
+        present = frame.collect_schema()
+        # Files written before a column was added to the schema get it as nulls
+        frames.append(
+            frame.select(
+                pl.col(name).cast(dtype, strict=False)
+                if name in present
+                else pl.lit(None, dtype).alias(name)
+                for name, dtype in schema.items()
+            )
+        )
+    return pl.concat(frames)
+
+
+def scan_books(
+    paths: list[str],
+    storage_options: dict[str, Any] | None = None,
+    deleted: list[dict[str, list] | None] | None = None,
+    source_versions: bool = False,
+) -> pl.LazyFrame:
+    """
+    Lazily scan book Parquet files, casting each file to the configured book schema.
+
+    Files written before a schema change are conformed one by one, so a single
+    query can span wide and compact files. Local `.arrow` copies from the object
+    cache are scanned as memory-mapped Arrow IPC.
+
+    Args:
+        paths (list[str]): Paths or URLs of the Parquet files or their cached copies.
+        storage_options (dict | None): Object store options passed to Polars.
+        deleted (list[dict | None] | None): Keys deleted from each file, aligned with
+            `paths`.
+        source_versions (bool): Keep `SOURCE_VERSION` of compacted files.
+
+    Returns:
+        pl.LazyFrame: The combined lazy frame.
+    """
+    deleted = deleted or [None] * len(paths)
+    frames = [
+        hide_deleted(
+            to_book_schema(
+                pl.scan_ipc(path, memory_map=True)
+                if path.endswith(".arrow")
+                else pl.scan_parquet(path, storage_options=storage_options)
+            ),
+            keys,
+        )
+        for path, keys in zip(paths, deleted)
+    ]
+    if not source_versions:
+        frames = [frame.drop(SOURCE_VERSION, strict=False) for frame in frames]
+    return pl.concat(frames, how="diagonal")
+
+
+def scan_books_wide(
+    paths: list[str],
+    storage_options: dict[str, Any] | None = None,
+    deleted: list[dict[str, list] | None] | None = None,
+    source_versions: bool = False,
+) -> pl.LazyFrame:
+    """
+    Lazily scan book files into the wide book schema with every book column.
+
+    The wide schema lets categorical authors of different processes concatenate,
+    and files written without some book columns get them as nulls.
+
+    Args:
+        paths (list[str]): Paths or URLs of the Parquet files or their cached copies.
+        storage_options (dict | None): Object store options passed to Polars.
+        deleted (list[dict | None] | None): Keys deleted from each file, aligned with
+            `paths`.
+        source_versions (bool): Add `SOURCE_VERSION`, null for rows of files not
+            compacted.
+
+    Returns:
+        pl.LazyFrame: The combined lazy frame in `wide_book_schema()` column order.
+    """
+    lazy = to_book_schema(
+        scan_books(paths, storage_options, deleted, source_versions), compact=False
+    )
+    present = lazy.collect_schema()
+    schema = wide_book_schema()
+    if source_versions:
+        schema = {**schema, SOURCE_VERSION: pl.Int64}
+    return lazy.select(
+        pl.col(name) if name in present else pl.lit(None, dtype).alias(name)
+        for name, dtype in schema.items()
+    )
@@ -0,0 +1,284 @@
+"""
+Range partitions of the Postgres books index.
+
+`books_index` is partitioned by `index_partition_key`, the ingest date or the
+publication date, one partition per `index_partition_interval`. Partitions
+are named after the start of their range, i.e. `books_index_p20261019`,
+`books_index_p202610` or `books_index_p2026`.
+
+Maintenance creates the partitions of the current and of the next
+`index_partitions_ahead` intervals, and drops whole partitions ending more than
+`index_retention_days` ago, which replaces slow deletes by day. It runs on
+startup and at every date change. Writers create a missing partition on demand
+and insert straight into it, skipping the routing through the parent table.
+
+Rows indexed before the migration live in a partition from MINVALUE, and
+partitions start where it ends. Key values below go to it, which with the
+`pub_date` key holds every book published before the migration. Publication
+dates say nothing about when a row was indexed, so that key is partitioned by
+year and never dropped by the retention.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from collections.abc import Iterable
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
+
+from attrs import define, field
+from tenacity import retry, stop_after_attempt, wait_random
+from whenever import Instant
+
+from config import settings as global_settings
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+TABLE = "books_index"
+NAME_FORMATS = {"day": "%Y%m%d", "month": "%Y%m", "year": "%Y"}
+TRUNCATE_EVERY = {"day": "1d", "month": "1mo", "year": "1y"}
+BOUND = re.compile(
+    r"FROM \((?P<start>MINVALUE|'[\d-]+')\) TO \((?P<end>MAXVALUE|'[\d-]+')\)"
+)
+
+
+def partition_bounds(day: date, interval: str) -> tuple[date, date]:
+    """
+    Return the range of the partition holding a date.
+
+    Args:
+        day (date): A value of the partition key.
+        interval (str): 'day', 'month' or 'year'.
+
+    Returns:
+        tuple[date, date]: Inclusive start and exclusive end of the range.
+    """
+    if interval == "day":
+        return day, day + timedelta(days=1)
+    if interval == "month":
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    start = day.replace(month=1, day=1)
+    return start, start.replace(year=start.year + 1)
+
+
+def _bound(value: str) -> date | None:
+    return None if value.endswith("VALUE") else date.fromisoformat(value.strip("'"))
+
+
+def utc_today() -> date:
+    return Instant.now().py_datetime().date()
+
+
+@define
+class PartitionService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service creating and dropping partitions of the Postgres books index.
+
+    Attributes:
+        enabled (bool): The books index is written to the partitioned Postgres table.
+        key (str): The partition key column, 'ingest_date' or 'pub_date'.
+        interval (str): Range of the key covered by one partition.
+        ahead (int): Future partitions created ahead of the data.
+        retention_days (int): Partitions ending more than this many days ago are
+            dropped.
+    """
+
+    enabled: bool = global_settings.index_partitioning_enabled
+    key: str = global_settings.index_partition_key
+    interval: str = global_settings.index_partition_interval
+    ahead: int = global_settings.index_partitions_ahead
+    retention_days: int = global_settings.index_retention_days
+    _engine: Engine | None = field(init=False, default=None)
+    _known: set[str] = field(init=False, factory=set)
+    _floor: tuple[str | None, date] | None = field(init=False, default=None)
+
+    def __attrs_post_init__(self):
+        if self.key == "pub_date" and self.interval != "year":
+            raise ValueError(
+                "The pub_date partition key needs the year partition interval"
+            )
+
+    @property
+    def url(self) -> str:
+        return global_settings.pg_url.unicode_string()
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            from sqlalchemy import create_engine
+
+            self._engine = create_engine(self.url, echo=global_settings.database_echo)
+        return self._engine
+
+    @property
+    def truncate_every(self) -> str:
+        """
+        Polars duration truncating a key value to the start of its partition.
+        """
+        return TRUNCATE_EVERY[self.interval]
+
+    def partition_name(self, start: date) -> str:
+        return f"{TABLE}_p{start.strftime(NAME_FORMATS[self.interval])}"
+
+    @retry(wait=wait_random(0.05, 0.5), stop=stop_after_attempt(3), reraise=True)
+    def _create(self, name: str, start: date, end: date) -> None:
+        from sqlalchemy import text
+
+        # Workers race to create the same partition, the loser retries into a no-op
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                )
+            )
+
+    def floor(self) -> tuple[str | None, date]:
+        """
+        Find the partition from MINVALUE holding the rows indexed before the migration.
+
+        Returns:
+            tuple[str | None, date]: Its name and the exclusive end of its range,
+                None and the smallest date if there is no such partition.
+        """
+        if self._floor is None:
+            self._floor = None, date.min
+            for partition in self.partitions():
+                if partition["start"] is None and partition["end"] is not None:
+                    self._floor = partition["name"], partition["end"]
+        return self._floor
+
+    def partition_start(self) -> pl.Expr:
+        """
+        Polars expression giving each row the first key value of its partition.
+        """
+        _, floor = self.floor()
+        key = pl.col(self.key)
+        return (
+            pl.when(key < floor)
+            .then(pl.lit(date.min))
+            .otherwise(
+                pl.max_horizontal(key.dt.truncate(self.truncate_every), pl.lit(floor))
+            )
+        )
+
+    def ensure(self, days: Iterable[date]) -> list[str]:
+        """
+        Create the partitions holding the given key values if they are missing.
+
+        Values below the end of the partition from MINVALUE belong to it, and a
+        partition overlapping that end starts there instead.
+
+        Args:
+            days (Iterable[date]): Values of the partition key.
+
+        Returns:
+            list[str]: Names of the partitions holding the values.
+        """
+        legacy, floor = self.floor()
+        names = []
+        for day in sorted(set(days)):
+            if day < floor:
+                names.append(legacy)
+                continue
+            start, end = partition_bounds(day, self.interval)
+            name = self.partition_name(start)
+            if name not in self._known:
+                self._create(name, max(start, floor), end)
+                self._known.add(name)
+            names.append(name)
+        return list(dict.fromkeys(names))
+
+    def partitions(self) -> list[dict]:
+        """
+        List the partitions of the books index with their range and estimated rows.
+
+        Returns:
+            list[dict]: Name, start and end (None for MINVALUE and MAXVALUE) and rows.
+        """
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples "
+                    "FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "JOIN pg_class p ON p.oid = i.inhparent "
+                    "WHERE p.relname = :table ORDER BY c.relname"
+                ),
+                {"table": TABLE},
+            ).all()
+        found = []
+        for name, bound, tuples in rows:
+            match = BOUND.search(bound or "")
+            found.append(
+                {
+                    "name": name,
+                    "start": _bound(match["start"]) if match else None,
+                    "end": _bound(match["end"]) if match else None,
+                    "rows": max(int(tuples), 0),
+                }
+            )
+        return found
+
+    def drop_expired(self, today: date | None = None) -> list[str]:
+        """
+        Drop the partitions ending before the retention window.
+
+        Args:
+            today (date | None): The current UTC date, for tests and backfills.
+
+        Returns:
+            list[str]: Names of the dropped partitions.
+        """
+        if not self.retention_days or self.key != "ingest_date":
+            return []  # Old publication dates are not old rows
+        from sqlalchemy import text
+
+        cutoff = (today or utc_today()) - timedelta(days=self.retention_days)
+        dropped = []
+        for partition in self.partitions():
+            if partition["end"] is None or partition["end"] > cutoff:
+                continue
+            with self.engine.begin() as conn:
+                conn.execute(
+                    text(f"ALTER TABLE {TABLE} DETACH PARTITION {partition['name']}")
+                )
+                conn.execute(text(f"DROP TABLE {partition['name']}"))
+            self._known.discard(partition["name"])
+            if partition["start"] is None:
+                self._floor = None
+            dropped.append(partition["name"])
+            logger.info(
+                f"Dropped index partition {partition['name']} ending {partition['end']}"
+            )
+        return dropped
+
+    def maintain(self, today: date | None = None) -> dict:
+        """
+        Create the partitions of today and of the next intervals, and drop expired ones.
+
+        Args:
+            today (date | None): The current UTC date, for tests and backfills.
+
+        Returns:
+            dict: Created or already present partitions and dropped partitions.
+        """
+        day = today or utc_today()
+        upcoming = []
+        for _ in range(self.ahead + 1):
+            upcoming.append(day)
+            day = partition_bounds(day, self.interval)[1]
+        return {
+            "partitions": self.ensure(upcoming),
+            "dropped": self.drop_expired(today),
+        }
@@ -0,0 +1,136 @@
+"""
+Inverted index segments over book descriptions.
+
+Every dataset file gets a segment beside it under `daily/_search/`, built when
+the file is flushed. A segment is a Parquet file of postings, one row per
+token and book hash with the term frequency and the document length, sorted by
+token so a lookup reads only the row groups whose token range matches. Document
+count and total length of a segment are kept in the file catalog, which is all
+BM25 needs besides the postings. Compaction merges the segments of its inputs.
+
+Segments are built and merged in the compute executor and cross the process
+boundary as Arrow IPC and Parquet bytes.
+"""
+
+from __future__ import annotations
+
+import io
+from uuid import uuid4
+
+from config import ParquetWriteProfile
+from schemas.polars import to_book_schema
+from services.compute import ComputeExecutor, frame_from_ipc, frame_to_ipc
+from services.parquet import write_parquet
+from services.utlis import lazy_import
+
+pl = lazy_import("polars")
+
+SEGMENT_PREFIX = "daily/_search"
+SEGMENT_PROFILE = ParquetWriteProfile(
+    compression="zstd",
+    compression_level=3,
+    row_group_size=16_384,
+    sort_by=["token", "hash"],
+)
+
+
+def tokenize(text: pl.Expr) -> pl.Expr:
+    """
+    Split text into lowercase word tokens.
+    """
+    return text.str.to_lowercase().str.extract_all(r"\w+")
+
+
+def _encode(postings: pl.DataFrame) -> tuple[bytes, int, int]:
+    docs = postings.select("hash", "dl").unique("hash")
+    buffer = io.BytesIO()
+    write_parquet(postings, buffer, SEGMENT_PROFILE)
+    return buffer.getvalue(), docs.height, int(docs.get_column("dl").sum())
+
+
+def build_postings(buffer: bytes) -> tuple[bytes, int, int] | None:
+    """
+    Build the segment of a frame with `description` and `hash`.
+
+    Args:
+        buffer (bytes): Arrow IPC buffer of the frame.
+
+    Returns:
+        tuple[bytes, int, int] | None: Segment Parquet bytes, document count and total
+            document length, None if the frame has no descriptions.
+    """
+    frame = frame_from_ipc(buffer)
+    if not {"description", "hash"} <= set(frame.columns):
+        return None
+    tokens = to_book_schema(frame.select("description", "hash"), compact=False).select(
+        "hash", tokenize(pl.col("description")).alias("token")
+    )
+    # Identical books share a hash, their lengths and frequencies add up
+    lengths = tokens.group_by("hash").agg(pl.col("token").list.len().sum().alias("dl"))
+    postings = (
+        tokens.explode("token")
+        .drop_nulls("token")
+        .group_by("token", "hash")
+        .agg(pl.len().cast(pl.Int32).alias("tf"))
+        .join(lengths, on="hash")
+        .with_columns(pl.col("dl").cast(pl.Int32))
+    )
+    return _encode(postings)
+
+
+def merge_postings(buffers: list[bytes]) -> tuple[bytes, int, int]:
+    """
+    Merge the segments of files compacted into one.
+
+    Args:
+        buffers (list[bytes]): Segment Parquet bytes.
+
+    Returns:
+        tuple[bytes, int, int]: Merged segment bytes, document count and total length.
+    """
+    postings = (
+        pl.concat([pl.read_parquet(b) for b in buffers])
+        .group_by("token", "hash")
+        .agg(pl.col("tf").sum(), pl.col("dl").sum())
+    )
+    return _encode(postings)
+
+
+def segment_entry(s3, result: tuple[bytes, int, int] | None, date: str | None) -> dict:
+    """
+    Upload a built segment and return its catalog columns.
+
+    Args:
+        s3: The sync S3 service.
+        result (tuple[bytes, int, int] | None): Output of `build_postings` or
+            `merge_postings`.
+        date (str | None): The 'YYYYMMDD' partition of the data file.
+
+    Returns:
+        dict: `search_segment`, `search_docs` and `search_length`, empty without a
+            segment.
+    """
+    if result is None:
+        return {}
+    segment, docs, length = result
+    path = f"{SEGMENT_PREFIX}/{date + '/' if date else ''}{uuid4().hex}.parquet"
+    s3.write_bytes(path, segment)
+    return {"search_segment": path, "search_docs": docs, "search_length": length}
+
+
+def index_frame(s3, dataframe: pl.DataFrame, date: str | None) -> dict:
+    """
+    Build and upload the segment of a frame about to be published.
+
+    Args:
+        s3: The sync S3 service.
+        dataframe (pl.DataFrame): The published frame.
+        date (str | None): The 'YYYYMMDD' partition of the data file.
+
+    Returns:
+        dict: The segment catalog columns, empty if the frame has no descriptions.
+    """
+    if "description" not in dataframe.columns:
+        return {}
+    result = ComputeExecutor().submit(build_postings, frame_to_ipc(dataframe)).result()
+    return segment_entry(s3, result, date)
@@ -0,0 +1,240 @@
+"""
+Daily rollover of the ingest buffer and the local files it leaves behind.
+
+When the day changes the worker seals the buffer of every dataset into the
+previous day's partition. Local files of past days are then streamed to S3 with
+resumable multipart uploads and deleted: the per-worker SQLite indexes
+`{YYYYMMDD}_{pid}.sqlite` with their WAL and journal, and the persistence files
+`daily_{pid}.parquet` of workers that are gone. Shipped Parquet files are
+published in the dataset catalog.
+
+Workers share the directory, so each file is shipped under an exclusive
+`flock` and skipped by everyone else meanwhile. Interrupted uploads continue
+from their last part on the next run.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import logging
+import os
+import re
+import uuid
+from pathlib import Path
+
+from attrs import define, field
+from starlette.concurrency import run_in_threadpool
+from whenever import Instant
+
+from config import settings as global_settings
+from services.datasets import DatasetRegistry
+from services.ingest import IngestService
+from services.manifest import DATASET_BUCKET, ManifestService
+from services.partitions import PartitionService
+from services.s3_async import S3AsyncService
+from services.utlis import SingletonMetaNoArgs, lazy_import, pid_alive
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+SQLITE_FILE = re.compile(
+    r"^(?P<date>\d{8})_(?P<pid>\d+)\.sqlite(?P<suffix>-wal|-journal|-shm)?$"
+)
+DAILY_FILE = re.compile(r"^daily_(?P<pid>\d+)\.parquet$")
+
+
+def today() -> str:
+    return Instant.now().py_datetime().strftime("%Y%m%d")
+
+
+@define
+class RolloverService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service sealing the previous day and shipping local files to S3.
+
+    Attributes:
+        interval_seconds (int): Seconds between checks for a date change.
+        part_size_mb (int): Multipart upload part size in MB.
+        directory (str): Directory holding the local SQLite and Parquet files.
+    """
+
+    interval_seconds: int = global_settings.rollover_interval_seconds
+    part_size_mb: int = global_settings.rollover_part_size_mb
+    directory: str = global_settings.rollover_dir
+    _task: asyncio.Task | None = field(init=False, default=None)
+
+    @property
+    def ingest(self) -> IngestService:
+        return IngestService()
+
+    @property
+    def datasets(self) -> DatasetRegistry:
+        return DatasetRegistry()
+
+    @property
+    def partitions(self) -> PartitionService:
+        return PartitionService()
+
+    @property
+    def manifest(self) -> ManifestService:
+        return ManifestService()
+
+    @property
+    def s3(self) -> S3AsyncService:
+        return S3AsyncService()
+
+    async def seal(self, app, date: str) -> list[dict]:
+        """
+        Flush every dataset buffer into the partition of the day it was ingested on.
+
+        Args:
+            app: The FastAPI application holding the buffers.
+            date (str): The 'YYYYMMDD' partition being closed.
+
+        Returns:
+            list[dict]: The materialization results of the non-empty buffers.
+        """
+        sealed = []
+        for dataset in self.datasets.all():
+            name = f"{dataset.name}_{os.getpid()}_final_{uuid.uuid4().hex[:8]}"
+            _res = await self.ingest.flush(
+                app, dataset.path(f"{date}/{name}.parquet"), dataset
+            )
+            if _res is not None:
+                sealed.append(_res)
+        return sealed
+
+    def _leftovers(self, current_date: str) -> list[tuple[Path, str, str | None]]:
+        """
+        Find local files of past days and workers that are gone.
+
+        Returns:
+            list[tuple[Path, str, str | None]]: Local file, S3 path and catalog path for
+                Parquet files.
+        """
+        found = []
+        for entry in Path(self.directory).iterdir():
+            if match := SQLITE_FILE.match(entry.name):
+                if match["date"] < current_date:
+                    found.append(
+                        (
+                            entry,
+                            f"{DATASET_BUCKET}/{match['date']}/_index/{entry.name}",
+                            None,
+                        )
+                    )
+            elif (match := DAILY_FILE.match(entry.name)) and not pid_alive(
+                int(match["pid"])
+            ):
+                date = (
+                    Instant.from_timestamp(entry.stat().st_mtime)
+                    .py_datetime()
+                    .strftime("%Y%m%d")
+                )
+                path = f"{date}/daily_{match['pid']}.parquet"
+                found.append((entry, f"{DATASET_BUCKET}/{path}", path))
+        return found
+
+    async def ship(
+        self, local: Path, s3_path: str, catalog_path: str | None
+    ) -> dict | None:
+        """
+        Upload one local file to S3 and delete it, unless another worker holds it.
+
+        Args:
+            local (Path): The local file.
+            s3_path (str): The target S3 path.
+            catalog_path (str | None): Path inside the dataset bucket to publish in the
+                catalog.
+
+        Returns:
+            dict | None: The upload result, None if the file was skipped.
+        """
+        try:
+            handle = await asyncio.to_thread(open, local, "rb")
+        except FileNotFoundError:
+            return None  # Shipped by another worker meanwhile
+        with handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            if not local.exists():
+                return None
+            if local.name.endswith("-shm"):
+                # SQLite rebuilds the shared-memory index from the
+                # WAL, it is not worth shipping
+                local.unlink()
+                return None
+            _res = await self.s3.upload_file(
+                str(local), s3_path, self.part_size_mb * 1024**2
+            )
+            if catalog_path is not None:
+                _df = await run_in_threadpool(pl.read_parquet, local)
+                await run_in_threadpool(
+                    self.manifest.register,
+                    {"path": catalog_path, "rows": _df.height, "bytes": _res["bytes"]},
+                    _df,
+                )
+            local.unlink()
+        logger.info(f"Shipped {local} to {s3_path} in {_res['parts']} parts")
+        return _res
+
+    async def run_once(self, app) -> dict:
+        """
+        Seal the buffer if the day changed, then ship the leftovers of past days.
+
+        A new day also creates the next index partitions and drops expired ones.
+
+        Args:
+            app: The FastAPI application holding the buffer and its `now` date.
+
+        Returns:
+            dict: The sealed buffer results and the shipped files.
+        """
+        current_date = today()
+        sealed = []
+        if getattr(app, "now", current_date) != current_date:
+            sealed = await self.seal(app, app.now)
+            app.now = current_date
+            if self.partitions.enabled:
+                await run_in_threadpool(self.partitions.maintain)
+        shipped = []
+        for local, s3_path, catalog_path in self._leftovers(current_date):
+            try:
+                if _res := await self.ship(local, s3_path, catalog_path):
+                    shipped.append(_res)
+            except Exception:
+                logger.exception(f"Failed to ship {local}, will resume on the next run")
+        return {"sealed": sealed, "shipped": shipped}
+
+    async def run_forever(self, app) -> None:
+        while True:
+            try:
+                await self.run_once(app)
+            except Exception:
+                logger.exception("Daily rollover failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self, app) -> None:
+        """
+        Schedule the rollover loop on the running event loop.
+
+        Args:
+            app: The FastAPI application holding the buffer.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever(app))
+
+    async def stop(self) -> None:
+        """
+        Cancel the rollover loop.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
@@ -1,52 +1,83 @@
-from s3fs.core import S3FileSystem
-import polars as pl
-from attrs import define, field
-from config import settings as global_settings
-from services.utlis import SingletonMetaNoArgs
+"""
+Sync S3 access for work running on worker threads.
+
+Every call goes through the object store backend selected by `storage_backend`
+(see `services.storage`), shared with `services.s3_async.S3AsyncService`.
+"""
+
+from __future__ import annotations
+
+import io
+
+from attrs import define
+
+from config import ParquetWriteProfile
+from services.compute import (
+    ComputeExecutor,
+    concat_parquet,
+    encode_parquet,
+    frame_from_ipc,
+    frame_to_ipc,
+)
+from services.parquet import read_write_profile
+from services.storage import RangeReader, StorageBackend, storage_backend
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
 
 
 @define
 class S3Service(metaclass=SingletonMetaNoArgs):
     """
     A service class for interacting with S3, providing methods to handle Parquet files.
-
-    Attributes:
-        s3_key (str): S3 access key.
-        s3_secret (str): S3 secret key.
-        s3_url (str): S3 endpoint URL.
-        s3fs_client (S3FileSystem): S3 filesystem client.
     """
 
-    s3_key: str = global_settings.s3_credentials.key
-    s3_secret: str = global_settings.s3_credentials.secret
-    s3_url: str = global_settings.s3_credentials.endpoint_url
-    s3fs_client: S3FileSystem = field(init=False)
+    @property
+    def backend(self) -> StorageBackend:
+        return storage_backend()
 
-    def __attrs_post_init__(self):
+    @property
+    def storage_options(self) -> dict | None:
         """
-        Initializes the S3 filesystem client after the class is instantiated.
+        Credentials for Polars' own object store when scanning S3 URLs.
         """
-        self.s3fs_client = S3FileSystem(
-            key=self.s3_key,
-            secret=self.s3_secret,
-            endpoint_url=self.s3_url,
-        )
+        return self.backend.storage_options
 
-    def materialize_dataframe(self, dataframe: pl.DataFrame, path: str):
+    def materialize_dataframe(
+        self,
+        dataframe: pl.DataFrame,
+        path: str,
+        profile: ParquetWriteProfile | None = None,
+    ):
         """
         Writes a Polars DataFrame to a Parquet file and uploads it to S3.
 
+        Parquet encoding runs in the compute executor, the calling thread only
+        waits for the result and performs the upload.
+
         Args:
             dataframe (pl.DataFrame): The DataFrame to be written.
             path (str): The S3 path where the Parquet file will be stored.
+            profile (ParquetWriteProfile | None): Write profile, defaults to the
+                configured one.
 
         Returns:
-            dict: A dictionary containing the status and path of the uploaded file.
+            dict: A dictionary containing the status, path, row count and byte size of
+                the uploaded file.
         """
-        with self.s3fs_client.open(f"s3://daily/{path}", "wb") as f:
-            dataframe.write_parquet(f)
+        _parquet = (
+            ComputeExecutor()
+            .submit(encode_parquet, frame_to_ipc(dataframe), profile)
+            .result()
+        )
+        self.backend.put(f"daily/{path}", _parquet)
 
-        return {"status": "success", "path": path}
+        return {
+            "status": "success",
+            "path": path,
+            "rows": dataframe.height,
+            "bytes": len(_parquet),
+        }
 
     def list_parquet_files(self, bucket: str):
         """
@@ -58,7 +89,7 @@ class S3Service(metaclass=SingletonMetaNoArgs):
         Returns:
             list: A list of Parquet file paths.
         """
-        return [f for f in self.s3fs_client.ls(bucket) if f.endswith(".parquet")]
+        return [f for f in self.backend.ls(bucket) if f.endswith(".parquet")]
 
     def read_parquet_file(self, path: str) -> pl.DataFrame:
         """
@@ -70,8 +101,44 @@ class S3Service(metaclass=SingletonMetaNoArgs):
         Returns:
             pl.DataFrame: The DataFrame read from the Parquet file.
         """
-        with self.s3fs_client.open(path, "rb") as f:
-            return pl.read_parquet(f)
+        return pl.read_parquet(self.backend.get(path))
+
+    def read_bytes(self, path: str) -> bytes:
+        """
+        Reads the whole content of an S3 object.
+
+        Args:
+            path (str): The S3 path of the object.
+
+        Returns:
+            bytes: The object content.
+        """
+        return self.backend.get(path)
+
+    def write_bytes(self, path: str, data: bytes, exclusive: bool = False):
+        """
+        Writes bytes to an S3 object.
+
+        Args:
+            path (str): The S3 path of the object.
+            data (bytes): The content to write.
+            exclusive (bool): Fail with FileExistsError if the object already exists.
+        """
+        self.backend.put(path, data, exclusive)
+
+    def read_write_profile(self, path: str) -> dict | None:
+        """
+        Reads the write profile recorded in the footer of a Parquet file in S3.
+
+        Args:
+            path (str): The S3 path of the Parquet file.
+
+        Returns:
+            dict | None: The recorded profile or None if the file has none.
+        """
+        # Only the footer is fetched, in range requests
+        with io.BufferedReader(RangeReader(self.backend, path), 64 * 1024) as f:
+            return read_write_profile(f)
 
     def delete_parquet_file(self, path: str):
         """
@@ -80,7 +147,7 @@ class S3Service(metaclass=SingletonMetaNoArgs):
         Args:
             path (str): The S3 path of the Parquet file to be deleted.
         """
-        self.s3fs_client.rm(path)
+        self.backend.delete(path)
 
     def parquet_file_exists(self, path: str) -> bool:
         """
@@ -92,7 +159,7 @@ class S3Service(metaclass=SingletonMetaNoArgs):
         Returns:
             bool: True if the file exists, False otherwise.
         """
-        return self.s3fs_client.exists(path)
+        return self.backend.exists(path)
 
     def merge_parquet_files(self, bucket: str) -> pl.DataFrame:
         """
@@ -105,8 +172,10 @@ class S3Service(metaclass=SingletonMetaNoArgs):
             pl.DataFrame: The merged DataFrame.
         """
         parquet_files = self.list_parquet_files(bucket)
-        dataframes = [self.read_parquet_file(f) for f in parquet_files]
-        return pl.concat(dataframes)
+        buffers = [self.read_bytes(f) for f in parquet_files]
+        return frame_from_ipc(
+            ComputeExecutor().submit(concat_parquet, buffers).result()
+        )
 
     def list_buckets(self) -> list:
         """
@@ -115,7 +184,7 @@ class S3Service(metaclass=SingletonMetaNoArgs):
         Returns:
             list: A list of bucket names.
         """
-        return self.s3fs_client.ls("/")
+        return self.backend.ls("/")
 
     def create_bucket(self, bucket_name: str):
         """
@@ -127,7 +196,7 @@ class S3Service(metaclass=SingletonMetaNoArgs):
         Returns:
             dict: A dictionary containing the status and bucket name.
         """
-        self.s3fs_client.mkdir(bucket_name)
+        self.backend.mkdir(bucket_name)
         return {"status": "success", "bucket_name": bucket_name}
 
     def list_files(self, bucket_name: str) -> list:
@@ -140,7 +209,7 @@ class S3Service(metaclass=SingletonMetaNoArgs):
         Returns:
             list: A list of file paths in the bucket.
         """
-        return self.s3fs_client.ls(bucket_name)
+        return self.backend.ls(bucket_name)
 
     def get_file(self, s3_path: str, local_path: str):
         """
@@ -153,4 +222,4 @@ class S3Service(metaclass=SingletonMetaNoArgs):
         Returns:
             bytes: The contents of the file.
         """
-        return self.s3fs_client.get_file(s3_path, local_path)
+        return self.backend.download(s3_path, local_path)
@@ -1,55 +1,259 @@
+"""
+Async S3 access over a single long-lived session of the storage backend.
+
+With the s3fs backend an aiobotocore session is opened once in the application
+lifespan and closed on shutdown, and the obstore backend keeps one native async
+client per bucket, so every request reuses the same connection pool instead of
+paying for a new TCP and TLS handshake. Routes await these methods directly and
+never hold a threadpool slot while waiting on S3. Parquet encoding and decoding
+still run in the compute executor or the threadpool.
+
+The sync `services.s3.S3Service` remains for catalog and compaction work that
+already runs on worker threads.
+"""
+
+from __future__ import annotations
+
+import asyncio
 import io
-import s3fs
-import polars as pl
-from attrs import define, field
-from config import settings as global_settings
-from services.utlis import SingletonMetaNoArgs
+import logging
+
+from attrs import define
+from starlette.concurrency import run_in_threadpool
+
+from config import ParquetWriteProfile
+from services.compute import (
+    ComputeExecutor,
+    concat_parquet,
+    encode_parquet,
+    frame_from_ipc,
+    frame_to_ipc,
+)
+from services.parquet import read_write_profile
+from services.storage import StorageBackend, storage_backend
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
 
 
 @define
-class S3Service(metaclass=SingletonMetaNoArgs):
+class S3AsyncService(metaclass=SingletonMetaNoArgs):
     """
-    Service class for interacting with S3 using s3fs and polars.
-
-    Attributes:
-        s3_key (str): S3 access key.
-        s3_secret (str): S3 secret key.
-        s3_url (str): S3 endpoint URL.
-        s3fs_client (s3fs.S3FileSystem): S3 filesystem client.
+    Async service class for interacting with S3 using the
+    configured object store backend.
     """
 
-    s3_key: str = global_settings.s3_credentials.key
-    s3_secret: str = global_settings.s3_credentials.secret
-    s3_url: str = global_settings.s3_credentials.endpoint_url
-    s3fs_client: s3fs.S3FileSystem = field(init=False)
+    @property
+    def backend(self) -> StorageBackend:
+        return storage_backend()
 
-    def __attrs_post_init__(self):
+    async def start(self) -> None:
         """
-        Post-initialization method to set up the S3 filesystem client.
+        Open the backend session shared by all requests of this worker.
         """
-        self.s3fs_client = s3fs.S3FileSystem(
-            key=self.s3_key,
-            secret=self.s3_secret,
-            endpoint_url=self.s3_url,
-            asynchronous=True,
-        )
+        await self.backend.start()
+
+    async def close(self) -> None:
+        """
+        Close the shared session and its connection pool.
+        """
+        await self.backend.close()
 
-    async def materialize_dataframe(self, dataframe: pl.DataFrame, path: str):
+    @property
+    def storage_options(self) -> dict | None:
+        """
+        Credentials for Polars' own object store when scanning S3 URLs.
+        """
+        return self.backend.storage_options
+
+    async def materialize_dataframe(
+        self,
+        dataframe: pl.DataFrame,
+        path: str,
+        profile: ParquetWriteProfile | None = None,
+    ) -> dict:
         """
         Asynchronously materialize a Polars DataFrame to S3 as a Parquet file.
 
         Args:
             dataframe (pl.DataFrame): The Polars DataFrame to be materialized.
-            path (str): The S3 path where the Parquet file will be stored.
+            path (str): The path inside the daily bucket where the file will be stored.
+            profile (ParquetWriteProfile | None): Write profile, defaults to the
+                configured one.
 
         Returns:
-            dict: The response object from the S3 put operation.
+            dict: A dictionary containing the status, path, row count and byte size of
+                the uploaded file.
         """
-        session = await self.s3fs_client.set_session()
-        parquet_bytes = io.BytesIO()
-        dataframe.write_parquet(parquet_bytes)
-        obj = await session.put_object(
-            Bucket="daily", Key=path, Body=parquet_bytes.getvalue()
+        _parquet = await ComputeExecutor().run(
+            encode_parquet, frame_to_ipc(dataframe), profile
         )
-        await session.close()
-        return obj
+        await self.backend.put_async(f"daily/{path}", _parquet)
+        return {
+            "status": "success",
+            "path": path,
+            "rows": dataframe.height,
+            "bytes": len(_parquet),
+        }
+
+    async def list_parquet_files(self, bucket: str) -> list[str]:
+        """
+        Lists all Parquet files in the specified S3 bucket.
+
+        Args:
+            bucket (str): The S3 bucket name.
+
+        Returns:
+            list: A list of Parquet file paths.
+        """
+        return [
+            f for f in await self.backend.ls_async(bucket) if f.endswith(".parquet")
+        ]
+
+    async def read_parquet_file(self, path: str) -> pl.DataFrame:
+        """
+        Reads a Parquet file from S3 into a Polars DataFrame.
+
+        Args:
+            path (str): The S3 path of the Parquet file.
+
+        Returns:
+            pl.DataFrame: The DataFrame read from the Parquet file.
+        """
+        return await run_in_threadpool(pl.read_parquet, await self.read_bytes(path))
+
+    async def read_bytes(self, path: str) -> bytes:
+        """
+        Reads the whole content of an S3 object.
+
+        Args:
+            path (str): The S3 path of the object.
+
+        Returns:
+            bytes: The object content.
+        """
+        return await self.backend.get_async(path)
+
+    async def write_bytes(self, path: str, data: bytes, exclusive: bool = False):
+        """
+        Writes bytes to an S3 object.
+
+        Args:
+            path (str): The S3 path of the object.
+            data (bytes): The content to write.
+            exclusive (bool): Fail with FileExistsError if the object already exists.
+        """
+        await self.backend.put_async(path, data, exclusive)
+
+    async def read_write_profile(self, path: str) -> dict | None:
+        """
+        Reads the write profile recorded in the footer of a Parquet file in S3.
+
+        Args:
+            path (str): The S3 path of the Parquet file.
+
+        Returns:
+            dict | None: The recorded profile or None if the file has none.
+        """
+        return read_write_profile(io.BytesIO(await self.read_bytes(path)))
+
+    async def delete_parquet_file(self, path: str):
+        """
+        Deletes a Parquet file from S3.
+
+        Args:
+            path (str): The S3 path of the Parquet file to be deleted.
+        """
+        await self.backend.delete_async(path)
+
+    async def parquet_file_exists(self, path: str) -> bool:
+        """
+        Checks if a Parquet file exists at the specified S3 path.
+
+        Args:
+            path (str): The S3 path to check.
+
+        Returns:
+            bool: True if the file exists, False otherwise.
+        """
+        return await self.backend.exists_async(path)
+
+    async def merge_parquet_files(self, bucket: str) -> pl.DataFrame:
+        """
+        Merges all Parquet files in the specified S3 bucket into a single DataFrame.
+
+        The files are downloaded concurrently over the shared connection pool.
+
+        Args:
+            bucket (str): The S3 bucket name.
+
+        Returns:
+            pl.DataFrame: The merged DataFrame.
+        """
+        parquet_files = await self.list_parquet_files(bucket)
+        buffers = await asyncio.gather(*[self.read_bytes(f) for f in parquet_files])
+        return frame_from_ipc(await ComputeExecutor().run(concat_parquet, buffers))
+
+    async def list_buckets(self) -> list:
+        """
+        Lists all available buckets in the S3 storage.
+
+        Returns:
+            list: A list of bucket names.
+        """
+        return await self.backend.ls_async("/")
+
+    async def create_bucket(self, bucket_name: str):
+        """
+        Creates a new bucket in the S3 storage.
+
+        Args:
+            bucket_name (str): The name of the bucket to be created.
+
+        Returns:
+            dict: A dictionary containing the status and bucket name.
+        """
+        await self.backend.mkdir_async(bucket_name)
+        return {"status": "success", "bucket_name": bucket_name}
+
+    async def list_files(self, bucket_name: str) -> list:
+        """
+        Lists all files in the specified S3 bucket.
+
+        Args:
+            bucket_name (str): The name of the bucket.
+
+        Returns:
+            list: A list of file paths in the bucket.
+        """
+        return await self.backend.ls_async(bucket_name)
+
+    async def upload_file(self, local_path: str, s3_path: str, part_size: int) -> dict:
+        """
+        Stream a local file to S3 in parts.
+
+        With the s3fs backend the multipart upload is resumable: progress is recorded
+        next to the file in `<local_path>.upload` and a later call for the same file
+        and target continues after the last uploaded part.
+
+        Args:
+            local_path (str): The local file to upload.
+            s3_path (str): The target S3 path, 'bucket/key'.
+            part_size (int): Part size in bytes, at least 5 MB except for the last part.
+
+        Returns:
+            dict: The S3 path, byte size and number of parts.
+        """
+        return await self.backend.upload_async(local_path, s3_path, part_size)
+
+    async def get_file(self, s3_path: str, local_path: str):
+        """
+        Downloads a file from S3.
+
+        Args:
+            s3_path (str): The path of the file to download.
+            local_path (str): The local path to save the file
+        """
+        return await self.backend.download_async(s3_path, local_path)
@@ -0,0 +1,166 @@
+"""
+BM25 search over the full-text segments of the dataset.
+
+The query is tokenized like the descriptions, the postings of its tokens are
+read from the segments listed in the file catalog, and books are ranked with
+Okapi BM25. Corpus size and average document length come from the catalog, so
+descriptions are never scanned. Only the top hits are then fetched from the
+data files that hold them, and hits deleted by a tombstone are dropped.
+"""
+
+from __future__ import annotations
+
+from attrs import define
+
+from config import settings as global_settings
+from schemas.polars import to_book_schema
+from services.cache import ObjectCache
+from services.manifest import ManifestService
+from services.parquet import scan_books
+from services.postings import tokenize
+from services.s3 import S3Service
+from services.tombstones import TombstoneService
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+
+@define
+class SearchService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service ranking books by BM25 relevance to a text query.
+
+    Attributes:
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+    """
+
+    k1: float = global_settings.search_bm25_k1
+    b: float = global_settings.search_bm25_b
+
+    @property
+    def manifest(self) -> ManifestService:
+        return ManifestService()
+
+    @property
+    def cache(self) -> ObjectCache:
+        return ObjectCache()
+
+    @property
+    def s3(self) -> S3Service:
+        return S3Service()
+
+    @property
+    def tombstones(self) -> TombstoneService:
+        return TombstoneService()
+
+    def _scan(self, paths: list[str]) -> list[pl.LazyFrame]:
+        return [
+            pl.scan_ipc(path, memory_map=True)
+            if path.endswith(".arrow")
+            else pl.scan_parquet(path, storage_options=self.s3.storage_options)
+            for path in self.cache.local_paths(paths)
+        ]
+
+    def search(self, query: str, limit: int = 10, date: str | None = None) -> dict:
+        """
+        Rank books by BM25 relevance to a query.
+
+        Args:
+            query (str): Free text, tokenized like the descriptions.
+            limit (int): Maximum number of books returned.
+            date (str | None): Restrict the search to one 'YYYYMMDD' partition.
+
+        Returns:
+            dict: The ranked books with their score, and corpus statistics.
+        """
+        tokens = (
+            pl.select(tokenize(pl.lit(query)).alias("token"))
+            .explode("token")
+            .drop_nulls()
+            .unique()
+            .get_column("token")
+            .to_list()
+        )
+        entries = self.manifest.active_entries(
+            date, pl.col("search_segment").is_not_null()
+        )
+        docs = entries.get_column("search_docs").sum()
+        if not tokens or not docs:
+            return {
+                "data": [],
+                "metadata": {"tokens": tokens, "docs": docs, "files": 0},
+            }
+        avgdl = entries.get_column("search_length").sum() / docs
+
+        # Postings of the query tokens only, tagged with the data file holding the book
+        postings = pl.concat(
+            [
+                segment.filter(pl.col("token").is_in(tokens)).with_columns(
+                    pl.lit(path).alias("path")
+                )
+                for segment, path in zip(
+                    self._scan(entries.get_column("search_segment").to_list()),
+                    entries.get_column("path"),
+                )
+            ]
+        ).collect()
+        if postings.is_empty():
+            return {
+                "data": [],
+                "metadata": {"tokens": tokens, "docs": docs, "files": 0},
+            }
+
+        df = pl.col("hash").n_unique().over("token")
+        idf = ((docs - df + 0.5) / (df + 0.5) + 1).log()
+        norm = self.k1 * (1 - self.b + self.b * pl.col("dl") / avgdl)
+        hits = (
+            postings.with_columns(
+                (idf * pl.col("tf") * (self.k1 + 1) / (pl.col("tf") + norm)).alias(
+                    "score"
+                )
+            )
+            .group_by("hash")
+            .agg(pl.col("score").sum(), pl.col("path").first())
+            .sort("score", "hash", descending=True)
+        )
+
+        # Fetch the top books from the few files that hold them. Segments are not
+        # rewritten by deletes, so hits deleted by a tombstone are only dropped here
+        # and the next hits are fetched in their place
+        ranked, paths, offset = [], set(), 0
+        while offset < hits.height and sum(r.height for r in ranked) < limit:
+            batch = hits.slice(offset, limit - sum(r.height for r in ranked))
+            offset += batch.height
+            paths.update(batch.get_column("path"))
+            ranked.append(
+                batch.drop("path").join(self._fetch(batch), on="hash", how="inner")
+            )
+        ranked = (
+            pl.concat(ranked).sort("score", descending=True) if ranked else hits.head(0)
+        )
+        return {
+            "data": ranked.to_dicts(),
+            "metadata": {
+                "tokens": tokens,
+                "docs": docs,
+                "avgdl": avgdl,
+                "files": len(paths),
+            },
+        }
+
+    def _fetch(self, hits: pl.DataFrame) -> pl.DataFrame:
+        paths = hits.get_column("path").unique().to_list()
+        return (
+            to_book_schema(
+                scan_books(
+                    self.cache.local_paths(paths),
+                    self.s3.storage_options,
+                    self.tombstones.deleted_for_paths(paths),
+                ),
+                compact=False,
+            )
+            .filter(pl.col("hash").is_in(hits.get_column("hash").to_list()))
+            .unique("hash")
+            .collect()
+        )
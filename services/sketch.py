@@ -0,0 +1,136 @@
+"""
+HyperLogLog sketches for approximate distinct counts.
+
+A sketch keeps `2 ** precision` one-byte registers, 4 KB at the default
+precision of 12 with a standard error of about 1.6%. Sketches of different
+batches, files and workers merge with an element-wise max, so a day's
+cardinality is the union of its file sketches without touching the data.
+
+Values are hashed with Polars' seeded hash on their string form, which is
+stable across processes and identical for wide and compact (categorical)
+columns.
+"""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Iterable
+
+from config import settings as global_settings
+from services.utlis import lazy_import
+
+np = lazy_import("numpy")
+pl = lazy_import("polars")
+
+HASH_SEED = 0x6772697A
+
+
+class HyperLogLog:
+    """
+    A mergeable HyperLogLog sketch.
+
+    Attributes:
+        precision (int): Number of hash bits selecting the register.
+        registers (np.ndarray): The `2 ** precision` registers.
+    """
+
+    def __init__(
+        self, precision: int | None = None, registers: np.ndarray | None = None
+    ):
+        self.precision = precision or global_settings.sketch_precision
+        self.registers = (
+            registers
+            if registers is not None
+            else np.zeros(1 << self.precision, dtype=np.uint8)
+        )
+
+    @classmethod
+    def from_series(
+        cls, series: pl.Series, precision: int | None = None
+    ) -> HyperLogLog:
+        return cls(precision).update(series)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> HyperLogLog:
+        return cls(data[0], np.frombuffer(data, dtype=np.uint8, offset=1).copy())
+
+    @classmethod
+    def union(cls, sketches: Iterable[bytes | None]) -> HyperLogLog | None:
+        """
+        Merge serialized sketches.
+
+        Args:
+            sketches (Iterable[bytes | None]): Serialized sketches, None entries are
+                skipped.
+
+        Returns:
+            HyperLogLog | None: The merged sketch, None if there was nothing to merge.
+        """
+        merged = None
+        for data in sketches:
+            if data is None:
+                continue
+            sketch = cls.from_bytes(data)
+            merged = sketch if merged is None else merged.merge(sketch)
+        return merged
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    def update(self, series: pl.Series) -> HyperLogLog:
+        """
+        Add the values of a series to the sketch, nulls are ignored.
+
+        Args:
+            series (pl.Series): The values to add.
+
+        Returns:
+            HyperLogLog: The updated sketch.
+        """
+        hashes = series.drop_nulls().cast(pl.Utf8).hash(seed=HASH_SEED).to_numpy()
+        if not len(hashes):
+            return self
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # A sentinel bit below the shifted hash caps the rank at 65 - precision
+        rest = (hashes << p) | np.uint64(1 << (self.precision - 1))
+        rank = pl.Series(rest).bitwise_leading_zeros().to_numpy().astype(np.uint8) + 1
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other: HyperLogLog) -> HyperLogLog:
+        """
+        Merge another sketch of the same precision into this one.
+
+        Args:
+            other (HyperLogLog): The sketch to merge.
+
+        Returns:
+            HyperLogLog: The merged sketch.
+
+        Raises:
+            ValueError: If the precisions differ.
+        """
+        if other.precision != self.precision:
+            raise ValueError(
+                "Cannot merge sketches of precision "
+                f"{self.precision} and {other.precision}"
+            )
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        """
+        Estimate the number of distinct values added to the sketch.
+
+        Returns:
+            int: The estimated cardinality.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.ldexp(1.0, -self.registers.astype(np.int32)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
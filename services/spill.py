@@ -0,0 +1,379 @@
+"""
+Spill of ingest buffers to local disk under memory pressure.
+
+When ingest outpaces the S3 uploads, the buffers can only grow in RAM. Once the
+buffers of a worker pass `spill_buffer_soft_limit_mb`, or its resident memory
+passes `spill_rss_soft_limit_mb`, the largest buffers are written to
+uncompressed Arrow IPC files in `spill_dir` and replaced by empty ones. A
+buffer spills as a whole, so every dataset keeps a list of chunks, oldest first,
+in front of its in-memory rows.
+
+Spilled chunks are read back memory-mapped: flushes and queries see them as
+frames whose pages come from the page cache, so a burst degrades to disk speed
+instead of growing the heap. A flush takes the chunks along with the buffer and
+deletes their files once the data is published. Deletes rewrite the chunks
+holding deleted rows, so a later flush does not publish them again.
+
+Chunk files are named `spill_{pid}_{seq}_{dataset}.arrow`. Files of workers
+that are gone are adopted on startup and flushed with the next flush.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import re
+from pathlib import Path
+from threading import Lock
+
+from attrs import define, field
+from starlette.concurrency import run_in_threadpool
+
+from config import settings as global_settings
+from services.datasets import Dataset, DatasetRegistry
+from services.parquet import hide_deleted
+from services.utlis import SingletonMetaNoArgs, lazy_import, pid_alive
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+SPILL_FILE = re.compile(r"^spill_(?P<pid>\d+)_(?P<seq>\d+)_(?P<dataset>.+)\.arrow$")
+
+
+def rss_mb() -> float:
+    """
+    Resident anonymous memory of this process in MB.
+
+    File-backed pages, such as memory-mapped spill and cache files, are left out
+    since the kernel can drop them under pressure.
+
+    Returns:
+        float: Resident minus shared memory, 0 where `/proc` is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            _, resident, shared, *_ = (int(v) for v in f.read().split())
+    except (OSError, ValueError):
+        return 0.0
+    return (resident - shared) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+@define
+class SpilledChunk:
+    """
+    Rows of a buffer written to a local Arrow IPC file.
+
+    Attributes:
+        path (Path): The chunk file.
+        rows (int): Rows in the chunk.
+        size_mb (float): In-memory size of the rows when they were spilled.
+        frame (pl.DataFrame | None): The rows while their file is being written.
+        released (bool): The rows were published and the file can go.
+    """
+
+    path: Path
+    rows: int
+    size_mb: float
+    frame: pl.DataFrame | None = None
+    released: bool = False
+
+    def read(self) -> pl.DataFrame:
+        if self.frame is not None:
+            return self.frame
+        return pl.read_ipc(self.path, memory_map=True, rechunk=False)
+
+
+@define
+class SpillService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service spilling the largest buffers of the worker to local disk.
+
+    Attributes:
+        enabled (bool): Spill buffers under memory pressure.
+        directory (str): Directory of the chunk files.
+        buffer_soft_limit_mb (float): Total size of the in-memory buffers that triggers
+            a spill.
+        rss_soft_limit_mb (float): Resident memory of the worker that triggers a spill,
+            0 to ignore it.
+        min_chunk_mb (float): Buffers smaller than this are never spilled.
+    """
+
+    enabled: bool = global_settings.spill_enabled
+    directory: str = global_settings.spill_dir
+    buffer_soft_limit_mb: float = global_settings.spill_buffer_soft_limit_mb
+    rss_soft_limit_mb: float = global_settings.spill_rss_soft_limit_mb
+    min_chunk_mb: float = global_settings.spill_min_chunk_mb
+    _chunks: dict[str, list[SpilledChunk]] = field(init=False, factory=dict)
+    _seq: itertools.count = field(init=False, factory=itertools.count)
+    _stats_lock: Lock = field(init=False, factory=Lock)
+    _spills: int = field(init=False, default=0)
+    _spilled_rows: int = field(init=False, default=0)
+    _reloads: int = field(init=False, default=0)
+    _adopted: int = field(init=False, default=0)
+
+    def __attrs_post_init__(self):
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+
+    @property
+    def datasets(self) -> DatasetRegistry:
+        return DatasetRegistry()
+
+    def _chunk_path(self, dataset: Dataset) -> Path:
+        name = f"spill_{os.getpid()}_{next(self._seq):06d}_{dataset.name}.arrow"
+        return Path(self.directory) / name
+
+    def spilled_mb(self, dataset: Dataset) -> float:
+        return sum(c.size_mb for c in self._chunks.get(dataset.name, []))
+
+    def spilled_rows(self, dataset: Dataset) -> int:
+        return sum(c.rows for c in self._chunks.get(dataset.name, []))
+
+    def _victims(self, app) -> list[Dataset]:
+        sizes = {d.name: d.buffer_mb(app) for d in self.datasets.all()}
+        candidates = sorted(
+            (d for d in self.datasets.all() if sizes[d.name] >= self.min_chunk_mb),
+            key=lambda d: sizes[d.name],
+            reverse=True,
+        )
+        if self.rss_soft_limit_mb and rss_mb() > self.rss_soft_limit_mb:
+            return candidates  # Hand every sizeable buffer to the page cache
+        victims, total = [], sum(sizes.values())
+        for dataset in candidates:
+            if total <= self.buffer_soft_limit_mb:
+                break
+            victims.append(dataset)
+            total -= sizes[dataset.name]
+        return victims
+
+    async def maybe_spill(self, app) -> list[SpilledChunk]:
+        """
+        Spill the largest buffers while the worker is above a soft limit.
+
+        A buffer is detached and its chunk is registered before the file is
+        written, so flushes and queries running meanwhile still see its rows.
+
+        Args:
+            app: The FastAPI application holding the buffers.
+
+        Returns:
+            list[SpilledChunk]: The chunks written.
+        """
+        if not self.enabled:
+            return []
+        spilled = []
+        for dataset in self._victims(app):
+            _df = dataset.buffer(app)
+            chunk = SpilledChunk(
+                path=self._chunk_path(dataset),
+                rows=_df.height,
+                size_mb=_df.estimated_size(unit="mb"),
+                frame=_df,
+            )
+            setattr(app, dataset.name, pl.DataFrame(schema=dataset.schema))
+            self._chunks.setdefault(dataset.name, []).append(chunk)
+            try:
+                await run_in_threadpool(self._write, chunk)
+            except Exception:
+                # The rows stay in memory, held by the chunk
+                logger.exception(f"Failed to spill {chunk.rows} rows of {dataset.name}")
+                continue
+            logger.info(
+                f"Spilled {chunk.rows} rows ({chunk.size_mb:.1f} MB) of {dataset.name}"
+            )
+            spilled.append(chunk)
+        return spilled
+
+    def _write(self, chunk: SpilledChunk, count: bool = True) -> None:
+        tmp = chunk.path.with_suffix(".tmp")
+        # Uncompressed, so the chunk can be memory-mapped without decoding
+        chunk.frame.write_ipc(tmp, compression="uncompressed")
+        os.replace(tmp, chunk.path)
+        if count:
+            with self._stats_lock:
+                self._spills += 1
+                self._spilled_rows += chunk.rows
+        chunk.frame = None
+        if chunk.released:
+            chunk.path.unlink(missing_ok=True)  # Flushed while it was being written
+
+    async def discard(self, dataset: Dataset, deleted: dict[str, list]) -> int:
+        """
+        Drop deleted rows from the spilled chunks of a dataset.
+
+        Every chunk holding such rows is replaced by a new chunk of the rows kept,
+        in its place in the ingest order. A chunk taken by a flush meanwhile is
+        left to it, as is the in-memory buffer of a flush in flight.
+
+        Args:
+            dataset (Dataset): The dataset of the chunks.
+            deleted (dict[str, list]): Deleted `isbn` and `hash` values.
+
+        Returns:
+            int: The number of rows dropped.
+        """
+        dropped = 0
+        for chunk in self.chunks(dataset):
+            _kept = await run_in_threadpool(
+                lambda c=chunk: hide_deleted(c.read(), deleted)
+            )
+            if _kept.height == chunk.rows:
+                continue
+            chunks = self._chunks.get(dataset.name, [])
+            position = next((i for i, c in enumerate(chunks) if c is chunk), None)
+            if position is None:
+                continue  # Taken by a flush
+            replacement = SpilledChunk(
+                path=self._chunk_path(dataset),
+                rows=_kept.height,
+                size_mb=_kept.estimated_size(unit="mb"),
+                frame=_kept,
+            )
+            chunks[position] = replacement
+            self.release([chunk])
+            dropped += chunk.rows - replacement.rows
+            try:
+                await run_in_threadpool(self._write, replacement, False)
+            except Exception:
+                # The rows stay in memory, held by the chunk
+                logger.exception(f"Failed to rewrite a spilled chunk of {dataset.name}")
+        return dropped
+
+    def frames(self, chunks: list[SpilledChunk]) -> list[pl.DataFrame]:
+        """
+        Read spilled chunks back as memory-mapped frames.
+
+        Args:
+            chunks (list[SpilledChunk]): Chunks, oldest first.
+
+        Returns:
+            list[pl.DataFrame]: One frame per chunk.
+        """
+        frames = [c.read() for c in chunks]
+        with self._stats_lock:
+            self._reloads += len(chunks)
+        return frames
+
+    def combine(
+        self, chunks: list[SpilledChunk], buffer: pl.DataFrame | None
+    ) -> pl.DataFrame | None:
+        """
+        Put spilled chunks and the in-memory buffer back in ingest order.
+
+        Args:
+            chunks (list[SpilledChunk]): Its spilled chunks, oldest first.
+            buffer (pl.DataFrame | None): Its in-memory buffer.
+
+        Returns:
+            pl.DataFrame | None: All rows, None if there are none.
+        """
+        frames = self.frames(chunks)
+        if buffer is not None:
+            frames.append(buffer)
+        if not frames:
+            return None
+        if len(frames) == 1:
+            return frames[0]
+        return pl.concat(frames, how="vertical", rechunk=False)
+
+    def chunks(self, dataset: Dataset) -> list[SpilledChunk]:
+        return list(self._chunks.get(dataset.name, []))
+
+    def detach(self, dataset: Dataset) -> list[SpilledChunk]:
+        """
+        Take the spilled chunks of a dataset, for a flush.
+
+        Returns:
+            list[SpilledChunk]: The chunks, oldest first.
+        """
+        return self._chunks.pop(dataset.name, [])
+
+    def restore(self, dataset: Dataset, chunks: list[SpilledChunk]) -> None:
+        """
+        Put back the chunks of a failed flush in front of any spilled meanwhile.
+        """
+        if chunks:
+            self._chunks[dataset.name] = chunks + self._chunks.get(dataset.name, [])
+
+    def release(self, chunks: list[SpilledChunk]) -> None:
+        """
+        Delete the files of chunks whose rows are published.
+        """
+        for chunk in chunks:
+            chunk.released = True
+            if chunk.frame is None:
+                chunk.path.unlink(missing_ok=True)
+
+    def adopt(self) -> int:
+        """
+        Take over the chunk files of workers that are gone.
+
+        Each file is renamed under this worker's pid, which only one worker can
+        do, and is flushed with the next flush of its dataset.
+
+        Returns:
+            int: The number of chunks adopted.
+        """
+        adopted = 0
+        for entry in sorted(Path(self.directory).iterdir()):
+            match = SPILL_FILE.match(entry.name)
+            if (
+                not match
+                or int(match["pid"]) == os.getpid()
+                or pid_alive(int(match["pid"]))
+            ):
+                continue
+            try:
+                dataset = self.datasets.get(match["dataset"])
+            except KeyError:
+                logger.warning(f"Left {entry} of an unknown dataset in place")
+                continue
+            path = self._chunk_path(dataset)
+            try:
+                os.rename(entry, path)
+            except FileNotFoundError:
+                continue  # Adopted by another worker
+            rows = pl.scan_ipc(path, memory_map=True).select(pl.len()).collect().item()
+            self._chunks.setdefault(dataset.name, []).append(
+                SpilledChunk(
+                    path=path, rows=rows, size_mb=path.stat().st_size / 1024**2
+                )
+            )
+            adopted += 1
+        with self._stats_lock:
+            self._adopted += adopted
+        if adopted:
+            logger.info(f"Adopted {adopted} spilled chunks of workers that are gone")
+        return adopted
+
+    def stats(self) -> dict:
+        """
+        Report the spilled chunks and the spill and reload counts of this worker.
+
+        Returns:
+            dict: Limits, resident memory, counters and spilled rows and MB per dataset.
+        """
+        with self._stats_lock:
+            counters = {
+                "spills": self._spills,
+                "spilled_rows": self._spilled_rows,
+                "reloads": self._reloads,
+                "adopted": self._adopted,
+            }
+        return {
+            "enabled": self.enabled,
+            "buffer_soft_limit_mb": self.buffer_soft_limit_mb,
+            "rss_soft_limit_mb": self.rss_soft_limit_mb,
+            "rss_mb": rss_mb(),
+            **counters,
+            "datasets": {
+                name: {
+                    "chunks": len(chunks),
+                    "rows": sum(c.rows for c in chunks),
+                    "size_mb": sum(c.size_mb for c in chunks),
+                }
+                for name, chunks in self._chunks.items()
+                if chunks
+            },
+        }
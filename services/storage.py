@@ -0,0 +1,786 @@
+"""
+Object storage backends behind `S3Service` and `S3AsyncService`.
+
+`storage_backend` selects the client every S3 call of a worker goes through:
+
+- `s3fs`: fsspec's s3fs over aiobotocore, with a sync and an async filesystem.
+- `obstore`: the Rust `object_store` crate through obstore, the client Polars
+  scans S3 with. One connection pool per bucket serves sync and async calls.
+  Install the `obstore` extra to use this backend.
+- `local`: a directory on the local filesystem (`storage_local_dir`), for tests
+  and development without an S3 endpoint.
+
+Paths are `bucket/key`, with or without `s3://`. Every backend raises
+FileNotFoundError for missing objects and FileExistsError for exclusive puts
+on existing ones, and describes objects as `size`, `etag` and `last_modified`.
+
+Manifest, view and tombstone commits rely on exclusive puts failing. S3
+stores that ignore `If-None-Match` succeed instead, so the lifespan checks
+the backend with `verify_exclusive_put` before serving.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from attrs import define, field
+
+from config import settings as global_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    import s3fs
+    from aiobotocore.client import AioBaseClient
+    from obstore.store import S3Store
+
+logger = logging.getLogger(__name__)
+
+
+def split_path(path: str) -> tuple[str, str]:
+    """
+    Split a storage path into its bucket and key.
+
+    Args:
+        path (str): 'bucket/key', with or without `s3://`.
+
+    Returns:
+        tuple[str, str]: The bucket and the key, empty for a bare bucket.
+    """
+    bucket, _, key = path.removeprefix("s3://").strip("/").partition("/")
+    return bucket, key
+
+
+@define
+class StorageBackend:
+    """
+    Object store operations shared by the backends.
+
+    Async calls default to running the sync ones in a thread, backends with a
+    native async client override them.
+    """
+
+    name: str = field(init=False, default="")
+
+    @property
+    def storage_options(self) -> dict[str, Any] | None:
+        """
+        Options for Polars' own object store when scanning `url` paths.
+        """
+        return None
+
+    def url(self, path: str) -> str:
+        """
+        Return the location Polars scans an object at.
+        """
+        return path if path.startswith("s3://") else f"s3://{path}"
+
+    def get(self, path: str) -> bytes:
+        raise NotImplementedError
+
+    def get_range(self, path: str, start: int, end: int) -> bytes:
+        """
+        Read the bytes `[start, end)` of an object.
+        """
+        raise NotImplementedError
+
+    def put(self, path: str, data: bytes, exclusive: bool = False) -> None:
+        raise NotImplementedError
+
+    def delete(self, path: str) -> None:
+        raise NotImplementedError
+
+    def exists(self, path: str) -> bool:
+        raise NotImplementedError
+
+    def info(self, path: str) -> dict:
+        raise NotImplementedError
+
+    def find(self, prefix: str) -> dict[str, dict]:
+        """
+        List every object under a prefix, recursively, with its `info`.
+        """
+        raise NotImplementedError
+
+    def ls(self, path: str) -> list[str]:
+        """
+        List the objects and prefixes one level below a path, buckets for '/'.
+        """
+        raise NotImplementedError
+
+    def mkdir(self, bucket: str) -> None:
+        raise NotImplementedError
+
+    def download(self, path: str, local_path: str) -> None:
+        with open(local_path, "wb") as f:
+            f.write(self.get(path))
+
+    def verify_exclusive_put(self, bucket: str) -> None:
+        """
+        Check that an exclusive put fails on an existing object.
+
+        Puts a probe object under `_probe/` twice and deletes it.
+
+        Args:
+            bucket (str): A bucket the worker writes to.
+
+        Raises:
+            RuntimeError: If the object store overwrote the probe or rejected
+                the exclusive put.
+        """
+        path = f"{bucket}/_probe/exclusive_{uuid.uuid4().hex}"
+        try:
+            self.put(path, b"", exclusive=True)
+        except Exception as e:
+            raise RuntimeError(
+                f"The {self.name} backend cannot put {path} exclusively: {e}"
+            ) from e
+        try:
+            self.put(path, b"", exclusive=True)
+        except FileExistsError:
+            return
+        except Exception as e:
+            raise RuntimeError(
+                f"The {self.name} backend cannot put {path} exclusively: {e}"
+            ) from e
+        else:
+            raise RuntimeError(
+                f"The object store behind the {self.name} backend overwrote {path} "
+                "on an exclusive put, concurrent commits would be lost"
+            )
+        finally:
+            self.delete(path)
+
+    async def start(self) -> None:
+        """
+        Open the connections kept for the async calls.
+        """
+
+    async def close(self) -> None:
+        """
+        Close the connections kept for the async calls.
+        """
+
+    async def get_async(self, path: str) -> bytes:
+        return await asyncio.to_thread(self.get, path)
+
+    async def get_range_async(self, path: str, start: int, end: int) -> bytes:
+        return await asyncio.to_thread(self.get_range, path, start, end)
+
+    async def put_async(self, path: str, data: bytes, exclusive: bool = False) -> None:
+        await asyncio.to_thread(self.put, path, data, exclusive)
+
+    async def delete_async(self, path: str) -> None:
+        await asyncio.to_thread(self.delete, path)
+
+    async def exists_async(self, path: str) -> bool:
+        return await asyncio.to_thread(self.exists, path)
+
+    async def ls_async(self, path: str) -> list[str]:
+        return await asyncio.to_thread(self.ls, path)
+
+    async def mkdir_async(self, bucket: str) -> None:
+        await asyncio.to_thread(self.mkdir, bucket)
+
+    async def download_async(self, path: str, local_path: str) -> None:
+        await asyncio.to_thread(self.download, path, local_path)
+
+    async def upload_async(self, local_path: str, path: str, part_size: int) -> dict:
+        """
+        Upload a local file, in parts of `part_size` bytes if the backend supports it.
+
+        Args:
+            local_path (str): The local file to upload.
+            path (str): The target path, 'bucket/key'.
+            part_size (int): Part size in bytes.
+
+        Returns:
+            dict: The path, byte size and number of parts.
+        """
+        data = await asyncio.to_thread(Path(local_path).read_bytes)
+        await self.put_async(path, data)
+        return {"path": path, "bytes": len(data), "parts": 1}
+
+
+@define
+class S3fsBackend(StorageBackend):
+    """
+    S3 through s3fs, a sync filesystem for worker threads and an async one for routes.
+
+    s3fs is imported on first use, to keep worker startup fast.
+
+    Attributes:
+        key (str): S3 access key.
+        secret (str): S3 secret key.
+        endpoint_url (str): S3 endpoint URL.
+    """
+
+    name: str = field(init=False, default="s3fs")
+    key: str = global_settings.s3_credentials.key
+    secret: str = global_settings.s3_credentials.secret
+    endpoint_url: str = str(global_settings.s3_credentials.endpoint_url)
+    _fs: s3fs.S3FileSystem | None = field(init=False, default=None)
+    _afs: s3fs.S3FileSystem | None = field(init=False, default=None)
+    _session: AioBaseClient | None = field(init=False, default=None)
+
+    def _filesystem(self, asynchronous: bool) -> s3fs.S3FileSystem:
+        import s3fs
+
+        return s3fs.S3FileSystem(
+            key=self.key,
+            secret=self.secret,
+            endpoint_url=self.endpoint_url,
+            asynchronous=asynchronous,
+            skip_instance_cache=asynchronous,
+            config_kwargs=global_settings.s3_client_config,
+        )
+
+    @property
+    def fs(self) -> s3fs.S3FileSystem:
+        if self._fs is None:
+            self._fs = self._filesystem(asynchronous=False)
+        return self._fs
+
+    @property
+    def afs(self) -> s3fs.S3FileSystem:
+        if self._afs is None:
+            self._afs = self._filesystem(asynchronous=True)
+        return self._afs
+
+    @property
+    def storage_options(self) -> dict[str, Any]:
+        return {
+            "endpoint_url": self.endpoint_url,
+            "aws_access_key_id": self.key,
+            "aws_secret_access_key": self.secret,
+        }
+
+    @staticmethod
+    def _info(info: dict) -> dict:
+        return {
+            "size": info["size"],
+            "etag": info["ETag"].strip('"'),
+            "last_modified": info["LastModified"],
+        }
+
+    def get(self, path: str) -> bytes:
+        return self.fs.cat_file(path)
+
+    def get_range(self, path: str, start: int, end: int) -> bytes:
+        return self.fs.cat_file(path, start=start, end=end)
+
+    def put(self, path: str, data: bytes, exclusive: bool = False) -> None:
+        self.fs.pipe_file(path, data, mode="create" if exclusive else "overwrite")
+
+    def delete(self, path: str) -> None:
+        self.fs.rm(path)
+
+    def exists(self, path: str) -> bool:
+        return self.fs.exists(path)
+
+    def info(self, path: str) -> dict:
+        return self._info(self.fs.info(path))
+
+    def find(self, prefix: str) -> dict[str, dict]:
+        return {p: self._info(i) for p, i in self.fs.find(prefix, detail=True).items()}
+
+    def ls(self, path: str) -> list[str]:
+        return self.fs.ls(path, refresh=True)
+
+    def mkdir(self, bucket: str) -> None:
+        self.fs.mkdir(bucket)
+
+    def download(self, path: str, local_path: str) -> None:
+        self.fs.get_file(path, local_path)
+
+    async def start(self) -> None:
+        """
+        Open the aiobotocore session shared by all requests of this worker.
+        """
+        if self._session is None:
+            self._session = await self.afs.set_session()
+
+    async def close(self) -> None:
+        """
+        Close the shared session and its connection pool.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_async(self, path: str) -> bytes:
+        return await self.afs._cat_file(path)
+
+    async def get_range_async(self, path: str, start: int, end: int) -> bytes:
+        return await self.afs._cat_file(path, start=start, end=end)
+
+    async def put_async(self, path: str, data: bytes, exclusive: bool = False) -> None:
+        await self.afs._pipe_file(
+            path, data, mode="create" if exclusive else "overwrite"
+        )
+
+    async def delete_async(self, path: str) -> None:
+        await self.afs._rm(path)
+
+    async def exists_async(self, path: str) -> bool:
+        return await self.afs._exists(path)
+
+    async def ls_async(self, path: str) -> list[str]:
+        return await self.afs._ls(path, refresh=True)
+
+    async def mkdir_async(self, bucket: str) -> None:
+        await self.afs._mkdir(bucket)
+
+    async def download_async(self, path: str, local_path: str) -> None:
+        await self.afs._get_file(path, local_path)
+
+    async def upload_async(self, local_path: str, path: str, part_size: int) -> dict:
+        """
+        Stream a local file to S3 with a resumable multipart upload.
+
+        Parts are read one at a time, so memory stays at one part regardless of the
+        file size. Progress is recorded next to the file in `<local_path>.upload`, and
+        a later call for the same file and target continues after the last uploaded
+        part. A file that changed since the upload started is uploaded again.
+
+        Args:
+            local_path (str): The local file to upload.
+            path (str): The target S3 path, 'bucket/key'.
+            part_size (int): Part size in bytes, at least 5 MB except for the last part.
+
+        Returns:
+            dict: The S3 path, byte size and number of parts.
+        """
+        bucket, key = split_path(path)
+        stat = os.stat(local_path)
+        state_path = f"{local_path}.upload"
+        source = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+        state = None
+        if os.path.exists(state_path):
+            state = json.loads(await asyncio.to_thread(Path(state_path).read_text))
+            if state["source"] != source:
+                await self._abort_upload(bucket, key, state["upload_id"])
+                state = None
+        if state is None:
+            _upload = await self.afs._call_s3(
+                "create_multipart_upload", Bucket=bucket, Key=key
+            )
+            state = {"source": source, "upload_id": _upload["UploadId"], "parts": []}
+
+        with await asyncio.to_thread(open, local_path, "rb") as f:
+            f.seek(len(state["parts"]) * part_size)
+            while True:
+                chunk = await asyncio.to_thread(f.read, part_size)
+                if not chunk and state["parts"]:
+                    break
+                _part = await self.afs._call_s3(
+                    "upload_part",
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=state["upload_id"],
+                    PartNumber=len(state["parts"]) + 1,
+                    Body=chunk,
+                )
+                state["parts"].append(
+                    {"PartNumber": len(state["parts"]) + 1, "ETag": _part["ETag"]}
+                )
+                await asyncio.to_thread(Path(state_path).write_text, json.dumps(state))
+                if len(chunk) < part_size:
+                    break
+
+        await self.afs._call_s3(
+            "complete_multipart_upload",
+            Bucket=bucket,
+            Key=key,
+            UploadId=state["upload_id"],
+            MultipartUpload={"Parts": state["parts"]},
+        )
+        os.remove(state_path)
+        return {"path": path, "bytes": stat.st_size, "parts": len(state["parts"])}
+
+    async def _abort_upload(self, bucket: str, key: str, upload_id: str) -> None:
+        try:
+            await self.afs._call_s3(
+                "abort_multipart_upload", Bucket=bucket, Key=key, UploadId=upload_id
+            )
+        except Exception as e:
+            logger.info(
+                f"Could not abort stale upload {upload_id} of {bucket}/{key}: {e}",
+                exc_info=True,
+            )
+
+
+@define
+class ObstoreBackend(StorageBackend):
+    """
+    S3 through obstore, the Rust object store client Polars scans with.
+
+    One store per bucket is created on first use and shared by sync and async calls.
+    obstore has no bucket API, buckets are listed and created through s3fs.
+    Multipart uploads are not resumed.
+
+    Attributes:
+        key (str): S3 access key.
+        secret (str): S3 secret key.
+        endpoint_url (str): S3 endpoint URL.
+    """
+
+    name: str = field(init=False, default="obstore")
+    key: str = global_settings.s3_credentials.key
+    secret: str = global_settings.s3_credentials.secret
+    endpoint_url: str = str(global_settings.s3_credentials.endpoint_url)
+    _stores: dict[str, S3Store] = field(init=False, factory=dict)
+    _buckets: S3fsBackend | None = field(init=False, default=None)
+
+    def __attrs_post_init__(self):
+        try:
+            import obstore  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                "storage_backend 'obstore' needs the obstore extra, "
+                "i.e. `uv sync --extra obstore`"
+            ) from e
+
+    @property
+    def buckets(self) -> S3fsBackend:
+        """
+        The s3fs backend serving the bucket calls.
+        """
+        if self._buckets is None:
+            self._buckets = S3fsBackend(
+                key=self.key, secret=self.secret, endpoint_url=self.endpoint_url
+            )
+        return self._buckets
+
+    def _store(self, path: str) -> tuple[S3Store, str]:
+        from obstore.store import S3Store
+
+        bucket, key = split_path(path)
+        if bucket not in self._stores:
+            self._stores[bucket] = S3Store(
+                bucket,
+                endpoint=self.endpoint_url.rstrip("/"),
+                access_key_id=self.key,
+                secret_access_key=self.secret,
+                region="us-east-1",
+                virtual_hosted_style_request=False,
+                conditional_put="etag",
+                client_options={
+                    "allow_http": self.endpoint_url.startswith("http://"),
+                    "connect_timeout": timedelta(
+                        seconds=global_settings.s3_connect_timeout
+                    ),
+                    "timeout": timedelta(seconds=global_settings.s3_read_timeout),
+                    "pool_max_idle_per_host": str(
+                        global_settings.s3_max_pool_connections
+                    ),
+                },
+                retry_config={"max_retries": global_settings.s3_max_attempts},
+            )
+        return self._stores[bucket], key
+
+    @property
+    def storage_options(self) -> dict[str, Any]:
+        return {
+            "endpoint_url": self.endpoint_url,
+            "aws_access_key_id": self.key,
+            "aws_secret_access_key": self.secret,
+        }
+
+    @staticmethod
+    def _info(meta: dict) -> dict:
+        return {
+            "size": meta["size"],
+            "etag": (meta["e_tag"] or "").strip('"'),
+            "last_modified": meta["last_modified"],
+        }
+
+    @staticmethod
+    @contextmanager
+    def _errors(path: str) -> Iterator[None]:
+        from obstore.exceptions import (
+            AlreadyExistsError,
+            NotFoundError,
+            PreconditionError,
+        )
+
+        try:
+            yield
+        except NotFoundError as e:
+            raise FileNotFoundError(path) from e
+        except (AlreadyExistsError, PreconditionError) as e:
+            raise FileExistsError(path) from e
+
+    def get(self, path: str) -> bytes:
+        import obstore
+
+        with self._errors(path):
+            return bytes(obstore.get(*self._store(path)).bytes())
+
+    def get_range(self, path: str, start: int, end: int) -> bytes:
+        import obstore
+
+        with self._errors(path):
+            return bytes(obstore.get_range(*self._store(path), start=start, end=end))
+
+    def put(self, path: str, data: bytes, exclusive: bool = False) -> None:
+        import obstore
+
+        with self._errors(path):
+            obstore.put(
+                *self._store(path), data, mode="create" if exclusive else "overwrite"
+            )
+
+    def delete(self, path: str) -> None:
+        import obstore
+
+        obstore.delete(*self._store(path))
+
+    def exists(self, path: str) -> bool:
+        try:
+            self.info(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def info(self, path: str) -> dict:
+        import obstore
+
+        with self._errors(path):
+            return self._info(obstore.head(*self._store(path)))
+
+    def find(self, prefix: str) -> dict[str, dict]:
+        import obstore
+
+        store, key = self._store(prefix)
+        bucket, _ = split_path(prefix)
+        return {
+            f"{bucket}/{meta['path']}": self._info(meta)
+            for meta in obstore.list(store, key or None).collect()
+        }
+
+    def ls(self, path: str) -> list[str]:
+        import obstore
+
+        bucket, _ = split_path(path)
+        if not bucket:
+            return self.buckets.ls(path)
+        listing = obstore.list_with_delimiter(*self._store(path))
+        return [f"{bucket}/{p}" for p in listing["common_prefixes"]] + [
+            f"{bucket}/{meta['path']}" for meta in listing["objects"]
+        ]
+
+    def mkdir(self, bucket: str) -> None:
+        self.buckets.mkdir(bucket)
+
+    def download(self, path: str, local_path: str) -> None:
+        import obstore
+
+        with self._errors(path):
+            result = obstore.get(*self._store(path))
+        with open(local_path, "wb") as f:
+            f.writelines(result)
+
+    async def get_async(self, path: str) -> bytes:
+        import obstore
+
+        with self._errors(path):
+            result = await obstore.get_async(*self._store(path))
+            return bytes(await result.bytes_async())
+
+    async def get_range_async(self, path: str, start: int, end: int) -> bytes:
+        import obstore
+
+        with self._errors(path):
+            return bytes(
+                await obstore.get_range_async(*self._store(path), start=start, end=end)
+            )
+
+    async def put_async(self, path: str, data: bytes, exclusive: bool = False) -> None:
+        import obstore
+
+        with self._errors(path):
+            await obstore.put_async(
+                *self._store(path), data, mode="create" if exclusive else "overwrite"
+            )
+
+    async def delete_async(self, path: str) -> None:
+        import obstore
+
+        await obstore.delete_async(*self._store(path))
+
+    async def upload_async(self, local_path: str, path: str, part_size: int) -> dict:
+        import obstore
+
+        size = os.stat(local_path).st_size
+        # Multipart in `part_size` chunks, restarted from scratch if interrupted
+        await obstore.put_async(
+            *self._store(path), Path(local_path), chunk_size=part_size
+        )
+        return {"path": path, "bytes": size, "parts": max(1, -(-size // part_size))}
+
+
+@define
+class LocalBackend(StorageBackend):
+    """
+    Objects as files under a local directory, `{root}/{bucket}/{key}`.
+
+    Writes go to a temporary file renamed into place, exclusive writes are
+    hard-linked so only one writer wins.
+
+    Attributes:
+        root (str): Directory holding one subdirectory per bucket.
+    """
+
+    name: str = field(init=False, default="local")
+    root: str = global_settings.storage_local_dir
+
+    def __attrs_post_init__(self):
+        Path(self.root).mkdir(parents=True, exist_ok=True)
+
+    def _file(self, path: str) -> Path:
+        return Path(self.root, *split_path(path))
+
+    def url(self, path: str) -> str:
+        return str(self._file(path).resolve())
+
+    def get(self, path: str) -> bytes:
+        return self._file(path).read_bytes()
+
+    def get_range(self, path: str, start: int, end: int) -> bytes:
+        with open(self._file(path), "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def put(self, path: str, data: bytes, exclusive: bool = False) -> None:
+        target = self._file(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            if exclusive:
+                os.link(tmp, target)  # FileExistsError if another writer won
+            else:
+                os.replace(tmp, target)
+        finally:
+            Path(tmp).unlink(missing_ok=True)
+
+    def delete(self, path: str) -> None:
+        self._file(path).unlink()
+
+    def exists(self, path: str) -> bool:
+        return self._file(path).exists()
+
+    def info(self, path: str) -> dict:
+        stat = self._file(path).stat()
+        return {
+            "size": stat.st_size,
+            "etag": f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+            "last_modified": datetime.fromtimestamp(stat.st_mtime, UTC),
+        }
+
+    def find(self, prefix: str) -> dict[str, dict]:
+        base = self._file(prefix)
+        if not base.is_dir():
+            return {}
+        found = {}
+        for directory, _, files in os.walk(base):
+            for name in files:
+                if not name.endswith(".tmp"):
+                    path = Path(directory, name).relative_to(self.root).as_posix()
+                    found[path] = self.info(path)
+        return dict(sorted(found.items()))
+
+    def ls(self, path: str) -> list[str]:
+        base = self._file(path)
+        return sorted(
+            entry.relative_to(self.root).as_posix()
+            for entry in base.iterdir()
+            if not entry.name.endswith(".tmp")
+        )
+
+    def mkdir(self, bucket: str) -> None:
+        self._file(bucket).mkdir(parents=True, exist_ok=True)
+
+    def download(self, path: str, local_path: str) -> None:
+        shutil.copyfile(self._file(path), local_path)
+
+    async def upload_async(self, local_path: str, path: str, part_size: int) -> dict:
+        target = self._file(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(shutil.copyfile, local_path, target)
+        return {"path": path, "bytes": target.stat().st_size, "parts": 1}
+
+
+BACKENDS: dict[str, type[StorageBackend]] = {
+    "s3fs": S3fsBackend,
+    "obstore": ObstoreBackend,
+    "local": LocalBackend,
+}
+
+
+@cache
+def storage_backend(name: str | None = None) -> StorageBackend:
+    """
+    Return the backend of this worker, shared by the sync and async S3 services.
+
+    Args:
+        name (str | None): 's3fs', 'obstore' or 'local', `storage_backend` if omitted.
+
+    Returns:
+        StorageBackend: The backend instance for the name.
+    """
+    return BACKENDS[name or global_settings.storage_backend]()
+
+
+class RangeReader(io.RawIOBase):
+    """
+    A seekable read-only file over an object, reading only the ranges asked for.
+
+    Wrap it in `io.BufferedReader` so small reads, i.e. of a Parquet footer, are
+    served by one range request.
+    """
+
+    def __init__(self, backend: StorageBackend, path: str):
+        self.backend = backend
+        self.path = path
+        self.size = backend.info(path)["size"]
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[
+            whence
+        ]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        data = self.backend.get_range(self.path, self.position, end)
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
@@ -0,0 +1,273 @@
+"""
+Merge-on-read deletes and upserts of books.
+
+A delete writes a small tombstone file listing the deleted ISBNs or hashes
+under `daily/_tombstones/{date}/` and publishes it in the manifest. Data files
+are never rewritten for it: readers hide the matching rows of every data file
+added at an older manifest version than the tombstone, while they scan.
+
+An upsert writes the new rows as a data file and a tombstone of their ISBNs and
+hashes, committed together. Both share one manifest version, so the tombstone
+hides the previous rows of the books but not the upserted ones.
+
+Compaction drops the deleted rows from the files it merges, and the merged file
+is newer than every tombstone. A tombstone is retired once no active data file
+is older than it, which happens when compaction rewrote them all. Files cataloged
+before versions existed count as version 0 and keep tombstones until compacted.
+
+Rows still buffered in another worker when a delete is committed are flushed
+later as newer rows, and stay visible. Only the deleting worker drops the
+matching rows from its in-memory buffer.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import os
+from threading import Lock
+from uuid import uuid4
+
+from attrs import define, field
+from whenever import Instant
+
+from schemas.polars import to_book_schema, tombstone_schema
+from services.manifest import (
+    ACTIVE,
+    DATASET_BUCKET,
+    TOMBSTONE,
+    ManifestService,
+)
+from services.parquet import write_parquet
+from services.s3 import S3Service
+from services.utlis import SingletonMetaNoArgs, lazy_import
+
+pl = lazy_import("polars")
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_PREFIX = "_tombstones"
+KEY_COLUMNS = ("isbn", "hash")
+
+
+def tombstone_frame(isbns: list[str], hashes: list[int]) -> pl.DataFrame:
+    """
+    Build the rows of a tombstone file, one key per row.
+
+    Args:
+        isbns (list[str]): ISBNs whose rows are deleted.
+        hashes (list[int]): Hashes whose rows are deleted.
+
+    Returns:
+        pl.DataFrame: The keys in `tombstone_schema()`.
+    """
+    isbns, hashes = sorted(set(isbns)), sorted(set(hashes))
+    return pl.DataFrame(
+        {
+            "isbn": isbns + [None] * len(hashes),
+            "hash": [None] * len(isbns) + hashes,
+        },
+        schema=tombstone_schema(),
+    )
+
+
+@define
+class TombstoneService(metaclass=SingletonMetaNoArgs):
+    """
+    A singleton service writing tombstones and resolving the
+    keys deleted from data files.
+
+    Tombstone files never change, they are read once per worker and the combined
+    keys are cached per manifest version.
+    """
+
+    _cache_lock: Lock = field(init=False, factory=Lock)
+    _files: dict[str, pl.DataFrame] = field(init=False, factory=dict)
+    _cached: tuple[int, pl.DataFrame] | None = field(init=False, default=None)
+
+    @property
+    def manifest(self) -> ManifestService:
+        return ManifestService()
+
+    @property
+    def s3(self) -> S3Service:
+        return S3Service()
+
+    def load(self) -> pl.DataFrame:
+        """
+        Load the keys of every active tombstone.
+
+        Returns:
+            pl.DataFrame: `isbn` and `hash` keys with the manifest `version` of their
+                tombstone.
+        """
+        version, frame = self.manifest.snapshot()
+        with self._cache_lock:
+            if self._cached is not None and self._cached[0] == version:
+                return self._cached[1]
+        entries = frame.filter(
+            (pl.col("kind") == TOMBSTONE) & (pl.col("status") == ACTIVE)
+        )
+        keys = []
+        for path, added in entries.select("path", "version").iter_rows():
+            if path not in self._files:
+                self._files[path] = pl.read_parquet(self.s3.read_bytes(path))
+            keys.append(
+                self._files[path].with_columns(
+                    pl.lit(added or 0, dtype=pl.Int64).alias("version")
+                )
+            )
+        tombstones = pl.concat(
+            keys or [pl.DataFrame(schema={**tombstone_schema(), "version": pl.Int64})]
+        )
+        with self._cache_lock:
+            paths = set(entries.get_column("path"))
+            # Retired tombstones are never read again
+            self._files = {p: f for p, f in self._files.items() if p in paths}
+            if self._cached is None or version > self._cached[0]:
+                self._cached = (version, tombstones)
+        return tombstones
+
+    def deleted_keys(self, entries: pl.DataFrame) -> list[dict[str, list] | None]:
+        """
+        Resolve the keys deleted from data files by the tombstones newer than them.
+
+        Args:
+            entries (pl.DataFrame): Catalog entries of the data files.
+
+        Returns:
+            list[dict | None]: Deleted `isbn` and `hash` values per entry, None where
+                nothing is deleted.
+        """
+        tombstones = self.load()
+        if tombstones.is_empty():
+            return [None] * entries.height
+        by_version = {}
+        for added in entries.get_column("version").fill_null(0):
+            if added not in by_version:
+                newer = tombstones.filter(pl.col("version") > added)
+                by_version[added] = (
+                    {
+                        c: newer.get_column(c).drop_nulls().unique().to_list()
+                        for c in KEY_COLUMNS
+                    }
+                    if newer.height
+                    else None
+                )
+        return [
+            by_version[added] for added in entries.get_column("version").fill_null(0)
+        ]
+
+    def deleted_for_paths(self, paths: list[str]) -> list[dict[str, list] | None]:
+        """
+        Resolve the keys deleted from data files given by their catalog paths.
+
+        Args:
+            paths (list[str]): Catalog paths of the data files.
+
+        Returns:
+            list[dict | None]: Deleted `isbn` and `hash` values per path.
+        """
+        _, frame = self.manifest.snapshot()
+        entries = pl.DataFrame({"path": paths}).join(
+            frame.select("path", "version"),
+            on="path",
+            how="left",
+            maintain_order="left",
+        )
+        return self.deleted_keys(entries)
+
+    def _path(self) -> str:
+        date = Instant.now().py_datetime().strftime("%Y%m%d")
+        name = f"tombstone_{os.getpid()}_{uuid4().hex}.parquet"
+        return f"{DATASET_BUCKET}/{TOMBSTONE_PREFIX}/{date}/{name}"
+
+    def _write(self, frame: pl.DataFrame) -> dict:
+        path = self._path()
+        buffer = io.BytesIO()
+        write_parquet(frame, buffer)
+        self.s3.write_bytes(path, buffer.getvalue())
+        return {
+            "path": path,
+            "kind": TOMBSTONE,
+            "rows": frame.height,
+            "bytes": len(buffer.getvalue()),
+        }
+
+    def delete(self, isbns: list[str], hashes: list[int]) -> dict:
+        """
+        Delete books by ISBN or hash with a tombstone.
+
+        Args:
+            isbns (list[str]): ISBNs whose rows are deleted.
+            hashes (list[int]): Hashes whose rows are deleted.
+
+        Returns:
+            dict: The tombstone path, its key count and the committed manifest version.
+        """
+        entry = self._write(tombstone_frame(isbns, hashes))
+        try:
+            version = self.manifest.commit(add=[entry])
+        except Exception:
+            self.s3.delete_parquet_file(entry["path"])
+            raise
+        logger.info(f"Tombstone {entry['path']} deletes {entry['rows']} keys")
+        return {
+            "tombstone": entry["path"],
+            "keys": entry["rows"],
+            "manifest_version": version,
+        }
+
+    def upsert(self, dataframe: pl.DataFrame, path: str) -> dict:
+        """
+        Replace the books of a frame by its rows, matched on ISBN and hash.
+
+        Args:
+            dataframe (pl.DataFrame): The new rows in the book schema.
+            path (str): The path of the data file inside the dataset bucket.
+
+        Returns:
+            dict: The materialization result with the tombstone path and the
+                committed manifest version.
+        """
+        result = self.s3.materialize_dataframe(dataframe, path)
+        keys = to_book_schema(dataframe.select("isbn", "hash"), compact=False)
+        entry = self._write(
+            tombstone_frame(
+                keys.get_column("isbn").to_list(), keys.get_column("hash").to_list()
+            )
+        )
+        try:
+            # One version for both, so the tombstone only hides older rows
+            result["manifest_version"] = self.manifest.commit(
+                add=[self.manifest.entry(result, dataframe), entry]
+            )
+        except Exception:
+            self.s3.delete_parquet_file(f"{DATASET_BUCKET}/{path}")
+            self.s3.delete_parquet_file(entry["path"])
+            raise
+        result["tombstone"] = entry["path"]
+        return result
+
+    def retire(self) -> list[str]:
+        """
+        Mark the tombstones no active data file is older than as removed.
+
+        Removed tombstones stay readable for older snapshots and are deleted with
+        the other replaced files once the retention window passes.
+
+        Returns:
+            list[str]: The retired tombstone paths.
+        """
+        _, frame = self.manifest.snapshot()
+        retired = frame.filter(
+            (pl.col("kind") == TOMBSTONE) & (pl.col("status") == ACTIVE)
+        )
+        oldest = self.manifest.active_entries().get_column("version").fill_null(0).min()
+        if oldest is not None:
+            retired = retired.filter(pl.col("version").fill_null(0) <= oldest)
+        paths = retired.get_column("path").to_list()
+        if paths:
+            self.manifest.commit(remove=paths)
+            logger.info(f"Retired {len(paths)} tombstones, no data file is older")
+        return paths
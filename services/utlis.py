@@ -1,8 +1,9 @@
-from threading import Lock
+import importlib.util
 import logging
-
-from rich.console import Console
-from rich.logging import RichHandler
+import os
+import sys
+from threading import Lock
+from types import ModuleType
 
 
 class SingletonMeta(type):
@@ -50,9 +51,40 @@ class AppLogger(metaclass=SingletonMeta):
         return self._logger
 
 
-class RichConsoleHandler(RichHandler):
-    def __init__(self, width=200, style=None, **kwargs):
-        super().__init__(
-            console=Console(color_system="256", width=width, style=style, stderr=True),
-            **kwargs,
-        )
+def pid_alive(pid: int) -> bool:
+    """
+    Check whether a process with this pid is running.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Import a module on first attribute access, to keep it out of worker startup.
+
+    The `importlib.util.LazyLoader` recipe: the module is registered right away
+    and executed when code first uses it. Annotations naming it have to be
+    deferred with `from __future__ import annotations`, and an `import` statement
+    of the module anywhere loads it at once.
+
+    Args:
+        name (str): A top-level module name, i.e. 'polars'.
+
+    Returns:
+        ModuleType: The module, loaded or still pending.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
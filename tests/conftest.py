@@ -0,0 +1,104 @@
+"""
+Shared fixtures of the test suite.
+
+The app runs against the `local` storage backend and a thread compute executor,
+with every directory it writes to, the SQLite index files included, under one
+temporary directory. The settings are read at import, so the environment is set
+before any application module is imported.
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(tempfile.mkdtemp(prefix="grizzly-tests-"))
+
+os.environ.update(
+    STORAGE_BACKEND="local",
+    STORAGE_LOCAL_DIR=str(ROOT / "storage"),
+    SPILL_DIR=str(ROOT / "spill"),
+    OBJECT_CACHE_DIR=str(ROOT / "cache"),
+    ROLLOVER_DIR=str(ROOT),
+    COMPUTE_EXECUTOR="thread",
+    COMPACTION_ENABLED="false",
+    ROLLOVER_ENABLED="false",
+    INGEST_COALESCE_WINDOW_MS="0",
+)
+os.chdir(ROOT)  # The SQLite index is written to the working directory
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from schemas.polars import book_hash
+from services.datasets import DatasetRegistry
+from services.utlis import SingletonMetaNoArgs
+
+BUCKETS = ("daily", "tmp")
+
+
+@pytest.fixture(autouse=True)
+def storage():
+    """
+    Start every test with empty buckets, no buffers and fresh singletons.
+
+    Yields:
+        Path: The directory of the local storage backend.
+    """
+    for directory in ("storage", "spill", "cache"):
+        shutil.rmtree(ROOT / directory, ignore_errors=True)
+    for bucket in BUCKETS:
+        (ROOT / "storage" / bucket).mkdir(parents=True)
+    for dataset in DatasetRegistry().all():
+        if hasattr(app, dataset.name):
+            delattr(app, dataset.name)
+    SingletonMetaNoArgs._instances.clear()
+    yield ROOT / "storage"
+    SingletonMetaNoArgs._instances.clear()
+
+
+@pytest.fixture
+def client(storage):
+    """
+    A client of the app with its lifespan running.
+    """
+    with TestClient(app) as client:
+        yield client
+
+
+def isbn(n: int) -> str:
+    """
+    A valid ISBN-13 numbered `n`.
+    """
+    digits = f"978{n:09d}"
+    check = -sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10
+    return f"{digits}{check}"
+
+
+def book(n: int, author: str = "Frank Herbert", pages: int = 412, **fields) -> dict:
+    """
+    A book payload of the ingest endpoints, with the ISBN numbered `n`.
+    """
+    return {
+        "isbn": isbn(n),
+        "description": f"Book {n} by {author}",
+        "author": author,
+        "pages": pages,
+        "pub_date": "1965-08-01",
+        **fields,
+    }
+
+
+def row(n: int, **fields) -> dict:
+    """
+    A book row as the ingest endpoints buffer it, with the ISBN numbered `n`.
+    """
+    payload = book(n, **fields)
+    return {
+        **payload,
+        "pub_date": date.fromisoformat(payload["pub_date"]),
+        "pid": os.getpid(),
+        "hash": book_hash(payload["isbn"] + str(payload["pages"]) + payload["author"]),
+    }
@@ -0,0 +1,62 @@
+from services.admission import AdmissionService
+from tests.conftest import book
+
+
+def test_overload_is_shed_before_the_body_is_parsed(client):
+    AdmissionService().max_buffer_mb = -1
+
+    _res = client.post("/grizzly/v1/ingest_data", content=b"not json")
+
+    assert _res.status_code == 503
+    assert _res.headers["retry-after"] == "5"
+    assert AdmissionService().stats()["shed"] == {"buffer": 1}
+
+
+def test_admitted_requests_are_counted_once(client):
+    _res = client.post("/grizzly/v1/ingest_data", json=[book(1)])
+
+    assert _res.status_code == 200
+    assert AdmissionService().stats()["admitted"] == 1
+
+
+def test_client_rate_limit_answers_429(client):
+    admission = AdmissionService()
+    admission.client_rate = 0.001
+    admission.client_burst = 1
+    headers = {"X-Client-Id": "loader"}
+
+    first = client.post("/grizzly/v1/ingest_data", json=[book(1)], headers=headers)
+    second = client.post("/grizzly/v1/ingest_data", json=[book(2)], headers=headers)
+    other = client.post(
+        "/grizzly/v1/ingest_data", json=[book(3)], headers={"X-Client-Id": "x"}
+    )
+
+    assert (first.status_code, second.status_code, other.status_code) == (200, 429, 200)
+    assert int(second.headers["retry-after"]) > 1
+
+
+def test_pending_flushes_shed_ingest(client):
+    admission = AdmissionService()
+    admission.flush_started()
+    admission.flush_started()
+
+    _res = client.post("/grizzly/v1/books/upsert", json=[book(1)])
+
+    assert _res.status_code == 503
+    assert admission.stats()["shed"] == {"flushes": 1}
+
+
+def test_pending_index_tasks_are_released_when_run_or_discarded():
+    admission = AdmissionService()
+    ran = admission.index_task(lambda value: None, value=1)
+    failed = admission.index_task(lambda: 1 / 0)
+    admission.index_task(print)  # Dropped without running
+    assert admission.stats()["pending_index_tasks"] == 2
+
+    ran()
+    try:
+        failed()
+    except ZeroDivisionError:
+        pass
+
+    assert admission.stats()["pending_index_tasks"] == 0
@@ -0,0 +1,111 @@
+import io
+import json
+
+import polars as pl
+import pyarrow as pa
+import pytest
+
+from services.bulk import isbn13_expr, validate_books
+from tests.conftest import book, isbn, row
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def isbn10(n: int) -> str:
+    """
+    The ISBN-10 of `isbn(n)`.
+    """
+    digits = f"{n:09d}"
+    check = -sum((10 - i) * int(d) for i, d in enumerate(digits)) % 11
+    return digits + ("X" if check == 10 else str(check))
+
+
+def query(client) -> list[dict]:
+    rows = client.get(
+        "/grizzly/v1/filter_parquets",
+        params={"bucket": "daily", "file_name": "", "value": 10_000},
+    ).json()["data"]
+    return sorted(rows, key=lambda r: r["isbn"])
+
+
+def test_isbn_expression_normalizes_and_rejects():
+    values = pl.Series(
+        [isbn10(7), isbn(8), f"978-{isbn(9)[3:]}", "9780000000000", "12345"]
+    )
+
+    frame = pl.select(isbn13_expr(pl.lit(values)))
+
+    assert frame.to_series().to_list() == [isbn(7), isbn(8), isbn(9), None, None]
+
+
+def test_validated_rows_match_the_json_path():
+    raw = pl.DataFrame([book(1), book(2, pages="many")])
+
+    valid, rejected = validate_books(raw)
+
+    assert rejected == 1
+    assert valid.select("isbn", "pages", "author", "hash").to_dicts() == [
+        {k: row(1)[k] for k in ("isbn", "pages", "author", "hash")}
+    ]
+
+
+def test_ndjson_is_read_in_chunks(client):
+    lines = [json.dumps(book(n)) for n in range(1, 6)] + [
+        json.dumps(book(6, isbn="123"))
+    ]
+    body = "\n".join(lines).encode()
+    chunks = (body[i : i + 50] for i in range(0, len(body), 50))
+
+    _res = client.post("/grizzly/v1/ingest_ndjson", content=chunks).json()
+    client.post(f"{BOOKS}/flush")
+
+    assert (_res["accepted"], _res["rejected"]) == (5, 1)
+    assert [r["isbn"] for r in query(client)] == [isbn(n) for n in range(1, 6)]
+
+
+def test_arrow_stream_is_ingested(client):
+    table = pa.Table.from_pylist([book(1, isbn=isbn10(1)), book(2)])
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, table.schema) as writer:
+        writer.write_table(table, max_chunksize=1)
+
+    _res = client.post("/grizzly/v1/ingest_arrow", content=buffer.getvalue()).json()
+    client.post(f"{BOOKS}/flush")
+
+    assert (_res["accepted"], _res["rejected"]) == (2, 0)
+    assert [r["isbn"] for r in query(client)] == [isbn(1), isbn(2)]
+
+
+def test_parquet_upload_with_typed_columns(client):
+    frame = pl.DataFrame([row(n) for n in (1, 2, 3)]).drop("pid", "hash")
+    buffer = io.BytesIO()
+    frame.write_parquet(buffer, row_group_size=1)
+
+    _res = client.post("/grizzly/v1/ingest_parquet", content=buffer.getvalue()).json()
+    client.post(f"{BOOKS}/flush")
+
+    assert (_res["accepted"], _res["rejected"]) == (3, 0)
+    assert [(r["isbn"], r["pages"]) for r in query(client)] == [
+        (isbn(n), 412) for n in (1, 2, 3)
+    ]
+
+
+@pytest.mark.parametrize(
+    "endpoint, body",
+    [
+        ("ingest_ndjson", b'{"isbn": '),
+        ("ingest_parquet", b"not a parquet file"),
+    ],
+)
+def test_unreadable_uploads_are_rejected(client, endpoint, body):
+    _res = client.post(f"/grizzly/v1/{endpoint}", content=body)
+
+    assert _res.status_code == 422
+
+
+def test_ndjson_rows_missing_fields_are_rejected(client):
+    body = "\n".join([json.dumps(book(1)), json.dumps({"isbn": isbn(2)})]).encode()
+
+    _res = client.post("/grizzly/v1/ingest_ndjson", content=body).json()
+
+    assert (_res["accepted"], _res["rejected"]) == (1, 1)
@@ -0,0 +1,75 @@
+import io
+import os
+
+import polars as pl
+
+from services.cache import ObjectCache
+from services.compute import build_frame, frame_from_ipc
+from services.s3 import S3Service
+from tests.conftest import book, isbn, row
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def put(path: str, *numbers: int) -> None:
+    buffer = io.BytesIO()
+    frame_from_ipc(build_frame([row(n) for n in numbers])).write_parquet(buffer)
+    S3Service().write_bytes(path, buffer.getvalue())
+
+
+def test_repeat_reads_hit_the_local_copy():
+    put("tmp/a.parquet", 1, 2)
+    cache = ObjectCache()
+
+    first = cache.read_parquet("tmp/a.parquet")
+    second = cache.read_parquet("s3://tmp/a.parquet")
+
+    assert first.equals(second)
+    assert first.get_column("isbn").to_list() == [isbn(1), isbn(2)]
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_overwritten_object_is_fetched_again(storage):
+    put("tmp/a.parquet", 1)
+    cache = ObjectCache()
+    stale = cache.local_path("tmp/a.parquet")
+    put("tmp/a.parquet", 1, 2, 3)
+    os.utime(storage / "tmp" / "a.parquet", ns=(1, 1))  # A different ETag
+
+    fresh = cache.local_path("tmp/a.parquet")
+
+    assert fresh != stale and not os.path.exists(stale)
+    assert pl.read_ipc(fresh, memory_map=True).height == 3
+    assert cache.stats()["files"] == 1
+
+
+def test_least_recently_used_files_are_evicted():
+    cache = ObjectCache()
+    for name in "abc":
+        put(f"tmp/{name}.parquet", *range(2_000))
+    first = cache.local_path("tmp/a.parquet")
+    cache.max_mb = os.path.getsize(first) * 2.5 / 1024**2
+    oldest = cache.local_path("tmp/b.parquet")
+    os.utime(oldest, (0, 0))  # Used before a, without waiting for the clock to tick
+    cache.local_path("tmp/c.parquet")
+
+    _res = cache.stats()
+
+    assert (_res["files"], _res["evictions"]) == (2, 1)
+    assert os.path.exists(first) and not os.path.exists(oldest)
+
+
+def test_queries_go_through_the_cache(client):
+    client.post("/grizzly/v1/ingest_data", json=[book(1)])
+    client.post(f"{BOOKS}/flush")
+
+    filter_parquets = {"bucket": "daily", "file_name": "", "value": 10_000}
+    client.get("/grizzly/v1/filter_parquets", params=filter_parquets)
+    before = client.get("/grizzly/v1/cache_stats").json()
+    client.get("/grizzly/v1/filter_parquets", params=filter_parquets)
+    after = client.get("/grizzly/v1/cache_stats").json()
+
+    # The latest view refresh may read the flushed file too, but
+    # only the first access misses
+    assert (after["files"], after["misses"]) == (1, before["misses"])
+    assert after["hits"] > before["hits"]
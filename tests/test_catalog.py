@@ -0,0 +1,68 @@
+import shutil
+
+import pytest
+
+from services.manifest import ManifestService
+from services.storage import LocalBackend
+from tests.conftest import book, isbn
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def flush(client, *numbers: int) -> str:
+    client.post("/grizzly/v1/ingest_data", json=[book(n) for n in numbers])
+    return client.post(f"{BOOKS}/flush").json()["message"]["path"]
+
+
+def test_dataset_bucket_is_listed_from_the_catalog(client, monkeypatch):
+    paths = [flush(client, 1, 2), flush(client, 3)]
+    monkeypatch.setattr(LocalBackend, "find", lambda *a: pytest.fail("listed S3"))
+    monkeypatch.setattr(LocalBackend, "ls", lambda *a: pytest.fail("listed S3"))
+
+    files = client.get("/grizzly/v1/list_files/daily").json()["files"]
+    rows = client.get(
+        "/grizzly/v1/filter_parquets",
+        params={"bucket": "daily", "file_name": "", "value": 10_000},
+    ).json()["data"]
+
+    assert sorted(files) == sorted(f"daily/{p}" for p in paths)
+    assert len(rows) == 3
+
+
+def test_dataset_stats_come_from_the_catalog(client):
+    flush(client, 1, 2)
+    flush(client, 3)
+
+    [day] = client.get("/grizzly/v1/dataset_stats").json()["days"]
+
+    assert (day["files"], day["rows"]) == (2, 3)
+    assert day["distinct_isbn"] == 3
+    assert day["min_pub_date"] == day["max_pub_date"] == "1965-08-01"
+
+
+def test_reconcile_registers_unknown_files_and_drops_missing_ones(client, storage):
+    kept = flush(client, 1)
+    gone = flush(client, 2)
+    unknown = kept.replace(".parquet", "_unknown.parquet")
+    # A writer that died before committing, and a file deleted behind the catalog
+    shutil.copy(storage / "daily" / kept, storage / "daily" / unknown)
+    (storage / "daily" / gone).unlink()
+    manifest = ManifestService()
+
+    _res = manifest.reconcile()
+
+    assert _res["registered"] == [f"daily/{unknown}"]
+    assert _res["dropped"] == [f"daily/{gone}"]
+    assert sorted(manifest.active_files()) == sorted(
+        [f"daily/{kept}", f"daily/{unknown}"]
+    )
+    assert manifest.reconcile()["manifest_version"] is None
+
+
+def test_catalog_entries_carry_book_stats(client):
+    flush(client, 1, 2)
+
+    [entry] = ManifestService().active_entries().to_dicts()
+
+    assert (entry["min_isbn"], entry["max_isbn"]) == (isbn(1), isbn(2))
+    assert entry["rows"] == 2 and entry["bytes"] > 0
@@ -0,0 +1,82 @@
+import pyarrow as pa
+
+from services.changes import FINAL_SEQ, Cursor, flush_position
+from tests.conftest import book, isbn
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def flush(client, *numbers: int) -> str:
+    client.post("/grizzly/v1/ingest_data", json=[book(n) for n in numbers])
+    return client.post(f"{BOOKS}/flush").json()["message"]["path"]
+
+
+def changes(client, cursor: str | None = None, **params) -> tuple[list[str], str, dict]:
+    _res = client.get(f"{BOOKS}/changes", params={"cursor": cursor, **params})
+    assert _res.status_code == 200
+    table = pa.ipc.open_stream(_res.content).read_all()
+    return table.column("isbn").to_pylist(), _res.headers["X-Next-Cursor"], _res.headers
+
+
+def test_flush_positions_come_from_file_names():
+    assert flush_position("daily/20260101/books_42_007.parquet") == ("20260101/42", 7)
+    assert flush_position("20260101/books_42_final_1a2b.parquet") == (
+        "20260101/42",
+        FINAL_SEQ,
+    )
+    assert flush_position("20260101/daily_42.parquet") == ("20260101/42", FINAL_SEQ)
+    assert flush_position("daily/20260101/compacted_1a2b.parquet") is None
+
+
+def test_cursor_round_trip():
+    cursor = Cursor(version=7, writers={"20260101/42": 3})
+
+    assert Cursor.decode(cursor.encode()) == cursor
+    assert Cursor.decode(None) == Cursor()
+
+
+def test_feed_returns_only_rows_flushed_since_the_cursor(client):
+    flush(client, 1, 2)
+    flush(client, 3)
+
+    rows, cursor, headers = changes(client)
+    assert rows == [isbn(1), isbn(2), isbn(3)]
+    assert (headers["X-Change-Files"], headers["X-Change-Rows"]) == ("2", "3")
+    assert changes(client, cursor)[0] == []
+
+    flush(client, 4)
+
+    rows, cursor, _ = changes(client, cursor)
+    assert rows == [isbn(4)]
+    assert changes(client, cursor)[0] == []
+
+
+def test_feed_pages_through_max_files(client):
+    for n in (1, 2, 3):
+        flush(client, n)
+
+    first, cursor, _ = changes(client, max_files=2)
+    second, cursor, _ = changes(client, cursor, max_files=2)
+
+    assert (first, second) == ([isbn(1), isbn(2)], [isbn(3)])
+    assert changes(client, cursor)[0] == []
+
+
+def test_compaction_output_is_not_fed_again(client):
+    flush(client, 1)
+    flush(client, 2)
+    _, cursor, _ = changes(client)
+
+    client.post("/grizzly/v1/merge_parquet_files")
+
+    assert changes(client, cursor)[0] == []
+    assert changes(client)[0] == [
+        isbn(1),
+        isbn(2),
+    ]  # Replaced files are still delivered
+
+
+def test_invalid_cursor_is_refused(client):
+    _res = client.get(f"{BOOKS}/changes", params={"cursor": "not-a-cursor"})
+
+    assert _res.status_code == 400
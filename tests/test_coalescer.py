@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+from datetime import date
+
+from main import app
+from schemas.polars import book_hash
+from services.admission import AdmissionService
+from services.coalescer import IngestCoalescer
+from services.datasets import DatasetRegistry
+from services.index import IndexService
+from services.ingest import IngestService
+from tests.conftest import isbn
+
+
+def rows(n: int, pages=412) -> list[dict]:
+    return [
+        {
+            "isbn": isbn(n),
+            "description": "Dune",
+            "pages": pages,
+            "author": "Frank Herbert",
+            "pub_date": date(1965, 8, 1),
+            "pid": os.getpid(),
+            "hash": book_hash(f"{isbn(n)}{pages}Frank Herbert"),
+        }
+    ]
+
+
+def submit_together(client, *requests) -> list:
+    coalescer = IngestCoalescer()
+    coalescer.window_ms = 50
+
+    async def run():
+        results = await asyncio.gather(
+            *(coalescer.submit(app, r) for r in requests), return_exceptions=True
+        )
+        await asyncio.gather(*coalescer._tasks)
+        return results
+
+    return client.portal.call(run)
+
+
+def test_requests_are_appended_as_one_group(client):
+    results = submit_together(client, rows(1), rows(2), rows(3))
+
+    assert results == [None, None, None]
+    assert app.your_books_data.get_column("isbn").to_list() == [
+        isbn(1),
+        isbn(2),
+        isbn(3),
+    ]
+    assert IngestCoalescer().stats()["groups"] == 1
+
+
+def test_invalid_request_fails_alone(client):
+    results = submit_together(client, rows(1), rows(2, pages="many"), rows(3))
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], ValueError)
+    assert app.your_books_data.get_column("isbn").to_list() == [isbn(1), isbn(3)]
+    assert IngestCoalescer().stats()["rejected"] == 1
+
+
+def test_failed_index_write_is_logged(client, monkeypatch, caplog):
+    def fail(self, dataframe, **kwargs):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(IndexService, "swap_dataframe_to_sqlite", fail)
+
+    with caplog.at_level(logging.ERROR, logger="services.coalescer"):
+        results = submit_together(client, rows(1))
+
+    assert results == [None]
+    assert "index unavailable" in caplog.text
+
+
+def test_failed_flush_keeps_rows_buffered_and_indexes_them(client, monkeypatch, caplog):
+    async def fail(self, dataframe, path):
+        raise OSError("S3 unavailable")
+
+    indexed = []
+    monkeypatch.setattr(IngestService, "materialize", fail)
+    monkeypatch.setattr(
+        IndexService,
+        "swap_dataframe_to_sqlite",
+        lambda self, dataframe: indexed.append(dataframe),
+    )
+    DatasetRegistry().budget_mb = 0  # Every buffer is over its share
+
+    with caplog.at_level(logging.ERROR, logger="services.ingest"):
+        results = submit_together(client, rows(1), rows(2))
+
+    assert results == [None, None]  # A retry would buffer the rows twice
+    assert app.your_books_data.get_column("isbn").to_list() == [isbn(1), isbn(2)]
+    assert [df.height for df in indexed] == [2]
+    assert AdmissionService().stats()["pending_index_tasks"] == 0
+    assert "S3 unavailable" in caplog.text
@@ -0,0 +1,52 @@
+import polars as pl
+import pytest
+
+from config import settings as global_settings
+from schemas.polars import book_schema, to_book_schema, wide_book_schema
+from tests.conftest import book, isbn, row
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def wide(count: int) -> pl.DataFrame:
+    rows = [row(n, author=f"Author {n % 3}") for n in range(count)]
+    return pl.DataFrame(rows, schema=wide_book_schema())
+
+
+def test_hash_round_trips_through_the_compact_schema():
+    frame = wide(10)
+
+    compact = to_book_schema(frame, compact=True)
+    back = to_book_schema(compact, compact=False)
+
+    assert compact.schema == book_schema(compact=True)
+    assert compact.get_column("author").dtype == pl.Categorical
+    assert back.equals(frame)
+
+
+def test_compact_rows_are_smaller():
+    frame = wide(10_000)
+
+    assert to_book_schema(frame, compact=True).estimated_size() < frame.estimated_size()
+
+
+@pytest.fixture
+def compact(monkeypatch):
+    monkeypatch.setattr(global_settings, "compact_schema", True)
+
+
+def test_compact_buffer_is_queried_in_the_wide_schema(compact, client):
+    client.post("/grizzly/v1/ingest_data", json=[book(1, pages=100), book(2)])
+    client.post(f"{BOOKS}/flush")
+
+    rows = client.get(
+        "/grizzly/v1/filter_parquets",
+        params={"bucket": "daily", "file_name": "", "value": 10_000},
+    ).json()["data"]
+
+    schema = client.get("/grizzly/v1/datasets").json()["datasets"][0]["schema"]
+    assert schema["author"].startswith("Categorical") and schema["pages"] == "Int32"
+    assert sorted((r["isbn"], r["pages"]) for r in rows) == [
+        (isbn(1), 100),
+        (isbn(2), 412),
+    ]
@@ -0,0 +1,91 @@
+import asyncio
+
+import polars as pl
+
+from services.compaction import CompactionService
+from services.manifest import ManifestService
+from tests.conftest import book, isbn
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def flush(client, *numbers: int) -> str:
+    client.post("/grizzly/v1/ingest_data", json=[book(n) for n in numbers])
+    return client.post(f"{BOOKS}/flush").json()["message"]["path"]
+
+
+def query(client) -> list[str]:
+    rows = client.get(
+        "/grizzly/v1/filter_parquets",
+        params={"bucket": "daily", "file_name": "", "value": 10_000},
+    ).json()["data"]
+    return sorted(row["isbn"] for row in rows)
+
+
+def test_merge_swaps_small_files_for_one(client, storage):
+    paths = [flush(client, 1, 2), flush(client, 3), flush(client, 4)]
+
+    _res = client.post("/grizzly/v1/merge_parquet_files").json()["message"]
+
+    [merged] = _res["compacted"]
+    assert sorted(merged["inputs"]) == sorted(f"daily/{p}" for p in paths)
+    active = ManifestService().active_entries()
+    assert active.get_column("path").to_list() == [merged["path"]]
+    assert active.get_column("rows").to_list() == [4]
+    assert query(client) == [isbn(n) for n in (1, 2, 3, 4)]
+    # Kept for running readers
+    assert all((storage / "daily" / p).exists() for p in paths)
+
+
+def test_merge_drops_deleted_rows(client, storage):
+    flush(client, 1, 2)
+    flush(client, 3)
+    client.post("/grizzly/v1/books/delete", json={"isbns": [isbn(2)]})
+
+    [merged] = client.post("/grizzly/v1/merge_parquet_files").json()["message"][
+        "compacted"
+    ]
+
+    frame = pl.read_parquet(storage / merged["path"])
+    assert sorted(frame.get_column("isbn")) == [isbn(1), isbn(3)]
+    assert ManifestService().active_entries().get_column("rows").to_list() == [2]
+    assert query(client) == [isbn(1), isbn(3)]
+
+
+def test_replaced_files_are_purged_after_retention(client, storage):
+    paths = [flush(client, 1), flush(client, 2)]
+    compaction = CompactionService()
+    compaction.run_once(force=True)
+    compaction.retention_seconds = 0
+
+    _res = compaction.run_once()
+
+    assert sorted(_res["purged"]) == sorted(f"daily/{p}" for p in paths)
+    assert not any((storage / "daily" / p).exists() for p in paths)
+    _, frame = ManifestService().snapshot()
+    assert frame.height == 1
+    assert query(client) == [isbn(1), isbn(2)]
+
+
+def test_young_and_large_files_are_not_planned(client):
+    flush(client, 1)
+    flush(client, 2)
+    compaction = CompactionService()
+
+    assert compaction.plan() == []  # Younger than compaction_min_age_seconds
+    compaction.min_age_seconds = 0
+    assert len(compaction.plan()) == 1
+    compaction.small_file_bytes = 1
+    assert compaction.plan() == []
+
+
+def test_one_worker_runs_the_background_loop():
+    # The second instance bypasses the singleton, like another worker of the host
+    first, second = CompactionService(), type.__call__(CompactionService)
+
+    elected = first.elected(), second.elected(), first.elected()
+    asyncio.run(first.stop())
+
+    assert elected == (True, False, True)
+    assert second.elected()  # Took over from the stopped worker
+    asyncio.run(second.stop())
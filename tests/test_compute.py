@@ -0,0 +1,92 @@
+import io
+import threading
+
+import polars as pl
+import pytest
+
+from services.compute import (
+    ComputeExecutor,
+    build_frame,
+    build_frames,
+    frame_from_ipc,
+    merge_parquet,
+)
+from services.parquet import write_parquet
+from tests.conftest import book, isbn, row
+
+
+def parquet(rows: list[dict]) -> bytes:
+    buffer = io.BytesIO()
+    write_parquet(frame_from_ipc(build_frame(rows)), buffer)
+    return buffer.getvalue()
+
+
+def test_process_pool_builds_frames():
+    compute = ComputeExecutor()
+    compute.kind, compute.max_workers = "process", 1
+    try:
+        buffer = compute.submit(build_frame, [row(1), row(2)]).result(timeout=60)
+    finally:
+        compute.shutdown()
+
+    assert frame_from_ipc(buffer).get_column("isbn").to_list() == [isbn(1), isbn(2)]
+    assert compute.stats()["completed"] == 1
+
+
+def test_failed_tasks_are_counted():
+    compute = ComputeExecutor()
+
+    with pytest.raises(pl.exceptions.ComputeError):
+        compute.submit(build_frame, [{"pages": "many"}]).result()
+
+    assert compute.stats()["failed"] == 1
+
+
+def test_submit_races_with_shutdown():
+    compute = ComputeExecutor()
+    errors = []
+
+    def submit_many():
+        for _ in range(200):
+            try:
+                compute.submit(len, b"x")
+            except Exception as e:  # noqa: BLE001
+                errors.append(e)
+
+    threads = [threading.Thread(target=submit_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        compute.shutdown()
+    for thread in threads:
+        thread.join()
+    compute.shutdown()
+
+    assert errors == []
+    assert compute.stats()["in_flight"] == 0
+
+
+def test_build_frames_leaves_out_invalid_requests():
+    buffer, errors = build_frames([[row(1)], [{"pages": "many"}], [row(2)]])
+
+    assert frame_from_ipc(buffer).height == 2
+    assert errors[0] is None and errors[2] is None
+    assert errors[1].startswith("Invalid rows")
+
+
+def test_merge_parquet_keeps_the_version_of_every_file():
+    merged = merge_parquet(
+        [parquet([row(1)]), parquet([row(2), row(3)])], versions=[4, 7]
+    )
+
+    frame = pl.read_parquet(io.BytesIO(merged))
+    assert frame.get_column("source_version").to_list() == [4, 7, 7]
+
+
+def test_compute_stats_endpoint(client):
+    client.post("/grizzly/v1/ingest_data", json=[book(1)])
+
+    _res = client.get("/grizzly/v1/compute_stats").json()
+
+    assert _res["executor"] == "thread"
+    assert _res["completed"] >= 1
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from config import DatasetSettings
+from config import settings as global_settings
+from main import app
+from services.datasets import DatasetRegistry, _configured, fair_shares, parse_schema
+from services.manifest import ManifestService
+from tests.conftest import book
+
+SENSORS = "/grizzly/v1/datasets/sensors"
+
+
+@pytest.fixture
+def sensors(monkeypatch):
+    columns = {"ts": "Datetime", "sensor": "String", "value": "Float64"}
+    monkeypatch.setattr(
+        global_settings, "datasets", {"sensors": DatasetSettings(columns=columns)}
+    )
+    yield
+    if hasattr(app, "sensors"):
+        delattr(app, "sensors")  # The next registry no longer knows about it
+
+
+def ndjson(*rows: dict) -> bytes:
+    return "\n".join(json.dumps(r) for r in rows).encode()
+
+
+def reading(n: int) -> dict:
+    return {"ts": f"2026-01-01T00:00:{n:02d}", "sensor": f"s{n % 2}", "value": n / 2}
+
+
+def test_fair_shares_keep_small_buffers_whole():
+    shares = fair_shares({"a": 10, "b": 200, "c": 300}, budget=250)
+
+    assert shares == {"a": 10, "b": 120, "c": 120}
+    assert fair_shares({"a": 10, "b": 20}, budget=100) == {"a": 10, "b": 20}
+
+
+def test_invalid_datasets_are_refused(monkeypatch):
+    with pytest.raises(ValueError, match="unknown Polars dtype"):
+        parse_schema({"value": "Float128"})
+
+    spec = DatasetSettings(columns={"value": "Float64"}, prefix="20260101")
+    monkeypatch.setattr(global_settings, "datasets", {"dated": spec})
+    with pytest.raises(ValueError, match="prefix"):
+        _configured()
+
+
+def test_dataset_rows_go_to_their_own_prefix(sensors, client):
+    _res = client.post(
+        f"{SENSORS}/ingest", content=ndjson(reading(1), reading(2))
+    ).json()
+    client.post("/grizzly/v1/ingest_data", json=[book(1)])
+    flushed = client.post(f"{SENSORS}/flush").json()["message"]
+
+    rows = client.get(f"{SENSORS}/query").json()
+
+    assert (_res["dataset"], _res["rows"]) == ("sensors", 2)
+    assert flushed["path"].startswith("sensors/")
+    assert ManifestService().active_files(dataset="sensors") == [
+        f"daily/{flushed['path']}"
+    ]
+    assert ManifestService().active_files() == []  # The books buffer was not flushed
+    assert [(r["sensor"], r["value"]) for r in rows["data"]] == [
+        ("s1", 0.5),
+        ("s0", 1.0),
+    ]
+    assert rows["metadata"]["columns"] == ["ts", "sensor", "value"]
+
+
+def test_dataset_endpoints_refuse_bad_requests(sensors, client):
+    books = client.post(
+        "/grizzly/v1/datasets/your_books_data/ingest", content=ndjson(book(1))
+    )
+    unknown = client.post(
+        "/grizzly/v1/datasets/unknown/ingest", content=ndjson(reading(1))
+    )
+    invalid = client.post(f"{SENSORS}/ingest", content=b'{"value": "high"}')
+
+    assert (books.status_code, unknown.status_code, invalid.status_code) == (
+        400,
+        404,
+        422,
+    )
+
+
+def test_buffers_above_their_share_are_flushed(sensors, client):
+    registry = DatasetRegistry()
+    client.post("/grizzly/v1/ingest_data", json=[book(n) for n in range(50)])
+    registry.budget_mb = registry.buffer_mb(app) * 4
+
+    client.post(
+        f"{SENSORS}/ingest", content=ndjson(*[reading(n % 60) for n in range(5_000)])
+    )
+
+    stats = {
+        d["name"]: d for d in client.get("/grizzly/v1/datasets").json()["datasets"]
+    }
+    assert stats["sensors"]["rows"] == 0  # Flushed, it went over its share
+    assert stats["your_books_data"]["rows"] == 50  # Within its share, kept
+    assert len(ManifestService().active_files(dataset="sensors")) == 1
+    assert stats["sensors"]["schema"]["value"] == "Float64"
@@ -0,0 +1,81 @@
+import httpx
+import polars as pl
+
+from main import app
+from schemas.pydantic import FanoutQuery
+from services.fanout import FanoutService, split_shards
+from tests.conftest import book, isbn
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def flush(client, *books: dict) -> str:
+    client.post("/grizzly/v1/ingest_data", json=list(books))
+    return client.post(f"{BOOKS}/flush").json()["message"]["path"]
+
+
+def three_files(client) -> None:
+    flush(client, book(1, pages=100), book(2, author="Ursula K. Le Guin", pages=300))
+    flush(client, book(3, pages=200))
+    flush(client, book(4, author="Ursula K. Le Guin", pages=500))
+
+
+def test_shards_have_similar_sizes():
+    entries = pl.DataFrame({"path": list("abcde"), "bytes": [50, 40, 30, 20, 10]})
+
+    shards = split_shards(entries, 2)
+
+    assert shards == [["a", "d", "e"], ["b", "c"]]
+    assert split_shards(entries.head(1), 4) == [["a"]]
+
+
+def test_filter_rows_come_from_every_shard(client):
+    three_files(client)
+    FanoutService().local_shards = 2
+
+    _res = client.post("/grizzly/v1/fanout_query", json={"max_pages": 400}).json()
+
+    assert sorted(r["isbn"] for r in _res["data"]) == [isbn(1), isbn(2), isbn(3)]
+    assert _res["metadata"]["files"] == 2  # The 500 pages file is pruned by its stats
+    assert [s["target"] for s in _res["metadata"]["shards"]] == ["local", "local"]
+
+
+def test_partial_aggregates_are_merged(client):
+    three_files(client)
+    client.post("/grizzly/v1/books/delete", json={"isbns": [isbn(3)]})
+    FanoutService().local_shards = 3
+
+    _res = client.post("/grizzly/v1/fanout_query", json={"group_by": ["author"]}).json()
+
+    # author, count, pages_sum, pages_min, pages_max, pages_mean
+    assert pl.DataFrame(_res["data"]).rows() == [
+        ("Frank Herbert", 1, 100, 100, 100, 100.0),
+        ("Ursula K. Le Guin", 2, 800, 300, 500, 400.0),
+    ]
+
+
+def test_peer_shards_run_over_http_and_fall_back_locally(client):
+    three_files(client)
+    fanout = FanoutService()
+    fanout.local_shards = 1
+    fanout.peers = ["http://peer/grizzly", "http://127.0.0.1:9/grizzly"]
+    # The first peer is this app, nothing listens on the second
+    fanout._client = httpx.AsyncClient(
+        mounts={"http://peer": httpx.ASGITransport(app=app)}
+    )
+
+    _res = client.portal.call(fanout.query, FanoutQuery(group_by=["author"]))
+
+    shards = {s["target"]: s for s in _res["metadata"]["shards"]}
+    assert shards["http://peer/grizzly"]["fallback"] is False
+    assert shards["http://127.0.0.1:9/grizzly"]["fallback"] is True
+    assert sum(r["count"] for r in _res["data"]) == 4
+
+
+def test_shard_of_purged_files_is_not_found(client):
+    _res = client.post(
+        "/grizzly/v1/fanout_shard",
+        json={"paths": ["daily/gone.parquet"], "query": {}},
+    )
+
+    assert _res.status_code == 404
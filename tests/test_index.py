@@ -0,0 +1,86 @@
+import asyncio
+from datetime import date
+
+import polars as pl
+import pytest
+
+from services.coalescer import IngestCoalescer
+from services.index import IndexService, parquet_id
+from services.partitions import PartitionService
+from tests.conftest import book
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def test_partitioned_index_is_written_at_flush(client, monkeypatch):
+    writes, swaps = [], []
+    monkeypatch.setattr(PartitionService(), "enabled", True)
+    monkeypatch.setattr(
+        IndexService,
+        "write_index",
+        lambda self, df, url: writes.append((df.height, url)),
+    )
+    monkeypatch.setattr(
+        IndexService,
+        "swap_dataframe_to_sqlite",
+        lambda self, dataframe, **kw: swaps.append(dataframe),
+    )
+
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])
+    assert writes == []
+    _res = client.post(f"{BOOKS}/flush").json()["message"]
+
+    assert writes == [(2, f"s3://daily/{_res['path']}")]
+    assert swaps == []
+
+
+def test_sqlite_index_is_written_on_append(client, monkeypatch):
+    swaps = []
+    monkeypatch.setattr(
+        IndexService,
+        "swap_dataframe_to_sqlite",
+        lambda self, dataframe, **kw: swaps.append(dataframe),
+    )
+
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])
+    # Index after the response
+    client.portal.call(asyncio.gather, *IngestCoalescer()._tasks)
+
+    assert sum(df.height for df in swaps) == 2
+
+
+def test_parquet_id_is_derived_from_the_url():
+    assert parquet_id("s3://daily/a.parquet") == parquet_id("s3://daily/a.parquet")
+    assert parquet_id("s3://daily/a.parquet") != parquet_id("s3://daily/b.parquet")
+    assert -(2**63) <= parquet_id("s3://daily/a.parquet") < 2**63
+
+
+def test_pub_date_partitions_start_above_the_legacy_partition(monkeypatch):
+    created = []
+    # Bypasses the singleton for another configuration
+    partitions = type.__call__(PartitionService, key="pub_date", interval="year")
+    partitions._floor = ("books_index_legacy", date(2026, 10, 19))
+    monkeypatch.setattr(
+        PartitionService, "_create", lambda self, *args: created.append(args)
+    )
+    rows = pl.DataFrame(
+        {"pub_date": [date(1965, 8, 1), date(2026, 11, 1), date(2027, 2, 2)]}
+    )
+
+    starts = rows.select(partitions.partition_start()).to_series().to_list()
+
+    assert partitions.ensure(starts) == [
+        "books_index_legacy",
+        "books_index_p2026",
+        "books_index_p2027",
+    ]
+    assert created == [
+        ("books_index_p2026", date(2026, 10, 19), date(2027, 1, 1)),
+        ("books_index_p2027", date(2027, 1, 1), date(2028, 1, 1)),
+    ]
+    assert partitions.drop_expired(date(2100, 1, 1)) == []  # Old books are not old rows
+
+
+def test_pub_date_partitions_are_yearly():
+    with pytest.raises(ValueError, match="year"):
+        type.__call__(PartitionService, key="pub_date", interval="day")
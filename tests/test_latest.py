@@ -0,0 +1,108 @@
+import threading
+import time
+
+import polars as pl
+
+from services.compaction import CompactionService
+from services.latest import LatestViewService
+from services.manifest import ManifestService
+from tests.conftest import book, isbn
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def ingest(client, *books) -> dict:
+    client.post("/grizzly/v1/ingest_data", json=list(books))
+    _res = client.post(f"{BOOKS}/flush").json()["message"]
+    LatestViewService().refresh()  # Do not wait for the background refresher
+    return _res
+
+
+def latest_pages(client, n: int) -> int | None:
+    _res = client.get(f"/grizzly/v1/books/latest/{isbn(n)}")
+    return _res.json()["data"]["pages"] if _res.status_code == 200 else None
+
+
+def test_flush_keeps_the_newest_record(client):
+    ingest(client, book(1, pages=100), book(2))
+    ingest(client, book(1, pages=200))
+
+    assert latest_pages(client, 1) == 200
+    assert latest_pages(client, 2) == 412
+    assert latest_pages(client, 3) is None
+
+
+def test_delete_drops_the_record(client):
+    ingest(client, book(1), book(2))
+
+    client.post("/grizzly/v1/books/delete", json={"isbns": [isbn(1)]})
+    LatestViewService().refresh()
+
+    assert latest_pages(client, 1) is None
+    assert latest_pages(client, 2) == 412
+
+
+def test_rebuild_orders_compacted_rows_by_their_source_version(client):
+    ingest(client, book(1, pages=100), book(2))
+    ingest(client, book(1, pages=200))
+    entries = ManifestService().active_entries()
+    oldest = entries.filter(pl.col("version") == entries.get_column("version").min())
+
+    CompactionService().compact_group(oldest)  # Its old rows get a newer file version
+    client.post("/grizzly/v1/books/latest/rebuild")
+
+    assert latest_pages(client, 1) == 200
+    assert latest_pages(client, 2) == 412
+
+
+def test_compacted_files_scan_without_source_versions(client):
+    ingest(client, book(1))
+    ingest(client, book(2))
+    CompactionService().compact_group(ManifestService().active_entries())
+
+    _res = client.get("/grizzly/v1/search", params={"q": "Herbert"}).json()
+
+    assert len(ManifestService().active_entries()) == 1
+    assert {r["isbn"] for r in _res["data"]} == {isbn(1), isbn(2)}
+    assert all("source_version" not in r for r in _res["data"])
+
+
+def test_scan_pages_through_isbns(client):
+    ingest(client, *(book(n) for n in range(1, 6)))
+
+    first = client.get("/grizzly/v1/books/latest", params={"limit": 3}).json()
+    rest = client.get(
+        "/grizzly/v1/books/latest", params={"limit": 3, "after": first["next"]}
+    ).json()
+
+    assert [r["isbn"] for r in first["data"] + rest["data"]] == [
+        isbn(n) for n in range(1, 6)
+    ]
+    assert rest["next"] is None
+    assert LatestViewService().stats()["rows"] == 5
+
+
+def test_flushes_do_not_wait_for_the_refresher(client, monkeypatch):
+    release, folded = threading.Event(), []
+    refresh = LatestViewService.refresh
+
+    def blocked(self, frames=None):
+        release.wait(10)
+        folded.append(len(frames or {}))
+        return refresh(self, frames)
+
+    monkeypatch.setattr(LatestViewService, "refresh", blocked)
+    for n in range(1, 4):
+        client.post("/grizzly/v1/ingest_data", json=[book(n)])
+        assert client.post(f"{BOOKS}/flush").status_code == 200
+    release.set()
+
+    deadline = time.monotonic() + 10
+    while (
+        LatestViewService().state().source_version < ManifestService().latest_version()
+    ):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    # Flushes queued meanwhile fold together
+    assert sum(folded) == 3 and len(folded) < 3
+    assert latest_pages(client, 3) == 412
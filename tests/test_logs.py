@@ -0,0 +1,95 @@
+import io
+import json
+import logging
+import logging.config
+import sys
+from pathlib import Path
+
+import pytest
+
+from services import logs
+from services.logs import (
+    JsonFormatter,
+    RateLimitFilter,
+    RecordQueueHandler,
+    stop_listeners,
+)
+
+CONFIG = Path(__file__).resolve().parent.parent / "logging-granian.json"
+LOGGERS = ("", "_granian", "granian.access", "sqlalchemy.engine.Engine")
+
+
+def record(
+    name="app", level=logging.INFO, msg="hello %s", args=("world",), exc_info=None
+):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, exc_info)
+
+
+def test_queued_record_keeps_fields_and_traceback_apart():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        failed = record(level=logging.ERROR, exc_info=sys.exc_info())
+    access = record("granian.access", msg="%(method)s", args=({"method": "GET"},))
+
+    queued = [RecordQueueHandler(None).prepare(r) for r in (failed, access)]
+    lines = [json.loads(JsonFormatter().format(r)) for r in queued]
+
+    assert lines[0]["msg"] == "hello world" and lines[0]["level"] == "ERROR"
+    assert (
+        lines[0]["exc"].endswith("ValueError: boom") and "Traceback" in lines[0]["exc"]
+    )
+    assert (lines[1]["msg"], lines[1]["fields"]) == ("GET", {"method": "GET"})
+    assert queued[0].exc_info is None and queued[1].args is None
+
+
+def test_rate_limit_drops_info_and_reports_the_count(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(logs.time, "monotonic", lambda: now[0])
+    limit = RateLimitFilter({"granian": 2}, burst_seconds=1)
+
+    passed = [limit.filter(record("granian.access")) for _ in range(5)]
+    warning = limit.filter(record("granian.access", level=logging.WARNING))
+    other = limit.filter(record("app"))
+    now[0] = 1.0
+    after = record("granian.access")
+
+    assert passed == [True, True, False, False, False]
+    assert warning and other
+    assert limit.filter(after) and after.dropped == 3
+    assert not hasattr(record("granian.access"), "dropped")
+
+
+@pytest.fixture
+def production_logging(monkeypatch):
+    saved = {
+        name: (logger.handlers[:], logger.level, logger.propagate)
+        for name in LOGGERS
+        for logger in [logging.getLogger(name)]
+    }
+    stderr = io.StringIO()
+    monkeypatch.setattr(sys, "stderr", stderr)
+    logging.config.dictConfig(json.loads(CONFIG.read_text()))
+    yield stderr
+    stop_listeners()
+    for name, (handlers, level, propagate) in saved.items():
+        logger = logging.getLogger(name)
+        logger.handlers[:], logger.level, logger.propagate = handlers, level, propagate
+
+
+def test_production_config_writes_json_lines_from_a_listener(production_logging):
+    logging.getLogger("services.test").info("ingested %d books", 3)
+    for n in range(1_000):
+        logging.getLogger("granian.access").info("request %d", n)
+    # Below its ERROR level
+    logging.getLogger("sqlalchemy.engine.Engine").info("SELECT 1")
+    stop_listeners()  # Drains the queue
+
+    lines = [json.loads(line) for line in production_logging.getvalue().splitlines()]
+
+    assert (
+        lines[0]["logger"] == "services.test" and lines[0]["msg"] == "ingested 3 books"
+    )
+    access = [line for line in lines if line["logger"] == "granian.access"]
+    assert 0 < len(access) < 1_000  # Rate limited to 200/s with a 2 s burst
+    assert all(line["logger"] != "sqlalchemy.engine.Engine" for line in lines)
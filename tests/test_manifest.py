@@ -0,0 +1,141 @@
+import io
+
+import polars as pl
+import pytest
+
+from services.manifest import ManifestService, ManifestStaleError
+from services.s3 import S3Service
+from services.utlis import SingletonMetaNoArgs
+
+
+def entry(n: int) -> dict:
+    return {"path": f"20261019/books_{n}.parquet", "rows": n, "bytes": 100 * n}
+
+
+def worker() -> ManifestService:
+    """
+    A manifest service of another worker process, with its own cache.
+    """
+    return super(SingletonMetaNoArgs, ManifestService).__call__()
+
+
+def objects(storage) -> list[str]:
+    return sorted(p.name for p in (storage / "daily" / "_manifest").iterdir())
+
+
+def active(manifest: ManifestService) -> list[str]:
+    return sorted(manifest.active_entries().get_column("path"))
+
+
+def test_commits_write_deltas_and_checkpoints(storage):
+    manifest = ManifestService()
+    manifest.checkpoint_interval = 3
+
+    for n in range(1, 5):
+        manifest.commit(add=[entry(n)])
+
+    assert objects(storage) == [
+        "_latest",
+        "delta_0000000001.parquet",
+        "delta_0000000002.parquet",
+        "delta_0000000003.parquet",
+        "delta_0000000004.parquet",
+        "snapshot_0000000003.parquet",
+    ]
+    assert (storage / "daily" / "_manifest" / "_latest").read_text() == "4 3"
+    delta = pl.read_parquet(
+        storage / "daily" / "_manifest" / "delta_0000000004.parquet"
+    )
+    assert delta.get_column("path").to_list() == [entry(4)["path"]]
+
+
+def test_other_workers_replay_checkpoint_and_deltas(storage):
+    writer = ManifestService()
+    writer.checkpoint_interval = 2
+    for n in range(1, 4):
+        writer.commit(add=[entry(n)])
+    writer.commit(add=[entry(4)], remove=[entry(1)["path"]])
+    writer.commit(purge=[entry(1)["path"]])
+
+    reader = worker()
+
+    assert reader.latest_version() == 5
+    assert active(reader) == active(writer) == [entry(n)["path"] for n in (2, 3, 4)]
+    assert reader.snapshot()[1].height == 3
+
+
+def test_snapshot_is_served_from_the_cache(storage, monkeypatch):
+    manifest = ManifestService()
+    manifest.commit(add=[entry(1)])
+    manifest.latest_version()
+    reads = []
+    read_bytes = S3Service.read_bytes
+    monkeypatch.setattr(
+        S3Service,
+        "read_bytes",
+        lambda self, path: reads.append(path) or read_bytes(self, path),
+    )
+
+    for _ in range(10):
+        version, frame = manifest.snapshot()
+
+    assert (version, frame.height) == (1, 1)
+    assert reads == []
+
+
+def test_legacy_pointer_reads_full_snapshots(storage):
+    prefix = storage / "daily" / "_manifest"
+    prefix.mkdir()
+    manifest = ManifestService()
+    for version in (1, 2):
+        buffer = io.BytesIO()
+        pl.DataFrame(
+            [{**entry(n), "status": "active"} for n in range(1, version + 1)]
+        ).write_parquet(buffer)
+        (prefix / f"snapshot_{version:010}.parquet").write_bytes(buffer.getvalue())
+    (prefix / "_latest").write_text("1")  # The pointer lagged the last snapshot
+
+    assert manifest.latest_version() == 2
+    manifest.commit(add=[entry(3)])
+
+    assert (prefix / "_latest").read_text() == "3 2"
+    assert active(manifest) == [entry(n)["path"] for n in (1, 2, 3)]
+
+
+def test_conflicting_commit_retries_on_the_winner(storage):
+    manifest = ManifestService()
+    manifest.commit(add=[entry(1)])
+    other = worker()
+    other.latest_version()
+    manifest.commit(add=[entry(2)])
+
+    version = other.commit(add=[entry(3)])  # Planned on version 1, retried on 2
+
+    assert version == 3
+    assert active(other) == [entry(n)["path"] for n in (1, 2, 3)]
+
+
+def test_removing_an_inactive_file_is_stale(storage):
+    manifest = ManifestService()
+    manifest.commit(add=[entry(1)])
+    manifest.commit(remove=[entry(1)["path"]])
+
+    with pytest.raises(ManifestStaleError):
+        manifest.commit(remove=[entry(1)["path"]])
+
+
+def test_old_versions_are_expired(storage):
+    manifest = ManifestService()
+    manifest.checkpoint_interval = 2
+    manifest.keep_snapshots = 1
+    for n in range(1, 9):
+        manifest.commit(add=[entry(n)])
+
+    names = objects(storage)
+
+    assert "delta_0000000001.parquet" not in names
+    assert "snapshot_0000000002.parquet" not in names
+    assert {"delta_0000000004.parquet", "snapshot_0000000004.parquet"} <= set(names)
+    fresh = worker()
+    assert fresh.latest_version() == 8
+    assert len(active(fresh)) == 8
@@ -0,0 +1,118 @@
+import asyncio
+import fcntl
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+from main import app
+from services.compute import build_frame, frame_from_ipc
+from services.manifest import ManifestService
+from services.rollover import RolloverService, today
+from services.storage import S3fsBackend
+from tests.conftest import ROOT, book, isbn, row
+
+YESTERDAY = "20000101"
+
+
+def run_once(client) -> dict:
+    return client.portal.call(RolloverService().run_once, app)
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_day_change_seals_the_buffer(client, storage):
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])
+    app.now = YESTERDAY
+
+    [sealed] = run_once(client)["sealed"]
+
+    assert app.now == today()
+    assert sealed["path"].startswith(f"{YESTERDAY}/") and sealed["rows"] == 2
+    assert ManifestService().active_files() == [f"daily/{sealed['path']}"]
+    assert run_once(client)["sealed"] == []
+
+
+def test_index_files_of_past_days_are_shipped(client, storage):
+    names = [
+        f"{YESTERDAY}_1.sqlite",
+        f"{YESTERDAY}_1.sqlite-wal",
+        f"{YESTERDAY}_1.sqlite-shm",
+    ]
+    for name in names:
+        (ROOT / name).write_bytes(b"index")
+    current = ROOT / f"{today()}_1.sqlite"
+    current.write_bytes(b"index")
+
+    shipped = run_once(client)["shipped"]
+
+    assert sorted(s["path"] for s in shipped) == [
+        f"daily/{YESTERDAY}/_index/{n}" for n in names[:2]
+    ]
+    assert not any((ROOT / name).exists() for name in names)
+    assert current.exists()
+    current.unlink()
+
+
+def test_daily_files_of_gone_workers_are_published(client, storage):
+    pid = dead_pid()
+    local = ROOT / f"daily_{pid}.parquet"
+    frame_from_ipc(build_frame([row(1), row(2)])).write_parquet(local)
+
+    [shipped] = run_once(client)["shipped"]
+
+    assert not local.exists()
+    [path] = ManifestService().active_files()
+    assert shipped["path"] == path and path.endswith(f"/daily_{pid}.parquet")
+    assert sorted(pl.read_parquet(storage / path).get_column("isbn")) == [
+        isbn(1),
+        isbn(2),
+    ]
+
+
+def test_files_locked_by_another_worker_are_skipped(client):
+    local = ROOT / f"{YESTERDAY}_1.sqlite"
+    local.write_bytes(b"index")
+
+    with open(local, "rb") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        assert run_once(client)["shipped"] == []  # flock locks are per open file
+
+    assert len(run_once(client)["shipped"]) == 1
+    assert not local.exists()
+
+
+def test_interrupted_multipart_upload_resumes(tmp_path):
+    calls = []
+
+    async def call_s3(method, **kwargs):
+        calls.append((method, kwargs.get("PartNumber")))
+        if method == "upload_part" and kwargs["PartNumber"] == 2 and len(calls) == 3:
+            raise ConnectionError("connection reset")
+        return {"UploadId": "u1", "ETag": f"e{kwargs.get('PartNumber')}"}
+
+    backend = S3fsBackend()
+    backend._afs = SimpleNamespace(_call_s3=call_s3)
+    local = tmp_path / "a.sqlite"
+    local.write_bytes(b"x" * 25)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(backend.upload_async(str(local), "daily/a.sqlite", 10))
+    _res = asyncio.run(backend.upload_async(str(local), "daily/a.sqlite", 10))
+
+    assert calls == [
+        ("create_multipart_upload", None),
+        ("upload_part", 1),
+        ("upload_part", 2),
+        ("upload_part", 2),
+        ("upload_part", 3),
+        ("complete_multipart_upload", None),
+    ]
+    assert _res == {"path": "daily/a.sqlite", "bytes": 25, "parts": 3}
+    assert not (tmp_path / "a.sqlite.upload").exists()
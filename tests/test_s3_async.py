@@ -0,0 +1,102 @@
+import asyncio
+import io
+import os
+from types import SimpleNamespace
+
+import polars as pl
+
+from services.compute import build_frame, frame_from_ipc
+from services.s3_async import S3AsyncService
+from services.storage import S3fsBackend
+from tests.conftest import isbn, row
+
+
+def parquet(*numbers: int) -> bytes:
+    buffer = io.BytesIO()
+    frame_from_ipc(build_frame([row(n) for n in numbers])).write_parquet(buffer)
+    return buffer.getvalue()
+
+
+def test_object_round_trip():
+    s3 = S3AsyncService()
+
+    async def round_trip():
+        await s3.write_bytes("tmp/a.parquet", parquet(1))
+        assert await s3.parquet_file_exists("tmp/a.parquet")
+        assert await s3.list_parquet_files("tmp") == ["tmp/a.parquet"]
+        frame = await s3.read_parquet_file("tmp/a.parquet")
+        await s3.delete_parquet_file("tmp/a.parquet")
+        assert not await s3.parquet_file_exists("tmp/a.parquet")
+        return frame
+
+    assert asyncio.run(round_trip()).get_column("isbn").to_list() == [isbn(1)]
+
+
+def test_materialize_and_merge():
+    s3 = S3AsyncService()
+    frame = frame_from_ipc(build_frame([row(1), row(2)]))
+
+    async def materialize_and_merge():
+        _res = await s3.materialize_dataframe(frame, "a.parquet")
+        await s3.write_bytes("daily/b.parquet", parquet(3))
+        return _res, await s3.merge_parquet_files("daily")
+
+    _res, merged = asyncio.run(materialize_and_merge())
+
+    assert (_res["path"], _res["rows"]) == ("a.parquet", 2) and _res["bytes"] > 0
+    assert sorted(merged.get_column("isbn")) == [isbn(1), isbn(2), isbn(3)]
+
+
+def test_upload_and_download(tmp_path):
+    local = tmp_path / "a.parquet"
+    local.write_bytes(parquet(1, 2))
+    s3 = S3AsyncService()
+
+    async def upload_and_download():
+        _res = await s3.upload_file(str(local), "tmp/a.parquet", 5 * 1024**2)
+        await s3.get_file("tmp/a.parquet", str(tmp_path / "b.parquet"))
+        return _res
+
+    _res = asyncio.run(upload_and_download())
+
+    assert _res == {
+        "path": "tmp/a.parquet",
+        "bytes": os.path.getsize(local),
+        "parts": 1,
+    }
+    assert pl.read_parquet(tmp_path / "b.parquet").height == 2
+
+
+def test_s3fs_session_is_opened_once():
+    calls = []
+
+    async def set_session():
+        calls.append("open")
+        return SimpleNamespace(close=close)
+
+    async def close():
+        calls.append("close")
+
+    backend = S3fsBackend()
+    backend._afs = SimpleNamespace(set_session=set_session)
+
+    async def lifespan():
+        await backend.start()
+        await backend.start()  # A second start reuses the session
+        await backend.close()
+        await backend.close()
+
+    asyncio.run(lifespan())
+
+    assert calls == ["open", "close"]
+
+
+def test_bucket_routes(client):
+    _res = client.post("/grizzly/v1/create_bucket/archive").json()
+    asyncio.run(S3AsyncService().write_bytes("archive/a.parquet", parquet(1)))
+
+    assert _res == {"status": "success", "bucket_name": "archive"}
+    assert "archive" in client.get("/grizzly/v1/list_buckets").json()["buckets"]
+    assert client.get("/grizzly/v1/list_files/archive").json()["files"] == [
+        "archive/a.parquet"
+    ]
@@ -0,0 +1,25 @@
+import polars as pl
+
+from services.manifest import ManifestService
+from tests.conftest import book, isbn
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def test_save_parquet_stays_out_of_the_books_catalog(client, storage):
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])
+
+    _res = client.post("/grizzly/v1/save_parquet")
+
+    assert _res.status_code == 200
+    path = _res.json()["message"]["path"]
+    assert path.startswith("_descriptions/")
+    assert pl.read_parquet(storage / "daily" / path).columns == ["description", "hash"]
+    assert ManifestService().active_entries().is_empty()
+
+    client.post(f"{BOOKS}/flush")
+    rows = client.get(
+        "/grizzly/v1/filter_parquets",
+        params={"bucket": "daily", "file_name": "", "value": 10_000},
+    ).json()["data"]
+    assert sorted(r["isbn"] for r in rows) == [isbn(1), isbn(2)]
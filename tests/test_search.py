@@ -0,0 +1,68 @@
+import polars as pl
+
+from services.manifest import ManifestService
+from tests.conftest import book, isbn
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def flush(client, *books: dict) -> str:
+    client.post("/grizzly/v1/ingest_data", json=list(books))
+    return client.post(f"{BOOKS}/flush").json()["message"]["path"]
+
+
+def search(client, q: str, **params) -> dict:
+    return client.get("/grizzly/v1/search", params={"q": q, **params}).json()
+
+
+def test_books_are_ranked_by_bm25(client):
+    flush(
+        client,
+        book(1, description="Sand, sand and sand worms"),
+        book(2, description="A desert planet with sand and spice and many more words"),
+        book(3, description="An ocean world"),
+    )
+
+    _res = search(client, "SAND worms")
+
+    assert [r["isbn"] for r in _res["data"]] == [isbn(1), isbn(2)]
+    assert _res["data"][0]["score"] > _res["data"][1]["score"] > 0
+    assert _res["data"][0]["description"] == "Sand, sand and sand worms"
+    assert (sorted(_res["metadata"]["tokens"]), _res["metadata"]["docs"]) == (
+        ["sand", "worms"],
+        3,
+    )
+
+
+def test_only_files_with_top_hits_are_read(client):
+    flush(client, book(1, description="sand worms"), book(2, description="spice"))
+    flush(client, book(3, description="ocean"))
+
+    _res = search(client, "ocean", limit=1)
+
+    assert [r["isbn"] for r in _res["data"]] == [isbn(3)]
+    assert _res["metadata"]["files"] == 1
+    assert search(client, "unknown")["data"] == []
+
+
+def test_deleted_hits_are_replaced_by_the_next_ones(client):
+    flush(client, *[book(n, description="sand " * (5 - n)) for n in (1, 2, 3)])
+    client.post("/grizzly/v1/books/delete", json={"isbns": [isbn(1)]})
+
+    _res = search(client, "sand", limit=2)
+
+    assert [r["isbn"] for r in _res["data"]] == [isbn(2), isbn(3)]
+
+
+def test_compaction_merges_the_segments(client, storage):
+    flush(client, book(1, description="sand worms"))
+    flush(client, book(2, description="sand"))
+    before = search(client, "sand")
+
+    client.post("/grizzly/v1/merge_parquet_files")
+
+    [entry] = ManifestService().active_entries().to_dicts()
+    assert (entry["search_docs"], entry["search_length"]) == (2, 3)
+    segment = pl.read_parquet(storage / entry["search_segment"])
+    assert sorted(segment.get_column("token")) == ["sand", "sand", "worms"]
+    assert search(client, "sand")["data"] == before["data"]
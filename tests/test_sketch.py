@@ -0,0 +1,66 @@
+import polars as pl
+import pytest
+
+from services.sketch import HyperLogLog
+from tests.conftest import book
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def test_estimate_is_close_to_the_exact_count():
+    values = pl.Series([f"isbn-{n}" for n in range(100_000)])
+
+    sketch = HyperLogLog.from_series(pl.concat([values, values]))
+
+    assert sketch.count() == pytest.approx(100_000, rel=0.05)
+    assert HyperLogLog.from_series(values.head(100)).count() == pytest.approx(
+        100, abs=2
+    )
+
+
+def test_merged_sketches_count_the_union():
+    first = HyperLogLog.from_series(pl.Series([f"isbn-{n}" for n in range(6_000)]))
+    second = HyperLogLog.from_series(
+        pl.Series([f"isbn-{n}" for n in range(4_000, 10_000)])
+    )
+
+    merged = HyperLogLog.union([first.to_bytes(), None, second.to_bytes()])
+
+    assert merged.count() == pytest.approx(10_000, rel=0.05)
+    assert HyperLogLog.union([None]) is None
+    with pytest.raises(ValueError, match="precision"):
+        first.merge(HyperLogLog(precision=10))
+
+
+def test_categorical_values_hash_like_strings():
+    authors = pl.Series(["Frank Herbert", "Ursula K. Le Guin", None, "Frank Herbert"])
+
+    wide = HyperLogLog.from_series(authors)
+    compact = HyperLogLog.from_series(authors.cast(pl.Categorical))
+
+    assert wide.to_bytes() == compact.to_bytes()
+    assert wide.count() == 2
+
+
+def test_day_stats_merge_flushed_files_and_the_buffer(client):
+    client.post(
+        "/grizzly/v1/ingest_data",
+        json=[book(1), book(2, author="Ursula K. Le Guin", pub_date="1969-03-01")],
+    )
+    client.post(f"{BOOKS}/flush")
+    client.post(
+        "/grizzly/v1/ingest_data", json=[book(2), book(3, pub_date="1970-01-01")]
+    )
+
+    _res = client.get("/grizzly/v1/current_stats").json()
+
+    worker, day = _res["worker"], _res["day"]
+    assert (worker["rows"], worker["distinct_isbn"], worker["distinct_author"]) == (
+        2,
+        2,
+        1,
+    )
+    assert worker["min_pub_date"] == "1965-08-01"
+    assert (day["files"], day["rows"]) == (1, 4)
+    assert (day["distinct_isbn"], day["distinct_author"]) == (3, 2)
+    assert (day["min_pub_date"], day["max_pub_date"]) == ("1965-08-01", "1970-01-01")
@@ -0,0 +1,72 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+from services import spill as spill_module
+from services.compute import build_frame, frame_from_ipc
+from services.manifest import ManifestService
+from services.spill import SpillService
+from tests.conftest import book, isbn, row
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+@pytest.fixture
+def spill():
+    spill = SpillService()
+    spill.min_chunk_mb = 0
+    return spill
+
+
+def published(storage) -> list[str]:
+    [path] = ManifestService().active_files()
+    return pl.read_parquet(storage / path).get_column("isbn").to_list()
+
+
+def test_buffer_over_the_soft_limit_spills_and_flushes_in_order(spill, client, storage):
+    spill.buffer_soft_limit_mb = 0
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])
+    client.post("/grizzly/v1/ingest_data", json=[book(3)])
+    spill.buffer_soft_limit_mb = 256
+    client.post("/grizzly/v1/ingest_data", json=[book(4)])  # Stays in memory
+
+    stats = client.get("/grizzly/v1/spill_stats").json()
+    current = client.get("/grizzly/v1/current_stats").json()["worker"]
+    assert (stats["spills"], stats["spilled_rows"]) == (2, 3)
+    assert stats["datasets"]["your_books_data"]["chunks"] == 2
+    assert len(list(Path(spill.directory).iterdir())) == 2
+    assert current["rows"] == 4
+
+    client.post(f"{BOOKS}/flush")
+
+    assert sorted(published(storage)) == [isbn(n) for n in (1, 2, 3, 4)]
+    assert not list(Path(spill.directory).iterdir())
+    stats = client.get("/grizzly/v1/spill_stats").json()
+    assert stats["reloads"] == 2 and stats["datasets"] == {}
+
+
+def test_resident_memory_over_the_soft_limit_spills(spill, client, monkeypatch):
+    spill.rss_soft_limit_mb = 1
+    monkeypatch.setattr(spill_module, "rss_mb", lambda: 2.0)
+
+    client.post("/grizzly/v1/ingest_data", json=[book(1)])
+
+    assert client.get("/grizzly/v1/spill_stats").json()["spilled_rows"] == 1
+
+
+def test_chunks_of_gone_workers_are_adopted(spill, client, storage):
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    orphan = Path(spill.directory, f"spill_{process.pid}_000000_your_books_data.arrow")
+    frame_from_ipc(build_frame([row(1), row(2)])).write_ipc(orphan)
+
+    assert spill.adopt() == 1
+    client.post("/grizzly/v1/ingest_data", json=[book(3)])
+    client.post(f"{BOOKS}/flush")
+
+    assert sorted(published(storage)) == [isbn(1), isbn(2), isbn(3)]
+    assert not orphan.exists()
+    assert client.get("/grizzly/v1/spill_stats").json()["adopted"] == 1
@@ -0,0 +1,19 @@
+import statistics
+
+from benchmarks.startup import LAZY_MODULES, import_once
+
+BUDGET_MS = 2000
+
+
+def test_heavy_packages_are_not_imported_at_startup():
+    _, _, imported = import_once()
+
+    assert {"polars", "pyarrow", "s3fs", "sqlalchemy"} <= set(LAZY_MODULES)
+    assert sorted(imported & set(LAZY_MODULES)) == []
+
+
+def test_main_imports_within_budget():
+    import_once()  # Warm the bytecode cache
+    wall = statistics.median(import_once()[0] for _ in range(3))
+
+    assert wall < BUDGET_MS
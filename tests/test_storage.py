@@ -0,0 +1,48 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.storage import LocalBackend, ObstoreBackend, S3fsBackend
+
+
+def overwriting_put(put):
+    def _put(self, path: str, data: bytes, exclusive: bool = False) -> None:
+        put(self, path, data)  # An object store ignoring If-None-Match
+
+    return _put
+
+
+def test_exclusive_put_is_verified(storage):
+    LocalBackend().verify_exclusive_put("daily")
+
+    assert list((storage / "daily" / "_probe").iterdir()) == []
+
+
+def test_overwriting_store_fails_verification(storage, monkeypatch):
+    monkeypatch.setattr(LocalBackend, "put", overwriting_put(LocalBackend.put))
+
+    with pytest.raises(RuntimeError, match="overwrote"):
+        LocalBackend().verify_exclusive_put("daily")
+
+
+def test_overwriting_store_fails_startup(storage, monkeypatch):
+    monkeypatch.setattr(LocalBackend, "put", overwriting_put(LocalBackend.put))
+
+    with pytest.raises(RuntimeError, match="overwrote"), TestClient(app):
+        pass
+
+
+def test_obstore_buckets_go_through_s3fs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        S3fsBackend, "ls", lambda self, path: calls.append(("ls", path)) or ["daily"]
+    )
+    monkeypatch.setattr(
+        S3fsBackend, "mkdir", lambda self, bucket: calls.append(("mkdir", bucket))
+    )
+    backend = ObstoreBackend()
+
+    assert backend.ls("/") == ["daily"]
+    backend.mkdir("tmp")
+
+    assert calls == [("ls", "/"), ("mkdir", "tmp")]
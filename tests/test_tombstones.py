@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from schemas.polars import book_hash
+from services.spill import SpillService
+from tests.conftest import book, isbn
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def query(client) -> set[str]:
+    _res = client.get(
+        "/grizzly/v1/filter_parquets",
+        params={"bucket": "daily", "file_name": "", "value": 10_000},
+    )
+    assert _res.status_code == 200
+    return {row["isbn"] for row in _res.json()["data"]}
+
+
+def test_delete_hides_flushed_rows(client):
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])
+    client.post(f"{BOOKS}/flush")
+    assert query(client) == {isbn(1), isbn(2)}
+
+    _res = client.post("/grizzly/v1/books/delete", json={"isbns": [isbn(1)]})
+
+    assert _res.status_code == 200
+    assert query(client) == {isbn(2)}
+
+
+def test_delete_drops_buffered_rows(client):
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])
+
+    _res = client.post("/grizzly/v1/books/delete", json={"isbns": [isbn(1)]})
+    client.post(f"{BOOKS}/flush")
+
+    assert _res.json()["message"]["discarded"] == 1
+    assert query(client) == {isbn(2)}
+
+
+def test_delete_drops_spilled_rows(client):
+    spill = SpillService()
+    spill.min_chunk_mb = 0
+    spill.buffer_soft_limit_mb = 0
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])  # Spilled on append
+    spill.buffer_soft_limit_mb = 256
+    client.post("/grizzly/v1/ingest_data", json=[book(3)])
+    assert spill.stats()["datasets"]["your_books_data"]["rows"] == 2
+
+    _res = client.post("/grizzly/v1/books/delete", json={"isbns": [isbn(1), isbn(3)]})
+    client.post(f"{BOOKS}/flush")
+
+    assert _res.json()["message"]["discarded"] == 2
+    assert query(client) == {isbn(2)}
+    assert not list(Path(spill.directory).iterdir())
+
+
+def test_upsert_replaces_flushed_rows(client):
+    client.post("/grizzly/v1/ingest_data", json=[book(1, pages=100), book(2)])
+    client.post(f"{BOOKS}/flush")
+
+    _res = client.post("/grizzly/v1/books/upsert", json=[book(1, pages=200)])
+
+    assert _res.status_code == 200
+    rows = client.get(
+        "/grizzly/v1/filter_parquets",
+        params={"bucket": "daily", "file_name": "", "value": 10_000},
+    ).json()["data"]
+    assert sorted((r["isbn"], r["pages"]) for r in rows) == [
+        (isbn(1), 200),
+        (isbn(2), 412),
+    ]
+
+
+def test_delete_by_hash_matches_every_ingest_path(client):
+    key = isbn(1) + "412" + "Frank Herbert"
+    ndjson = json.dumps({**book(1), "description": "Dune"})
+    client.post("/grizzly/v1/ingest_data", json=[book(1), book(2)])
+    client.post("/grizzly/v1/ingest_ndjson", content=ndjson.encode())
+    client.post(f"{BOOKS}/flush")
+
+    client.post("/grizzly/v1/books/delete", json={"hashes": [book_hash(key)]})
+
+    assert query(client) == {isbn(2)}
+
+
+def test_book_hash_is_stable_across_processes():
+    key = isbn(1) + "412" + "Frank Herbert"
+    other = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"from schemas.polars import book_hash; print(book_hash({key!r}))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parents[1],
+        env={**os.environ, "PYTHONHASHSEED": "random"},
+    )
+    assert int(other.stdout) == book_hash(key)
@@ -0,0 +1,57 @@
+import io
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from config import ParquetWriteProfile
+from services.compute import build_frame, frame_from_ipc
+from services.parquet import read_write_profile, write_parquet
+from services.s3 import S3Service
+from tests.conftest import book, row
+
+BOOKS = "/grizzly/v1/datasets/your_books_data"
+
+
+def frame(count: int) -> pl.DataFrame:
+    return frame_from_ipc(build_frame([row(n, pages=count - n) for n in range(count)]))
+
+
+def test_profile_sets_codec_row_groups_and_order():
+    profile = ParquetWriteProfile(
+        compression="snappy", row_group_size=10, sort_by=["pages"]
+    )
+    buffer = io.BytesIO()
+
+    write_parquet(frame(25), buffer, profile)
+
+    metadata = pq.read_metadata(io.BytesIO(buffer.getvalue()))
+    assert metadata.num_row_groups == 3
+    assert metadata.row_group(0).column(0).compression == "SNAPPY"
+    assert pl.read_parquet(buffer).get_column("pages").is_sorted()
+
+
+def test_profile_without_statistics():
+    buffer = io.BytesIO()
+
+    write_parquet(frame(5), buffer, ParquetWriteProfile(statistics=False))
+
+    column = pq.read_metadata(io.BytesIO(buffer.getvalue())).row_group(0).column(0)
+    assert not column.is_stats_set
+
+
+def test_profile_is_recorded_in_the_footer():
+    profile = ParquetWriteProfile(compression="zstd", compression_level=7)
+    buffer = io.BytesIO()
+    write_parquet(frame(5), buffer, profile)
+
+    assert read_write_profile(io.BytesIO(buffer.getvalue())) == profile.model_dump()
+
+
+def test_flushed_files_carry_the_configured_profile(client):
+    client.post("/grizzly/v1/ingest_data", json=[book(1)])
+    path = client.post(f"{BOOKS}/flush").json()["message"]["path"]
+
+    recorded = S3Service().read_write_profile(f"daily/{path}")
+
+    assert recorded["compression"] == "zstd"
+    assert recorded["sort_by"] == ["pub_date", "isbn"]